@@ -0,0 +1,282 @@
+from typing import Dict, List, Optional, Tuple
+import re
+import json
+import time
+import random
+
+from pokemon_battle import (Pokemon, Move, Team, Battle, BattleMode, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM,
+                            TYPES_DATA, get_type_effectiveness)
+
+def load_abilities_data():
+    with open('src/collected-data/abilities_data.json', 'r') as f:
+        return json.load(f)
+
+ABILITIES_DATA = load_abilities_data()
+
+TYPE_NAMES = set(TYPES_DATA) | {"fairy"}
+
+STAT_NAMES = {
+    "attack": "attack",
+    "defense": "defense",
+    "special attack": "special_attack",
+    "special defense": "special_defense",
+    "speed": "speed",
+}
+
+# (pattern over short_effect, effect kind). Each kind takes the regex groups as parameters.
+EFFECT_PATTERNS = [
+    (r"strengthens (\w+) moves to inflict 1\.5× damage at 1/3 max hp or less", "pinch_type_power"),
+    (r"doubles attack in battle", "physical_power"),
+    (r"increases attack to 1\.5× with a major status ailment", "status_physical_power"),
+    (r"strengthens moves of (\d+) base power or less to 1\.5× their power", "low_power_boost"),
+    (r"doubles damage inflicted with not-very-effective moves", "resisted_boost"),
+    (r"(\w+) moves have 1\.5× power|powers up (\w+)-type moves", "type_power"),
+    (r"halves damage from ([\w ]+?) moves", "type_resist"),
+    (r"halves damage from (physical|special) (?:attacks|moves)", "class_resist"),
+    (r"decreases damage taken from super-effective moves by 1/4", "super_effective_resist"),
+    (r"halves damage taken from full hp", "full_hp_resist"),
+    (r"absorbs (\w+) moves, healing for 1/4 max hp|restores hp when hit by a (\w+)-type move", "absorb_heal"),
+    (r"absorbs (\w+) moves, raising ([\w ]+?) one stage", "absorb_boost"),
+    (r"protects against (\w+) moves|immune to (\w+)-type moves", "immune"),
+    (r"protects against damaging moves that are not super effective", "wonder_guard"),
+    (r"prevents being koed from full hp", "sturdy"),
+    (r"lowers opponents' ([\w ]+?) one stage upon entering battle", "switch_in_lower"),
+]
+_COMPILED_PATTERNS = [(re.compile(pattern), kind) for pattern, kind in EFFECT_PATTERNS]
+
+
+def _types_in(text: str) -> Tuple[str, ...]:
+    """Type names mentioned in a fragment such as "fire and ice"."""
+    return tuple(t for t in re.split(r",\s*|\s+", text.lower()) if t in TYPE_NAMES)
+
+
+def compile_ability(short_effect: str) -> List[tuple]:
+    """Turn an ability's short effect text into a list of (kind, params) effects."""
+    text = short_effect.lower()
+    effects = []
+    for pattern, kind in _COMPILED_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        groups = [g for g in match.groups() if g is not None]
+        if kind in ("pinch_type_power", "type_power", "type_resist", "immune", "absorb_heal"):
+            types = _types_in(groups[0])
+            if types:
+                effects.append((kind, types))
+        elif kind == "low_power_boost":
+            effects.append((kind, int(groups[0])))
+        elif kind == "class_resist":
+            effects.append((kind, groups[0]))
+        elif kind == "absorb_boost":
+            if groups[1] in STAT_NAMES and _types_in(groups[0]):
+                effects.append((kind, (_types_in(groups[0]), STAT_NAMES[groups[1]])))
+        elif kind == "switch_in_lower":
+            if groups[0] in STAT_NAMES:
+                effects.append((kind, STAT_NAMES[groups[0]]))
+        else:
+            effects.append((kind, None))
+    # "Halves damage from physical/special" is a class resist, not a type resist
+    if any(kind == "class_resist" for kind, _ in effects):
+        effects = [e for e in effects if e[0] != "type_resist"]
+    return effects
+
+
+def compile_abilities(abilities_data: dict) -> Dict[str, List[tuple]]:
+    """Compile every ability with a recognised effect; abilities without one are omitted."""
+    compiled = {}
+    for name, data in abilities_data.items():
+        if not data['effect_entries']:
+            continue
+        effects = compile_ability(data['effect_entries'][0]['short_effect'])
+        if effects:
+            compiled[name] = effects
+    return compiled
+
+# Built once per process from abilities_data.json
+ABILITY_EFFECTS = compile_abilities(ABILITIES_DATA)
+
+
+def _effectiveness(move: Move, defender: Pokemon) -> float:
+    effectiveness = 1.0
+    for defender_type in defender.types:
+        effectiveness *= get_type_effectiveness(move.type, defender_type)
+    return effectiveness
+
+
+class AbilityHooks:
+    """Ability dispatch table for one battle, bound from the Pokemon in play.
+
+    Only hooks for abilities that some Pokemon in the battle actually has are bound,
+    and the battle's calculate_damage/execute_move and the teams' switch-in hook are
+    only overridden when there is something to dispatch. A battle whose Pokemon have
+    no compiled abilities therefore runs the plain engine methods.
+    """
+
+    def __init__(self, battle: Battle):
+        self.battle = battle
+        self.attacker_effects: Dict[int, List[tuple]] = {}
+        self.defender_effects: Dict[int, List[tuple]] = {}
+        self.immunities: Dict[int, List[tuple]] = {}
+        self.sturdy = set()
+        self.switch_in: Dict[int, List[tuple]] = {}
+
+        for team in (battle.player_team, battle.opponent_team):
+            for pokemon in team.pokemon:
+                self._bind(pokemon)
+
+        if self.attacker_effects or self.defender_effects or self.immunities or self.sturdy:
+            self._base_calculate_damage = battle.calculate_damage
+            battle.calculate_damage = self.calculate_damage
+        if self.immunities:
+            self._base_execute_move = battle.execute_move
+            battle.execute_move = self.execute_move
+        if self.switch_in:
+            for team in (battle.player_team, battle.opponent_team):
+                if any(id(p) in self.switch_in for p in team.pokemon):
+                    team.switch_in_hook = self.on_switch_in
+            # Pokemon that start the battle active enter the field now
+            for team in (battle.player_team, battle.opponent_team):
+                for index in team.active_pokemon_indices:
+                    self.on_switch_in(team, team.pokemon[index])
+
+    def _bind(self, pokemon: Pokemon):
+        for kind, params in ABILITY_EFFECTS.get(pokemon.ability, ()):
+            key = id(pokemon)
+            if kind in ("pinch_type_power", "physical_power", "status_physical_power", "low_power_boost",
+                        "resisted_boost", "type_power"):
+                self.attacker_effects.setdefault(key, []).append((kind, params))
+            elif kind in ("type_resist", "class_resist", "super_effective_resist", "full_hp_resist"):
+                self.defender_effects.setdefault(key, []).append((kind, params))
+            elif kind in ("immune", "absorb_heal", "absorb_boost", "wonder_guard"):
+                self.immunities.setdefault(key, []).append((kind, params))
+            elif kind == "sturdy":
+                self.sturdy.add(key)
+            elif kind == "switch_in_lower":
+                self.switch_in.setdefault(key, []).append((kind, params))
+
+    def _immunity(self, defender: Pokemon, move: Move) -> Optional[tuple]:
+        """The immunity effect that blocks `move`, if any."""
+        for kind, params in self.immunities.get(id(defender), ()):
+            if kind == "wonder_guard":
+                if move.power and _effectiveness(move, defender) <= 1:
+                    return kind, params
+            elif kind == "absorb_boost":
+                if move.type in params[0]:
+                    return kind, params
+            elif move.type in params:
+                return kind, params
+        return None
+
+    def calculate_damage(self, attacker: Pokemon, defender: Pokemon, move: Move) -> int:
+        """Engine damage with the attacker's and defender's ability modifiers applied."""
+        if id(defender) in self.immunities and self._immunity(defender, move) is not None:
+            return 0
+        damage = self._base_calculate_damage(attacker, defender, move)
+        factor = 1.0
+
+        for kind, params in self.attacker_effects.get(id(attacker), ()):
+            if kind == "pinch_type_power":
+                if move.type in params and attacker.current_hp * 3 <= attacker.hp:
+                    factor *= 1.5
+            elif kind == "type_power":
+                if move.type in params:
+                    factor *= 1.5
+            elif kind == "physical_power":
+                if move.damage_class == "physical":
+                    factor *= 2.0
+            elif kind == "status_physical_power":
+                if move.damage_class == "physical" and attacker.status is not None:
+                    factor *= 1.5
+            elif kind == "low_power_boost":
+                if 0 < move.power <= params:
+                    factor *= 1.5
+            elif kind == "resisted_boost":
+                if _effectiveness(move, defender) < 1:
+                    factor *= 2.0
+
+        for kind, params in self.defender_effects.get(id(defender), ()):
+            if kind == "type_resist":
+                if move.type in params:
+                    factor *= 0.5
+            elif kind == "class_resist":
+                if move.damage_class == params:
+                    factor *= 0.5
+            elif kind == "super_effective_resist":
+                if _effectiveness(move, defender) > 1:
+                    factor *= 0.75
+            elif kind == "full_hp_resist":
+                if defender.current_hp >= defender.hp:
+                    factor *= 0.5
+
+        if factor != 1.0:
+            damage = int(damage * factor)
+        if id(defender) in self.sturdy and defender.current_hp >= defender.hp and damage >= defender.current_hp:
+            damage = int(defender.current_hp) - 1
+        return damage
+
+    def execute_move(self, attacker: Pokemon, defender: Pokemon, move: Move) -> bool:
+        """Engine move execution, except that moves the defender's ability absorbs are blocked.
+
+        The attacker still has to be able to move (and finish charging) for the move to be absorbed.
+        """
+        immunity = self._immunity(defender, move) if id(defender) in self.immunities else None
+        if immunity is None:
+            return self._base_execute_move(attacker, defender, move)
+
+        battle = self.battle
+        result, _ = battle.begin_move(attacker, move)
+        if result is not None:
+            return result
+        kind, params = immunity
+        battle.log(f"{attacker.name} used {move.name}!")
+        battle.log(f"{defender.name}'s {defender.ability} blocked the move!")
+        if kind == "absorb_heal":
+            defender.heal(defender.hp / 4)
+        elif kind == "absorb_boost":
+            defender.change_stat_stage(params[1], 1)
+        return False
+
+    def on_switch_in(self, team: Team, pokemon: Pokemon):
+        """Run the switch-in effects of a Pokemon that just entered the field."""
+        other = self.battle.opponent_team if team is self.battle.player_team else self.battle.player_team
+        for kind, params in self.switch_in.get(id(pokemon), ()):
+            if kind == "switch_in_lower":
+                targets = [other.active_pokemon] if other.battle_mode == BattleMode.SINGLE else other.active_pokemon
+                for target in targets:
+                    if not target.is_fainted():
+                        target.change_stat_stage(params, -1)
+                self.battle.log(f"{pokemon.name}'s {pokemon.ability} lowered the opposing {params.replace('_', ' ')}!")
+
+
+def _damage_throughput(battle: Battle, pairs: List[tuple], repeats: int) -> float:
+    calculate_damage = battle.calculate_damage
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for attacker, defender, move in pairs:
+            calculate_damage(attacker, defender, move)
+    return repeats * len(pairs) / (time.perf_counter() - started)
+
+
+def main():
+    print(f"Compiled hooks for {len(ABILITY_EFFECTS)} of {len(ABILITIES_DATA)} abilities")
+    rng = random.Random(0)
+    player = Team([Pokemon.from_data(name, rng=rng) for name in DEFAULT_PLAYER_TEAM], BattleMode.SINGLE)
+    opponent = Team([Pokemon.from_data(name, rng=rng) for name in DEFAULT_OPPONENT_TEAM], BattleMode.SINGLE)
+    abilities = {id(p): p.ability for p in player.pokemon + opponent.pokemon}
+    pairs = [(a, d, m) for a in player.pokemon for d in opponent.pokemon for m in a.moves]
+
+    for pokemon in player.pokemon + opponent.pokemon:
+        pokemon.ability = None
+    plain = _damage_throughput(Battle(player, opponent, verbose=False, rng=rng), pairs, 200)
+    no_hooks = _damage_throughput(Battle(player, opponent, verbose=False, rng=rng, abilities=True), pairs, 200)
+    for pokemon in player.pokemon + opponent.pokemon:
+        pokemon.ability = abilities[id(pokemon)]
+    hooks = _damage_throughput(Battle(player, opponent, verbose=False, rng=rng, abilities=True), pairs, 200)
+
+    print(f"calculate_damage, abilities off:           {plain:,.0f} calls/s")
+    print(f"calculate_damage, abilities on, no hooks:  {no_hooks:,.0f} calls/s")
+    print(f"calculate_damage, abilities on, hooks:     {hooks:,.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
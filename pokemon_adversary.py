@@ -1,11 +1,150 @@
+from dataclasses import dataclass
 from typing import List, Tuple, Optional, Union
+import functools
 import random
-from pokemon_battle import Pokemon, Move, Team, BattleMode, TYPES_DATA
+from pokemon_battle import Pokemon, Move, Team, BattleMode, get_type_effectiveness
+from pokemon_zobrist import TranspositionTable, position_key, stable_hash
+from pokemon_endgame import choose_endgame_move, _effective_speed
+from pokemon_damage import ROLL_LOW, ROLL_HIGH, hit_count_distribution, _stage_multiplier
+
+# Joint double-battle scoring: a KO is worth this much on top of the damage dealt, where
+# dealing a target's full HP counts as 1
+KO_BONUS = 1.0
+MEAN_ROLL = (ROLL_LOW + ROLL_HIGH) / 2
+MAX_MOVES = 4
+MAX_HITS = 5
+_ROLL_SPAN = 1 / (ROLL_HIGH - ROLL_LOW)
+# _stage_multiplier of stages -6 to 6, at index stage + 6
+_STAGE_MULTIPLIERS = tuple(_stage_multiplier(stage) for stage in range(-6, 7))
+# _hit_profile results, keyed by the only fields they read: (accuracy, effects)
+_HIT_PROFILES = {}
+
+
+def _hit_profile(move: Move) -> tuple:
+    """Damage-scale-free joint-scoring values of a move.
+
+    Returns:
+        (hits, accuracy * expected hits * mean roll, hit chance, ROLL_HIGH * most hits),
+        where hits are (1 / k, accuracy * P(k hits)) for each possible hit count k
+    """
+    key = (move.accuracy, move.effects)
+    profile = _HIT_PROFILES.get(key)
+    if profile is None:
+        accuracy = min(move.accuracy, 100) / 100
+        counts = hit_count_distribution(move)[1:MAX_HITS + 1].tolist()
+        hits = tuple((1 / k, accuracy * p) for k, p in enumerate(counts, 1) if p > 0)
+        profile = (hits, accuracy * sum(k * p for k, p in enumerate(counts, 1)) * MEAN_ROLL,
+                   sum(chance for _, chance in hits), ROLL_HIGH * max(k for k, p in enumerate(counts, 1) if p > 0))
+        _HIT_PROFILES[key] = profile
+    return profile
+
+
+@functools.lru_cache(maxsize=None)
+def _type_multiplier(attack_type: str, defender_types: Tuple[str, ...]) -> float:
+    """Product of the type effectiveness of an attack type against each defender type.
+
+    The chart's multipliers are powers of two, so this matches multiplying them in one by one.
+    """
+    multiplier = 1.0
+    for defender_type in defender_types:
+        multiplier *= get_type_effectiveness(attack_type, defender_type)
+    return multiplier
+
+
+def _ko_chance(hits: tuple, ratio: float) -> float:
+    """P(one use KOs a target), treating k hits as k * scale * roll.
+
+    Args:
+        hits: The move's _hit_profile hits
+        ratio: Remaining HP (at least 1) / damage scale
+    """
+    chance = 0.0
+    for inverse, weight in hits:
+        reach = (ROLL_HIGH - ratio * inverse) * _ROLL_SPAN
+        if reach >= 1.0:
+            chance += weight
+        elif reach > 0.0:
+            chance += reach * weight
+    return chance
+
+
+@dataclass(frozen=True)
+class AdversaryParams:
+    """Tunable constants of the rule-based Adversary; the defaults are its original behavior.
+
+    Attributes:
+        switch_hp_fraction: Switch out the active Pokemon below this fraction of its max HP
+        advantage_switch_chance: Chance of switching when a bench Pokemon has a move
+            effective beyond `advantage_threshold` against the opponent (1: always). In joint
+            double-battle scoring, where type advantage does not trigger switches, the
+            chance that a slot switching out picks such a Pokemon over any other
+        advantage_threshold: Type effectiveness a bench move must exceed to count as an advantage
+        power_exponent: Moves are scored power ** power_exponent * effectiveness **
+            effectiveness_exponent * (accuracy / 100) ** accuracy_exponent, times stab_bonus
+            for moves matching one of the user's types. Joint double-battle scoring weighs
+            the damage of each move by this score relative to the default power * effectiveness
+        effectiveness_exponent: See power_exponent
+        accuracy_exponent: See power_exponent
+        stab_bonus: See power_exponent
+        ko_bonus: Joint double-battle scoring: value of a KO on top of the damage dealt
+    """
+    switch_hp_fraction: float = 0.3
+    advantage_switch_chance: float = 1.0
+    advantage_threshold: float = 1.0
+    power_exponent: float = 1.0
+    effectiveness_exponent: float = 1.0
+    accuracy_exponent: float = 0.0
+    stab_bonus: float = 1.0
+    ko_bonus: float = KO_BONUS
+
+
+DEFAULT_PARAMS = AdversaryParams()
+_NO_PREFERENCE = (1.0,) * MAX_MOVES
+# _pair_options result for a fainted target
+_NO_OPTIONS = ((), 0.0, 0.0, (0.0, 0))
+
 
 class Adversary:
-    def __init__(self, team: Team, battle_mode: BattleMode):
+    def __init__(self, team: Team, battle_mode: BattleMode, rng: Optional[random.Random] = None,
+                 transposition_table: Optional[TranspositionTable] = None, endgame: bool = False,
+                 joint: bool = True, params: AdversaryParams = DEFAULT_PARAMS):
+        """Rule-based opponent.
+
+        Args:
+            team: The team this adversary controls
+            battle_mode: Single or double battle
+            rng: Random source for tie-breaks and random choices (defaults to the global random module)
+            transposition_table: Optional table, possibly shared between adversaries, used to
+                reuse the deterministic part of decisions (see _position_summary) for
+                positions that were already seen. Joint double-battle scoring reads exact
+                HP, so it does not use the table
+            endgame: In single battles, play the exact optimal strategy from pokemon_endgame
+                once each side has a single Pokemon left. Each new 1v1 matchup costs about a
+                second to solve, so this is far slower than the heuristics
+            joint: In double battles, score every combination of both slots' moves and
+                targets together (see _choose_joint_double_actions) instead of deciding
+                each slot on its own
+            params: Heuristic constants (see AdversaryParams)
+        """
         self.team = team
+        self.params = params
         self.battle_mode = battle_mode
+        self.rng = rng if rng is not None else random
+        self.transposition_table = transposition_table
+        self.endgame = endgame
+        self.joint = joint
+        # Separates transposition table entries of adversaries with different settings
+        self._settings_key = stable_hash(f"{type(self).__name__}:{battle_mode.value}:{params!r}")
+        # Joint double-battle options per (attacker, defender, damage-relevant stages) and damaging
+        # moves per attacker, see _pair_row and _move_rows
+        self._pair_cache = {}
+        self._move_row_cache = {}
+        if joint and battle_mode == BattleMode.DOUBLE:
+            # Movesets do not change during a battle, so work the team's out before it starts
+            for pokemon in team.pokemon:
+                self._move_rows(pokemon)
+        # Whether a team member has a type advantage, per (team index, opponent type)
+        self._advantages = {}
 
     def choose_action(self, opponent_team: Team) -> Union[tuple, List[tuple]]:
         """Choose an action for the current turn.
@@ -16,105 +155,527 @@ class Adversary:
         """
         if self.battle_mode == BattleMode.SINGLE:
             return self._choose_single_action(opponent_team)
+        return self._choose_double_actions(opponent_team)
+
+    def _position_summary(self, opponent_team: Team) -> tuple:
+        """The deterministic inputs of a rule-based decision.
+
+        Returns:
+            (index of the best-scoring move of each active Pokemon against the opponent's
+            first active Pokemon, or None if none deals damage; whether a bench Pokemon has
+            a type advantage)
+
+        These depend only on what a position key covers (species, movesets, fainted or
+        not) and on params, so with a transposition table they are cached under the
+        position and this adversary's settings. Everything that reads exact HP or the rng
+        (switching at low HP, switch and target picks, fallback moves) is decided every turn.
+        """
+        table = self.transposition_table
+        if table is not None:
+            key = position_key(self.team, opponent_team) ^ self._settings_key
+            summary = table.lookup(key)
+            if summary is not None:
+                return summary
+        if self.battle_mode == BattleMode.SINGLE:
+            ours, defender = [self.team.active_pokemon], opponent_team.active_pokemon
         else:
-            return self._choose_double_actions(opponent_team)
+            ours, defender = self.team.active_pokemon, opponent_team.active_pokemon[0]
+        summary = (tuple(self._best_move_index(pokemon, defender) for pokemon in ours),
+                   self._bench_has_advantage(opponent_team))
+        if table is not None:
+            table.store(key, summary)
+        return summary
 
     def _choose_single_action(self, opponent_team: Team) -> tuple:
         """Choose an action for a single battle."""
+        if self.endgame and self._is_endgame(opponent_team):
+            # Battle.execute_turn gives speed ties to the player side
+            return ('move', choose_endgame_move(self.team.active_pokemon, opponent_team.active_pokemon, self.rng,
+                                                wins_ties=self.team.side != "opponent"))
+
+        (best,), advantage = self._position_summary(opponent_team)
         # Check if we should switch
-        if self._should_switch(opponent_team):
+        if self._should_switch(opponent_team, advantage):
             available_switches = self.team.get_available_switches()
             if available_switches:
-                return ('switch', random.choice(available_switches))
+                return ('switch', self.rng.choice(available_switches))
 
         # Choose a move
         current_pokemon = self.team.active_pokemon
-        best_move = self._choose_best_move(current_pokemon, opponent_team.active_pokemon)
-        return ('move', best_move)
+        return ('move', current_pokemon.moves[best] if best is not None else self.rng.choice(current_pokemon.moves))
 
     def _choose_double_actions(self, opponent_team: Team) -> List[tuple]:
         """Choose actions for both Pokémon in a double battle."""
+        if self.joint:
+            return self._choose_joint_double_actions(opponent_team)
         actions = []
         active_pokemon = self.team.active_pokemon  # This will be a list in double battle mode
+        best_moves, advantage = self._position_summary(opponent_team)
         
         for i, pokemon in enumerate(active_pokemon):
             # Check if we should switch
-            if self._should_switch(opponent_team):
+            if self._should_switch(opponent_team, advantage):
                 available_switches = self.team.get_available_switches()
                 if available_switches:
-                    actions.append(('switch', random.choice(available_switches), 0))
+                    actions.append(('switch', self.rng.choice(available_switches), 0))
                     continue
 
             # Choose a move and target
-            best_move = self._choose_best_move(pokemon, opponent_team.active_pokemon[0])
+            best = best_moves[i]
+            best_move = pokemon.moves[best] if best is not None else self.rng.choice(pokemon.moves)
             # Randomly choose target for now, could be improved with better targeting logic
-            target = random.randint(0, 1)
+            target = self.rng.randint(0, 1)
             actions.append(('move', best_move, target))
 
         return actions
 
-    def _should_switch(self, opponent_team: Team) -> bool:
-        """Determine if we should switch Pokémon."""
-        current_pokemon = self.team.active_pokemon
-        opponent_pokemon = opponent_team.active_pokemon
+    def _choose_joint_double_actions(self, opponent_team: Team) -> List[tuple]:
+        """Choose both slots' actions by scoring every joint (move, target) option.
 
-        # Handle single battle case
-        if self.battle_mode == BattleMode.SINGLE:
-            # Switch if current Pokémon is at low health
-            if current_pokemon.current_hp / current_pokemon.hp < 0.3:
-                return True
+        A hit on a target is worth the expected damage as a fraction of the target's max
+        HP, weighted by the move's tuned score (see AdversaryParams.power_exponent), plus
+        params.ko_bonus times the KO probability. The two slots act in the engine's turn
+        order (priority, then speed, slot 0 on ties); when both aim at the same target,
+        the second hit only counts if the first did not KO and only up to the HP left, so
+        spreading damage and focusing a KO are compared directly. A slot switches out when
+        it is below params.switch_hp_fraction of its HP or cannot damage either opponent,
+        preferring a bench Pokemon with a type advantage; the two slots never pick the same one.
+        A fainted slot (left in place when the bench is empty) deals no damage.
 
-            # Switch if we have a type advantage with another Pokémon
-            opponent_types = opponent_pokemon.types
-        else:
-            # For double battles, check both active Pokémon
-            for pokemon in current_pokemon:
-                if pokemon.current_hp / pokemon.hp < 0.3:
-                    return True
+        Options on different targets add up, so the best of them is the best move of each
+        slot on each target. Only pairs on the same target are scored together, and a pair
+        is skipped when a bound on what it can add (its damage values, capped at all the HP
+        left, plus its KO caps, capped at one KO) cannot beat the best option so far. A
+        target with more HP than either slot's hardest hit plus the other slot's reach can
+        be neither KOed nor overkilled this turn, so each move is worth its full-HP value
+        and the best pair on it is the two best moves, both precomputed by _pair_options.
+        Along with skipping the options of slots that switch out, that keeps a decision
+        within the cost of the per-slot rules.
+        """
+        ours, theirs = self.team.active_pokemon, opponent_team.active_pokemon
+        hp = (theirs[0].current_hp, theirs[1].current_hp)
+        alive = (hp[0] > 0, hp[1] > 0)
+        ko_bonus = self.params.ko_bonus
+        # _pair_row cache key part of each opponent slot: its id and defensive stat stages, None if fainted
+        defender0, defender1 = theirs
+        defenses = ((id(defender0), defender0.stat_stages["defense"], defender0.stat_stages["special_defense"])
+                    if alive[0] else None,
+                    (id(defender1), defender1.stat_stages["defense"], defender1.stat_stages["special_defense"])
+                    if alive[1] else None)
 
-            # Get all opponent types
-            opponent_types = []
-            for pokemon in opponent_pokemon:
-                opponent_types.extend(pokemon.types)
+        # A slot below switch_hp_fraction switches out whenever the bench has a Pokemon left for it,
+        # so its options are only worked out if it stays in. A slot that cannot damage either
+        # opponent switches out too.
+        fraction = self.params.switch_hp_fraction
+        available = None
+        tables = [(_NO_OPTIONS, _NO_OPTIONS), (_NO_OPTIONS, _NO_OPTIONS)]
+        best = [0.0, 0.0]
+        wants = [False, False]
+        for slot in range(2):
+            pokemon = ours[slot]
+            if pokemon.current_hp / pokemon.hp < fraction:
+                wants[slot] = True
+                if available is None:
+                    available = self.team.get_available_switches()
+                if len(available) > (slot and wants[0]):
+                    continue
+            if pokemon.current_hp > 0:
+                tables[slot] = self._pair_row(pokemon, theirs, defenses)
+                best[slot] = max(tables[slot][0][1], tables[slot][1][1])
+            wants[slot] = wants[slot] or best[slot] <= 0
+        switches = None
+        if wants[0] or wants[1]:
+            if available is None:
+                available = self.team.get_available_switches()
+            if available:
+                switches = self._joint_switches(theirs, available, wants)
+        if switches is not None and switches[0] is not None and switches[1] is not None:
+            return [('switch', switches[0], 0), ('switch', switches[1], 0)]
+        if switches is not None and (switches[0] is not None or switches[1] is not None):
+            slot = 0 if switches[0] is None else 1
+            top = [self._top_option(tables[slot][target], hp[target]) for target in range(2)]
+            target = 0 if top[0][0] >= top[1][0] else 1
+            actions = [('switch', switches[1 - slot], 0)] * 2
+            actions[slot] = self._move_action(ours[slot], top[target][1], target, best[slot], alive)
+            return actions
 
-        # Check for type advantages with other team members
-        for pokemon in self.team.pokemon:
-            if pokemon != current_pokemon and not pokemon.is_fainted():
-                # Check if this Pokémon has a type advantage
-                if self._has_type_advantage(pokemon, opponent_types):
-                    return True
+        # top[slot][target]: the best (value, move) of a slot on a target, 0 and move 0 where it
+        # deals no damage. scored[slot][target]: (value, KO chance, option, damage value, KO cap)
+        # of each damaging move on a target that is not healthy, where the KO cap is the most
+        # KO value the move can add to a same-target pair in either order: ko_bonus * hit chance
+        # if the other slot's hardest hit can leave the target within its reach, else its own
+        # KO value. bounds[target]: the most damage value two hits can add up to (all HP left at
+        # the heaviest weight), then each slot's largest (damage value, KO cap)
+        top = [[(0.0, 0), (0.0, 0)], [(0.0, 0), (0.0, 0)]]
+        scored = ([[], []], [[], []])
+        bounds = [None, None]
+        healthy = [False, False]
+        for target in range(2):
+            if not alive[target]:
+                continue
+            left = hp[target]
+            table0, table1 = tables[0][target], tables[1][target]
+            if left >= table0[1] + table1[2] and left >= table1[1] + table0[2]:
+                healthy[target] = True
+                top[0][target], top[1][target] = table0[3], table1[3]
+                continue
+            clamped = max(left, 1.0)
+            heaviest = 0.0
+            peaks = []
+            for slot in range(2):
+                row = scored[slot][target]
+                lowest = left - tables[1 - slot][target][1]
+                top_value, top_move, top_damage, top_ko = -1.0, 0, 0.0, 0.0
+                for option in tables[slot][target][0]:
+                    index, expected, weight, hits, chance, reach, scale, _ = option
+                    damage = (expected if expected < left else left) * weight
+                    ko = _ko_chance(hits, clamped / scale) if clamped < reach else 0.0
+                    value = damage + ko_bonus * ko
+                    ko_cap = ko_bonus * (chance if lowest < reach else ko)
+                    row.append((value, ko, option, damage, ko_cap))
+                    if value > top_value:
+                        top_value, top_move = value, index
+                    if weight > heaviest:
+                        heaviest = weight
+                    if damage > top_damage:
+                        top_damage = damage
+                    if ko_cap > top_ko:
+                        top_ko = ko_cap
+                if row:
+                    top[slot][target] = (top_value, top_move)
+                peaks.append((top_damage, top_ko))
+            bounds[target] = (left * heaviest, peaks[0], peaks[1])
+
+        # Different targets: the two slots' best moves simply add up
+        best_value = -1.0
+        for target0 in range(2):
+            value = top[0][target0][0] + top[1][1 - target0][0]
+            if value > best_value:
+                best_value = value
+                choice = (top[0][target0][1], target0, top[1][1 - target0][1], 1 - target0)
+        # Same target: the second hit only counts if the first did not KO, and only up to the HP
+        # left. Pairs whose bound cannot beat the best option so far are skipped.
+        slot0_wins_ties = None
+        for target in range(2):
+            if healthy[target]:
+                if tables[0][target][0] and tables[1][target][0]:
+                    value = top[0][target][0] + top[1][target][0]
+                    if value > best_value:
+                        best_value = value
+                        choice = (top[0][target][1], target, top[1][target][1], target)
+                continue
+            if not scored[0][target] or not scored[1][target]:
+                continue
+            # A pair adds at most its damage values, capped at all the HP left, plus its KO caps,
+            # capped at a single KO
+            limit, (top_damage0, top_ko0), (top_damage1, top_ko1) = bounds[target]
+            if min(top_damage0 + top_damage1, limit) + min(top_ko0 + top_ko1, ko_bonus) <= best_value:
+                continue
+            for first0 in scored[0][target]:
+                damage0, ko_cap0 = first0[3], first0[4]
+                if min(damage0 + top_damage1, limit) + min(ko_cap0 + top_ko1, ko_bonus) <= best_value:
+                    continue
+                for first1 in scored[1][target]:
+                    if min(damage0 + first1[3], limit) + min(ko_cap0 + first1[4], ko_bonus) <= best_value:
+                        continue
+                    priority0, priority1 = first0[2][7], first1[2][7]
+                    if priority0 != priority1:
+                        slot0_first = priority0 > priority1
+                    else:
+                        if slot0_wins_ties is None:
+                            slot0_wins_ties = _effective_speed(ours[0]) >= _effective_speed(ours[1])
+                        slot0_first = slot0_wins_ties
+                    (value, ko, option, _, _), second = (first0, first1[2]) if slot0_first else (first1, first0[2])
+                    left = hp[target] - option[1]
+                    follow = min(second[1], max(left, 0.0)) * second[2]
+                    if left < second[5]:
+                        follow += ko_bonus * _ko_chance(second[3], max(left, 1.0) / second[6])
+                    total = value + (1 - ko) * follow
+                    if total > best_value:
+                        best_value = total
+                        choice = (first0[2][0], target, first1[2][0], target)
+
+        move0, target0, move1, target1 = choice
+        if best[0] > 0 and best[1] > 0:
+            return [('move', ours[0].moves[move0], target0), ('move', ours[1].moves[move1], target1)]
+        return [self._move_action(ours[0], move0, target0, best[0], alive),
+                self._move_action(ours[1], move1, target1, best[1], alive)]
+
+    def _pair_row(self, attacker: Pokemon, theirs: List[Pokemon], defenses: tuple) -> list:
+        """_pair_options of an attacker against each opponent slot, _NO_OPTIONS where the opponent is fainted.
+
+        The options only change with the stat stages and burn that damage_scale reads, so they
+        are cached under those. Entries hold on to their Pokemon, so the ids in their keys
+        cannot be reused.
+        """
+        stages = attacker.stat_stages
+        attack = (id(attacker), stages["attack"], stages["special_attack"], attacker.status == "burn")
+        cache = self._pair_cache
+        row = [_NO_OPTIONS, _NO_OPTIONS]
+        for target in range(2):
+            defense = defenses[target]
+            if defense is not None:
+                key = attack + defense
+                cached = cache.get(key)
+                if cached is None:
+                    cached = cache[key] = (attacker, theirs[target], self._pair_options(attacker, theirs[target]))
+                row[target] = cached[2]
+        return row
 
+    def _top_option(self, options: tuple, left: float) -> Tuple[float, int]:
+        """The best (value, move) among _pair_options options against a target with left HP, (0, 0) if none."""
+        if not options[0]:
+            return 0.0, 0
+        if left >= options[1] and left >= options[2]:
+            return options[3]
+        ko_bonus = self.params.ko_bonus
+        clamped = max(left, 1.0)
+        top_value, top_move = -1.0, 0
+        for index, expected, weight, hits, _, reach, scale, _ in options[0]:
+            value = (expected if expected < left else left) * weight
+            if clamped < reach:
+                value += ko_bonus * _ko_chance(hits, clamped / scale)
+            if value > top_value:
+                top_value, top_move = value, index
+        return top_value, top_move
+
+    def _pair_options(self, attacker: Pokemon, defender: Pokemon) -> tuple:
+        """HP-independent joint-scoring values of an attacker's moves against a defender.
+
+        Returns:
+            (options, largest expected damage, largest reach, best (value, move) at full
+            HP), where options are (move index, expected damage, value weight, hits, hit
+            chance, reach, damage scale, priority) for each move that can damage the
+            defender: the weight turns damage into value (tuned score / defender max HP),
+            hits are the move's _hit_profile hits, and a defender with at least reach HP
+            cannot be KOed by it
+        """
+        # Same stat ratios, type effectiveness and burn as damage_scale
+        attacker_stages, defender_stages = attacker.stat_stages, defender.stat_stages
+        physical = (attacker.attack * _STAGE_MULTIPLIERS[attacker_stages["attack"] + 6] /
+                    (defender.defense * _STAGE_MULTIPLIERS[defender_stages["defense"] + 6]))
+        special = (attacker.special_attack * _STAGE_MULTIPLIERS[attacker_stages["special_attack"] + 6] /
+                   (defender.special_defense * _STAGE_MULTIPLIERS[defender_stages["special_defense"] + 6]))
+        burned = attacker.status == "burn"
+        defender_types = tuple(defender.types)
+        preference = _NO_PREFERENCE if self.params is DEFAULT_PARAMS else self._preference_row(attacker, defender)
+        hp = defender.hp
+        options = []
+        most_expected = most_reach = 0.0
+        top_value, top_move = -1.0, 0
+        for index, power, is_physical, move_type, hits, factor, chance, top_roll, priority in self._move_rows(attacker):
+            if is_physical:
+                scale = (power * physical / 50 + 2) * _type_multiplier(move_type, defender_types)
+                if burned:
+                    scale *= 0.5
+            else:
+                scale = (power * special / 50 + 2) * _type_multiplier(move_type, defender_types)
+            expected = factor * scale
+            if expected <= 0:
+                continue
+            weight = preference[index] / hp
+            reach = top_roll * scale
+            options.append((index, expected, weight, hits, chance, reach, scale, priority))
+            if expected > most_expected:
+                most_expected = expected
+            if reach > most_reach:
+                most_reach = reach
+            if expected * weight > top_value:
+                top_value, top_move = expected * weight, index
+        return options, most_expected, most_reach, (top_value, top_move) if options else (0.0, 0)
+
+    def _move_rows(self, attacker: Pokemon) -> List[tuple]:
+        """Stat-stage-free parts of the attacker's damaging moves, cached per Pokemon.
+
+        Returns:
+            (move index, level factor * power, physical, type, then the move's _hit_profile,
+            priority) for each of the first MAX_MOVES moves that is not a status move
+        """
+        cached = self._move_row_cache.get(id(attacker))
+        if cached is not None:
+            return cached[1]
+        level_factor = 2 * attacker.level / 5 + 2
+        rows = [(index, level_factor * move.power, move.damage_class == "physical", move.type)
+                + _hit_profile(move) + (move.priority,)
+                for index, move in enumerate(attacker.moves[:MAX_MOVES]) if move.damage_class != "status"]
+        self._move_row_cache[id(attacker)] = (attacker, rows)
+        return rows
+
+    def _preference_row(self, attacker: Pokemon, defender: Pokemon) -> List[float]:
+        """Tuned score of each of the attacker's moves against a defender relative to the default
+        power * effectiveness (all ones under DEFAULT_PARAMS)."""
+        params = self.params
+        if params is DEFAULT_PARAMS:
+            return _NO_PREFERENCE
+        row = [1.0] * MAX_MOVES
+        for m, move in enumerate(attacker.moves[:MAX_MOVES]):
+            effectiveness = 1.0
+            for defender_type in defender.types:
+                effectiveness *= self._get_type_effectiveness(move.type, defender_type)
+            # Moves without power or effect deal no damage, so their weight does not matter
+            if move.power and effectiveness:
+                row[m] = (move.power ** (params.power_exponent - 1) *
+                          effectiveness ** (params.effectiveness_exponent - 1) *
+                          (min(move.accuracy, 100) / 100) ** params.accuracy_exponent)
+                if move.type in attacker.types:
+                    row[m] *= params.stab_bonus
+        return row
+
+    def _joint_switches(self, theirs: List[Pokemon], available: List[int], wants: List[bool]) -> List[Optional[int]]:
+        """Bench index each slot that wants to switch out switches to, or None for slots that stay in.
+
+        Args:
+            theirs: The opponent's active Pokemon
+            available: The team's bench indices that can switch in (used up by the picks)
+            wants: Whether each slot wants to switch out
+        """
+        opponent_types = [t for p in theirs if p.current_hp > 0 for t in p.types]
+        threshold = self.params.advantage_threshold
+        advantages = self._advantages
+        preferred = []
+        for i in available:
+            for opponent_type in opponent_types:
+                advantage = advantages.get((i, opponent_type))
+                if advantage is None:
+                    # _has_type_advantage against this one type
+                    for move in self.team.pokemon[i].moves:
+                        if get_type_effectiveness(move.type, opponent_type) > threshold:
+                            advantage = True
+                            break
+                    else:
+                        advantage = False
+                    advantages[(i, opponent_type)] = advantage
+                if advantage:
+                    preferred.append(i)
+                    break
+        chance = self.params.advantage_switch_chance
+        switches = []
+        for slot in range(2):
+            if wants[slot] and available:
+                take_advantage = preferred and (chance >= 1 or self.rng.random() < chance)
+                choice = self.rng.choice(preferred if take_advantage else available)
+                available.remove(choice)
+                if choice in preferred:
+                    preferred.remove(choice)
+                switches.append(choice)
+            else:
+                switches.append(None)
+        return switches
+
+    def _move_action(self, pokemon: Pokemon, move: int, target: int, best: float, alive: Tuple[bool, bool]) -> tuple:
+        """Move action for an active Pokemon; one with nothing that deals damage uses a random move on a live target.
+
+        A fainted one (left in place when the bench is empty, and made to pass by the game
+        loops) uses its first move.
+        """
+        if pokemon.current_hp <= 0:
+            return ('move', pokemon.moves[0], 0)
+        if best <= 0:
+            targets = [j for j in range(2) if alive[j]] or [0, 1]
+            return ('move', self.rng.choice(pokemon.moves), self.rng.choice(targets))
+        return ('move', pokemon.moves[move], target)
+
+    def _is_endgame(self, opponent_team: Team) -> bool:
+        """Whether only the two active Pokemon are left standing."""
+        return (sum(not p.is_fainted() for p in self.team.pokemon) == 1 and
+                sum(not p.is_fainted() for p in opponent_team.pokemon) == 1 and
+                not self.team.active_pokemon.is_fainted() and not opponent_team.active_pokemon.is_fainted())
+
+    def _should_switch(self, opponent_team: Team, advantage: Optional[bool] = None) -> bool:
+        """Determine if we should switch Pokémon.
+
+        Args:
+            opponent_team: The opposing team
+            advantage: Whether a bench Pokemon has a type advantage (computed if None)
+        """
+        params = self.params
+        current_pokemon = self.team.active_pokemon
+
+        # Switch if an active Pokémon is at low health
+        for pokemon in [current_pokemon] if self.battle_mode == BattleMode.SINGLE else current_pokemon:
+            if pokemon.current_hp / pokemon.hp < params.switch_hp_fraction:
+                return True
+
+        # Switch if we have a type advantage with another Pokémon
+        if params.advantage_switch_chance <= 0:
+            return False
+        if advantage is None:
+            advantage = self._bench_has_advantage(opponent_team)
+        if advantage:
+            return params.advantage_switch_chance >= 1 or self.rng.random() < params.advantage_switch_chance
         return False
 
-    def _choose_best_move(self, attacker: Pokemon, defender: Pokemon) -> Move:
-        """Choose the best move to use against the defender."""
+    def _bench_has_advantage(self, opponent_team: Team) -> bool:
+        """Whether a Pokémon other than the active one(s) and not fainted has a type advantage
+        against the opponent's active Pokémon (all of them in double battles)."""
+        if self.battle_mode == BattleMode.SINGLE:
+            active = [self.team.active_pokemon]
+            opponent_types = opponent_team.active_pokemon.types
+        else:
+            # The per-slot double-battle rules have always counted the active Pokemon too
+            active = []
+            opponent_types = [t for pokemon in opponent_team.active_pokemon for t in pokemon.types]
+        return any(not pokemon.is_fainted() and all(pokemon is not a for a in active) and
+                   self._has_type_advantage(pokemon, opponent_types) for pokemon in self.team.pokemon)
+
+    def _best_move_index(self, attacker: Pokemon, defender: Pokemon) -> Optional[int]:
+        """Index of the attacker's best-scoring move against the defender (None if none deals damage)."""
         # Simple strategy: prefer moves that are super effective
+        params = self.params
         best_move = None
         best_damage = 0
 
-        for move in attacker.moves:
+        for index, move in enumerate(attacker.moves):
             # Calculate type effectiveness
             effectiveness = 1.0
             for defender_type in defender.types:
                 effectiveness *= self._get_type_effectiveness(move.type, defender_type)
 
             # Estimate damage
-            estimated_damage = move.power * effectiveness if move.power else 0
+            if params is DEFAULT_PARAMS:
+                estimated_damage = move.power * effectiveness if move.power else 0
+            elif move.power:
+                estimated_damage = (move.power ** params.power_exponent * effectiveness ** params.effectiveness_exponent
+                                    * (min(move.accuracy, 100) / 100) ** params.accuracy_exponent)
+                if move.type in attacker.types:
+                    estimated_damage *= params.stab_bonus
+            else:
+                estimated_damage = 0
 
             if estimated_damage > best_damage:
                 best_damage = estimated_damage
-                best_move = move
+                best_move = index
 
-        return best_move or random.choice(attacker.moves)
+        return best_move
 
     def _has_type_advantage(self, pokemon: Pokemon, opponent_types: List[str]) -> bool:
         """Check if a Pokémon has a type advantage against the opponent's types."""
+        threshold = self.params.advantage_threshold
         for move in pokemon.moves:
             for opponent_type in opponent_types:
-                if self._get_type_effectiveness(move.type, opponent_type) > 1.0:
+                if self._get_type_effectiveness(move.type, opponent_type) > threshold:
                     return True
         return False
 
     def _get_type_effectiveness(self, attack_type: str, defender_type: str) -> float:
         """Get the type effectiveness multiplier from the types data file."""
-        return TYPES_DATA[attack_type][defender_type] 
\ No newline at end of file
+        return get_type_effectiveness(attack_type, defender_type) 
+
+
+class RandomAdversary(Adversary):
+    """Baseline opponent that picks uniformly among its legal moves and switches."""
+
+    def _choose_single_action(self, opponent_team: Team) -> tuple:
+        options = [('move', move) for move in self.team.active_pokemon.moves]
+        options += [('switch', index) for index in self.team.get_available_switches()]
+        return self.rng.choice(options)
+
+    def _choose_double_actions(self, opponent_team: Team) -> List[tuple]:
+        targets = [i for i, p in enumerate(opponent_team.active_pokemon) if not p.is_fainted()] or [0]
+        switches = self.team.get_available_switches()
+        actions = []
+        for pokemon in self.team.active_pokemon:
+            options = [('move', move, target) for move in pokemon.moves for target in targets]
+            options += [('switch', index, 0) for index in switches]
+            actions.append(self.rng.choice(options))
+        return actions
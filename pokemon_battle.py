@@ -1,10 +1,12 @@
-from dataclasses import dataclass
-from typing import List, Dict, Optional, Union
+from dataclasses import dataclass, field
+from typing import Callable, List, Dict, Optional, Sequence, Tuple, Union
 import random
 import json
 import os
 from enum import Enum
 
+from pokemon_stats import DEFAULT_STAT_PRESET, stat_table
+
 # Load Pokemon and moves data
 def load_pokemon_data():
     with open('src/collected-data/pokemon_data.json', 'r') as f:
@@ -18,9 +20,52 @@ def load_types_data():
     with open('src/collected-data/types_data.json', 'r') as f:
         return json.load(f)
 
+# Move effect opcodes. pokemon_moves.py compiles the effect text in moves_data.json
+# into lists of these ahead of time, so the engine never parses text during a battle.
+OP_STAT_STAGE = 1  # [op, USER/TARGET, stat, delta, chance %]
+OP_STATUS = 2      # [op, status, chance %], inflicted on the target
+OP_RECOIL = 3      # [op, fraction of damage dealt]
+OP_DRAIN = 4       # [op, fraction of damage dealt]
+OP_HEAL = 5        # [op, fraction of the user's max HP]
+OP_MULTI_HIT = 6   # [op, min hits, max hits]
+OP_PRIORITY = 7    # [op, priority]
+OP_CHARGE = 8      # [op], the first use only charges
+OPCODE_NAMES = {OP_STAT_STAGE: "stat_stage", OP_STATUS: "status", OP_RECOIL: "recoil", OP_DRAIN: "drain",
+                OP_HEAL: "heal", OP_MULTI_HIT: "multi_hit", OP_PRIORITY: "priority", OP_CHARGE: "charge"}
+USER, TARGET = 0, 1
+
+MOVE_EFFECTS_PATH = 'src/collected-data/move_effects.json'
+
+def load_move_effects():
+    """Compiled move effects as {move: tuple of opcode tuples}; empty if not compiled yet."""
+    if not os.path.exists(MOVE_EFFECTS_PATH):
+        return {}
+    with open(MOVE_EFFECTS_PATH, 'r') as f:
+        return {name: tuple(tuple(op) for op in ops) for name, ops in json.load(f).items()}
+
 POKEMON_DATA = load_pokemon_data()
 MOVES_DATA = load_moves_data()
 TYPES_DATA = load_types_data()
+MOVE_EFFECTS = load_move_effects()
+
+# Types that cannot receive a major status condition
+STATUS_IMMUNE_TYPES = {
+    "burn": {"fire"},
+    "freeze": {"ice"},
+    "paralysis": {"electric"},
+    "poison": {"poison", "steel"},
+    "bad-poison": {"poison", "steel"},
+}
+# Hit counts for 2-5 hit moves: 2 or 3 hits 3/8 of the time each, 4 or 5 hits 1/8 each
+MULTI_HIT_COUNTS = (2, 2, 2, 3, 3, 3, 4, 5)
+
+# Teams used by the command-line demo and as defaults elsewhere
+DEFAULT_PLAYER_TEAM = ["charizard", "blastoise", "venusaur", "pikachu", "snorlax", "gyarados"]
+DEFAULT_OPPONENT_TEAM = ["tyranitar", "metagross", "salamence", "garchomp", "dragonite", "hydreigon"]
+
+def get_type_effectiveness(attack_type: str, defender_type: str) -> float:
+    """Get the type effectiveness multiplier, treating types missing from the chart (fairy) as neutral."""
+    return TYPES_DATA.get(attack_type, {}).get(defender_type, 1)
 
 class BattleMode(Enum):
     SINGLE = "single"
@@ -34,18 +79,23 @@ class Move:
     accuracy: int
     pp: int
     damage_class: str  # physical, special, or status
+    effects: tuple = ()  # compiled opcodes other than priority, see OP_*
+    priority: int = 0
 
     @classmethod
     def from_data(cls, move_name: str):
         """Create a Move instance from the moves data."""
         move_data = MOVES_DATA[move_name]
+        ops = MOVE_EFFECTS.get(move_name, ())
         return cls(
             name=move_name,
             type=move_data['type'],
             power=move_data['power'] or 0,  # Some moves might not have power
             accuracy=move_data['accuracy'] or 100,  # Some moves might not have accuracy
             pp=move_data['pp'] or 20,  # Default PP if not specified
-            damage_class=move_data['damage_class']
+            damage_class=move_data['damage_class'],
+            effects=tuple(op for op in ops if op[0] != OP_PRIORITY),
+            priority=next((op[1] for op in ops if op[0] == OP_PRIORITY), 0)
         )
 
 @dataclass
@@ -65,16 +115,30 @@ class Pokemon:
     current_hp: int
     status: Optional[str] = None  # e.g., "poison", "burn", "sleep", etc.
     stat_stages: Dict[str, int] = None  # Tracks stat modifications (-6 to +6)
+    ability: Optional[str] = None
+    status_turns: int = 0  # turns of sleep left, or the bad-poison counter
+    charging: Optional[str] = None  # name of a charge move waiting to be released
+    # (tracker, slot) set by pokemon_zobrist to keep a team hash up to date
+    hash_tracker: Optional[tuple] = field(default=None, repr=False, compare=False)
 
     @classmethod
-    def from_data(cls, pokemon_name: str, level: int = 50):
-        """Create a Pokemon instance from the Pokemon data."""
+    def from_data(cls, pokemon_name: str, level: int = 50, rng: Optional[random.Random] = None,
+                  stat_preset: str = DEFAULT_STAT_PRESET):
+        """Create a Pokemon instance from the Pokemon data.
+
+        Args:
+            pokemon_name: Key into POKEMON_DATA
+            level: Battle level
+            rng: Random source used to sample the moveset (defaults to the global random module)
+            stat_preset: How stats scale with level (see pokemon_stats.STAT_PRESETS)
+        """
+        rng = rng if rng is not None else random
         pokemon_data = POKEMON_DATA[pokemon_name]
-        stats = pokemon_data['base_stats']
+        hp, attack, defense, special_attack, special_defense, speed = stat_table(stat_preset).lookup(pokemon_name, level)
         
         # Get up to 4 random moves from the Pokemon's movepool
         available_moves = pokemon_data['moves']
-        selected_moves = random.sample(available_moves, min(4, len(available_moves)))
+        selected_moves = rng.sample(available_moves, min(4, len(available_moves)))
         moves = [Move.from_data(move_name) for move_name in selected_moves]
         
         # Create the Pokemon instance with current_hp set to max HP
@@ -83,13 +147,14 @@ class Pokemon:
             level=level,
             types=pokemon_data['types'],
             moves=moves,
-            hp=(stats['hp'] * 2 * level/100) + level + 10,
-            attack=stats['attack'],
-            defense=stats['defense'],
-            special_attack=stats['special-attack'],
-            special_defense=stats['special-defense'],
-            speed=stats['speed'],
-            current_hp=(stats['hp'] * 2 * level/100) + level + 10 # Initialize current_hp to max HP
+            hp=hp,
+            attack=attack,
+            defense=defense,
+            special_attack=special_attack,
+            special_defense=special_defense,
+            speed=speed,
+            current_hp=hp, # Initialize current_hp to max HP
+            ability=pokemon_data['abilities'][0] if pokemon_data['abilities'] else None
         )
 
     def __post_init__(self):
@@ -108,10 +173,42 @@ class Pokemon:
         return self.current_hp <= 0
 
     def take_damage(self, damage: int):
+        old_hp = self.current_hp
         self.current_hp = max(0, self.current_hp - damage)
+        if self.hash_tracker is not None:
+            self.hash_tracker[0].hp_changed(self.hash_tracker[1], self, old_hp)
 
     def heal(self, amount: int):
+        old_hp = self.current_hp
         self.current_hp = min(self.hp, self.current_hp + amount)
+        if self.hash_tracker is not None:
+            self.hash_tracker[0].hp_changed(self.hash_tracker[1], self, old_hp)
+
+    def change_stat_stage(self, stat: str, delta: int) -> int:
+        """Raise or lower a stat stage, clamped to -6..+6. Returns the change actually applied."""
+        old_stage = self.stat_stages[stat]
+        new_stage = max(-6, min(6, old_stage + delta))
+        self.stat_stages[stat] = new_stage
+        if self.hash_tracker is not None and new_stage != old_stage:
+            self.hash_tracker[0].stage_changed(self.hash_tracker[1], stat, old_stage, new_stage)
+        return new_stage - old_stage
+
+    def set_status(self, status: Optional[str]):
+        """Set (or clear, with None) the major status condition."""
+        old_status = self.status
+        self.status = status
+        if self.hash_tracker is not None and status != old_status:
+            self.hash_tracker[0].status_changed(self.hash_tracker[1], old_status, status)
+
+    def reset(self):
+        """Restore full HP and clear status, stat stages and charging, in place."""
+        self.current_hp = self.hp
+        self.status = None
+        self.status_turns = 0
+        self.charging = None
+        for stat in self.stat_stages:
+            self.stat_stages[stat] = 0
+        self.hash_tracker = None
 
 class Team:
     def __init__(self, pokemon_list: List[Pokemon], battle_mode: BattleMode):
@@ -120,6 +217,9 @@ class Team:
         self.pokemon = pokemon_list
         self.battle_mode = battle_mode
         self.active_pokemon_indices = [0] if battle_mode == BattleMode.SINGLE else [0, 1]
+        self.hash_tracker = None  # set by pokemon_zobrist
+        self.switch_in_hook = None  # called as hook(team, pokemon) after a successful switch
+        self.side: Optional[str] = None  # "player" or "opponent", set by the Battle the team is in
 
     @property
     def active_pokemon(self) -> Union[Pokemon, List[Pokemon]]:
@@ -137,9 +237,14 @@ class Team:
         if 0 <= new_index < len(self.pokemon) and position in [0, 1]:
             if not self.pokemon[new_index].is_fainted() and new_index not in self.active_pokemon_indices:
                 if self.battle_mode == BattleMode.SINGLE:
-                    self.active_pokemon_indices[0] = new_index
-                else:
-                    self.active_pokemon_indices[position] = new_index
+                    position = 0
+                old_index = self.active_pokemon_indices[position]
+                self.pokemon[old_index].charging = None
+                self.active_pokemon_indices[position] = new_index
+                if self.hash_tracker is not None:
+                    self.hash_tracker.active_changed(position, old_index, new_index)
+                if self.switch_in_hook is not None:
+                    self.switch_in_hook(self, self.pokemon[new_index])
                 return True
         return False
 
@@ -152,15 +257,120 @@ class Team:
         """Check if all Pokemon in the team are fainted."""
         return all(p.is_fainted() for p in self.pokemon)
 
+    def reset(self):
+        """Put the team back in its pre-battle state, in place, so it can start another battle.
+
+        Per-battle bindings (the zobrist tracker and the ability switch-in hook) are
+        dropped; a new Battle sets them up again.
+        """
+        for pokemon in self.pokemon:
+            pokemon.reset()
+        self.active_pokemon_indices[:] = [0] if self.battle_mode == BattleMode.SINGLE else [0, 1]
+        self.hash_tracker = None
+        self.switch_in_hook = None
+
+
+@dataclass(frozen=True)
+class TeamTemplate:
+    """Species, level and chosen moves of a team, from which battle-ready Teams are built.
+
+    Stats (under `stat_preset`, see pokemon_stats) and Move objects are looked up once
+    per template, so instantiate() only
+    allocates the Pokemon and the Team itself; Moves are shared between instances since
+    battles never modify them. Use a TeamPool to reuse whole Teams between battles.
+    """
+    species: Tuple[str, ...]
+    moves: Tuple[Tuple[str, ...], ...]
+    level: int = 50
+    stat_preset: str = DEFAULT_STAT_PRESET
+    _prototypes: tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if len(self.species) != 6 or len(self.moves) != 6:
+            raise ValueError("A team template must have exactly 6 Pokemon")
+        prototypes = []
+        table = stat_table(self.stat_preset)
+        for name, move_names in zip(self.species, self.moves):
+            data = POKEMON_DATA[name]
+            prototypes.append((name, data['types'], tuple(Move.from_data(m) for m in move_names),
+                               *table.lookup(name, self.level), data['abilities'][0] if data['abilities'] else None))
+        object.__setattr__(self, '_prototypes', tuple(prototypes))
+
+    @classmethod
+    def from_names(cls, names: Sequence[str], level: int = 50, rng: Optional[random.Random] = None,
+                   stat_preset: str = DEFAULT_STAT_PRESET) -> "TeamTemplate":
+        """Sample movesets the way Pokemon.from_data does (same draws from `rng`)."""
+        rng = rng if rng is not None else random
+        moves = []
+        for name in names:
+            available_moves = POKEMON_DATA[name]['moves']
+            moves.append(tuple(rng.sample(available_moves, min(4, len(available_moves)))))
+        return cls(tuple(names), tuple(moves), level, stat_preset)
+
+    @classmethod
+    def from_team(cls, team: Team, stat_preset: str = DEFAULT_STAT_PRESET) -> "TeamTemplate":
+        """Template of an existing team's species and moves (at the first Pokemon's level)."""
+        return cls(tuple(p.name for p in team.pokemon), tuple(tuple(m.name for m in p.moves) for p in team.pokemon),
+                   team.pokemon[0].level, stat_preset)
+
+    def instantiate(self, battle_mode: BattleMode) -> Team:
+        """A fresh Team at full health."""
+        return Team([Pokemon(name=name, level=self.level, types=types, moves=list(moves), hp=hp, attack=attack,
+                             defense=defense, special_attack=special_attack, special_defense=special_defense,
+                             speed=speed, current_hp=hp, ability=ability)
+                     for name, types, moves, hp, attack, defense, special_attack, special_defense, speed, ability
+                     in self._prototypes], battle_mode)
+
+
+class TeamPool:
+    """Recycles the Teams of one template: release() resets a team and acquire() hands it out again."""
+
+    def __init__(self, template: TeamTemplate, battle_mode: BattleMode):
+        self.template = template
+        self.battle_mode = battle_mode
+        self.free: List[Team] = []
+
+    def acquire(self) -> Team:
+        return self.free.pop() if self.free else self.template.instantiate(self.battle_mode)
+
+    def release(self, team: Team):
+        team.reset()
+        self.free.append(team)
+
 class Battle:
-    def __init__(self, player_team: Team, opponent_team: Team):
+    def __init__(self, player_team: Team, opponent_team: Team, verbose: bool = True,
+                 rng: Optional[random.Random] = None, abilities: bool = False):
+        """Set up a battle between two teams.
+
+        Args:
+            player_team: The player's team
+            opponent_team: The opponent's team, using the same battle mode
+            verbose: Print the battle log to stdout (disable for simulations)
+            rng: Random source for accuracy checks and damage rolls (defaults to the global random module)
+            abilities: Apply the abilities of the Pokemon in play (see pokemon_abilities)
+        """
         if player_team.battle_mode != opponent_team.battle_mode:
             raise ValueError("Both teams must use the same battle mode")
         self.player_team = player_team
         self.opponent_team = opponent_team
+        player_team.side, opponent_team.side = "player", "opponent"
         self.battle_mode = player_team.battle_mode
         self.turn_count = 0
         self.last_move_used = None
+        self.verbose = verbose
+        self.log_sink: Optional[Callable[[str], None]] = None  # also receives every message, e.g. to record a replay
+        self.rng = rng if rng is not None else random
+        self.ability_hooks = None
+        if abilities:
+            from pokemon_abilities import AbilityHooks
+            self.ability_hooks = AbilityHooks(self)
+
+    def log(self, message: str):
+        """Print a battle message when running verbosely, and pass it to the log sink if one is set."""
+        if self.verbose:
+            print(message)
+        if self.log_sink is not None:
+            self.log_sink(message)
 
     def calculate_damage(self, attacker: Pokemon, defender: Pokemon, move: Move) -> int:
         """Calculate damage for a move."""
@@ -181,11 +391,14 @@ class Battle:
         damage = ((2 * level / 5 + 2) * move.power * (attack / defense) / 50 + 2)
         
         # damage roll
-        damage *= random.uniform(0.85, 1.00)
+        damage *= self.rng.uniform(0.85, 1.00)
 
         #type effectiveness
         for type in defender.types:
-            damage *= TYPES_DATA[move.type][type]
+            damage *= get_type_effectiveness(move.type, type)
+
+        if attacker.status == "burn" and move.damage_class == "physical":
+            damage *= 0.5
         
         return int(damage)
 
@@ -197,25 +410,162 @@ class Battle:
             return stat * 2 / (2 - stage)
         return stat
 
+    def effective_speed(self, pokemon: Pokemon) -> float:
+        """Speed after stat stages and paralysis, used for turn order."""
+        speed = self.apply_stat_stages(pokemon.speed, pokemon.stat_stages["speed"])
+        if pokemon.status == "paralysis":
+            speed *= 0.5
+        return speed
+
+    def action_order_key(self, pokemon: Pokemon, action: tuple) -> tuple:
+        """Sort key for turn order: move priority first, then speed."""
+        priority = action[1].priority if action[0] == 'move' else 0
+        return priority, self.effective_speed(pokemon)
+
+    def can_move(self, pokemon: Pokemon) -> bool:
+        """Check whether sleep, freeze or paralysis stops a Pokemon from moving this turn."""
+        if pokemon.status == "sleep":
+            if pokemon.status_turns > 0:
+                pokemon.status_turns -= 1
+                self.log(f"{pokemon.name} is fast asleep.")
+                return False
+            pokemon.set_status(None)
+            self.log(f"{pokemon.name} woke up!")
+        elif pokemon.status == "freeze":
+            if self.rng.randint(1, 5) > 1:
+                self.log(f"{pokemon.name} is frozen solid!")
+                return False
+            pokemon.set_status(None)
+            self.log(f"{pokemon.name} thawed out!")
+        elif pokemon.status == "paralysis" and self.rng.randint(1, 4) == 1:
+            self.log(f"{pokemon.name} is fully paralyzed!")
+            return False
+        return True
+
+    def inflict_status(self, pokemon: Pokemon, status: str) -> bool:
+        """Give a Pokemon a major status condition unless it already has one or is immune."""
+        if pokemon.status is not None or pokemon.is_fainted():
+            return False
+        if any(t in STATUS_IMMUNE_TYPES.get(status, ()) for t in pokemon.types):
+            return False
+        pokemon.set_status(status)
+        pokemon.status_turns = self.rng.randint(1, 3) if status == "sleep" else 1 if status == "bad-poison" else 0
+        self.log(f"{pokemon.name} is now affected by {status}!")
+        return True
+
+    def begin_move(self, attacker: Pokemon, move: Move) -> Tuple[Optional[bool], int]:
+        """Everything that happens before a move targets anything: status checks, charging, hit count.
+
+        Returns:
+            (None, number of hits) if the move goes ahead, otherwise (what
+            execute_move returns, 0): False if the attacker could not move, True if
+            it started charging
+        """
+        if attacker.status is not None and not self.can_move(attacker):
+            return False, 0
+
+        # Charge and multi-hit opcodes act before the hit
+        hits = 1
+        for op in move.effects:
+            if op[0] == OP_CHARGE and attacker.charging != move.name:
+                attacker.charging = move.name
+                self.log(f"{attacker.name} is charging {move.name}!")
+                return True, 0
+            elif op[0] == OP_MULTI_HIT:
+                if op[1] == op[2]:
+                    hits = op[1]
+                elif (op[1], op[2]) == (2, 5):
+                    hits = self.rng.choice(MULTI_HIT_COUNTS)
+                else:
+                    hits = self.rng.randint(op[1], op[2])
+        attacker.charging = None
+        return None, hits
+
     def execute_move(self, attacker: Pokemon, defender: Pokemon, move: Move) -> bool:
         """Execute a move and return whether it was successful."""
+        result, hits = self.begin_move(attacker, move)
+        if result is not None:
+            return result
+
         # Check if move hits
-        if random.randint(1, 100) > move.accuracy:
-            print(f"{attacker.name}'s {move.name} missed!")
+        if self.rng.randint(1, 100) > move.accuracy:
+            self.log(f"{attacker.name}'s {move.name} missed!")
             return False
 
-        # Calculate and apply damage
-        damage = self.calculate_damage(attacker, defender, move)
-        defender.take_damage(damage)
-        print(f"{attacker.name} used {move.name}!")
-        print(f"It dealt {damage} damage to {defender.name}!")
+        self.log(f"{attacker.name} used {move.name}!")
+        damage = 0
+        if move.damage_class != "status":
+            # Calculate and apply damage
+            for hit in range(hits):
+                hit_damage = self.calculate_damage(attacker, defender, move)
+                defender.take_damage(hit_damage)
+                damage += hit_damage
+                if defender.is_fainted():
+                    hits = hit + 1
+                    break
+            self.log(f"It dealt {damage} damage to {defender.name}!")
+            if hits > 1:
+                self.log(f"It hit {hits} times!")
+
+        if move.effects and (damage > 0 or move.damage_class == "status"):
+            self.apply_move_effects(attacker, defender, move, damage)
         
         # Check if defender fainted
         if defender.is_fainted():
-            print(f"{defender.name} fainted!")
+            self.log(f"{defender.name} fainted!")
         
         return True
 
+    def apply_move_effects(self, attacker: Pokemon, defender: Pokemon, move: Move, damage: int):
+        """Run a move's post-hit opcodes: stat stages, status, recoil, drain and healing."""
+        for op in move.effects:
+            code = op[0]
+            if code == OP_STAT_STAGE:
+                target = attacker if op[1] == USER else defender
+                if target.is_fainted() or (op[4] < 100 and self.rng.randint(1, 100) > op[4]):
+                    continue
+                if target.change_stat_stage(op[2], op[3]):
+                    change = "rose" if op[3] > 0 else "fell"
+                    self.log(f"{target.name}'s {op[2].replace('_', ' ')} {change}!")
+            elif code == OP_STATUS:
+                if op[2] < 100 and self.rng.randint(1, 100) > op[2]:
+                    continue
+                self.inflict_status(defender, op[1])
+            elif code == OP_RECOIL:
+                if damage > 0:
+                    attacker.take_damage(max(1, int(damage * op[1])))
+                    self.log(f"{attacker.name} is damaged by recoil!")
+                    if attacker.is_fainted():
+                        self.log(f"{attacker.name} fainted!")
+            elif code == OP_DRAIN:
+                if damage > 0:
+                    attacker.heal(max(1, int(damage * op[1])))
+                    self.log(f"{defender.name} had its energy drained!")
+            elif code == OP_HEAL:
+                attacker.heal(attacker.hp * op[1])
+                self.log(f"{attacker.name} regained health!")
+
+    def apply_end_of_turn(self):
+        """Deal end-of-turn burn and poison damage to the active Pokemon."""
+        for team in (self.player_team, self.opponent_team):
+            for index in team.active_pokemon_indices:
+                pokemon = team.pokemon[index]
+                if pokemon.status is None or pokemon.is_fainted():
+                    continue
+                if pokemon.status == "burn":
+                    damage = pokemon.hp / 16
+                elif pokemon.status == "poison":
+                    damage = pokemon.hp / 8
+                elif pokemon.status == "bad-poison":
+                    damage = pokemon.hp * pokemon.status_turns / 16
+                    pokemon.status_turns = min(15, pokemon.status_turns + 1)
+                else:
+                    continue
+                pokemon.take_damage(max(1, int(damage)))
+                self.log(f"{pokemon.name} is hurt by its {pokemon.status}!")
+                if pokemon.is_fainted():
+                    self.log(f"{pokemon.name} fainted!")
+
     def execute_turn(self, player_actions: Union[tuple, List[tuple]], opponent_actions: Union[tuple, List[tuple]]):
         """Execute a single turn of battle.
         
@@ -225,28 +575,29 @@ class Battle:
             opponent_actions: Same format as player_actions
         """
         self.turn_count += 1
-        print(f"\nTurn {self.turn_count}")
+        self.log(f"\nTurn {self.turn_count}")
 
         if self.battle_mode == BattleMode.SINGLE:
             # Handle switching first
             if player_actions[0] == 'switch':
                 self.player_team.switch_pokemon(0, player_actions[1])
-                print(f"Player switched to {self.player_team.active_pokemon.name}!")
+                self.log(f"Player switched to {self.player_team.active_pokemon.name}!")
             
             if opponent_actions[0] == 'switch':
                 self.opponent_team.switch_pokemon(0, opponent_actions[1])
-                print(f"Opponent switched to {self.opponent_team.active_pokemon.name}!")
+                self.log(f"Opponent switched to {self.opponent_team.active_pokemon.name}!")
 
             # If both players switched, end turn
             if player_actions[0] == 'switch' and opponent_actions[0] == 'switch':
+                self.apply_end_of_turn()
                 return
 
-            # Determine turn order based on speed
-            player_speed = self.player_team.active_pokemon.speed
-            opponent_speed = self.opponent_team.active_pokemon.speed
+            # Determine turn order based on move priority, then speed
+            player_key = self.action_order_key(self.player_team.active_pokemon, player_actions)
+            opponent_key = self.action_order_key(self.opponent_team.active_pokemon, opponent_actions)
 
             # Execute moves in order
-            if player_speed >= opponent_speed:
+            if player_key >= opponent_key:
                 if player_actions[0] == 'move':
                     self.execute_move(self.player_team.active_pokemon, 
                                     self.opponent_team.active_pokemon, 
@@ -267,14 +618,12 @@ class Battle:
         else:  # Double battle
             # Handle switching first
             for i, action in enumerate(player_actions):
-                if action[0] == 'switch':
-                    self.player_team.switch_pokemon(i, action[1])
-                    print(f"Player switched to {self.player_team.active_pokemon[i].name}!")
+                if action[0] == 'switch' and self.player_team.switch_pokemon(i, action[1]):
+                    self.log(f"Player switched to {self.player_team.active_pokemon[i].name}!")
             
             for i, action in enumerate(opponent_actions):
-                if action[0] == 'switch':
-                    self.opponent_team.switch_pokemon(i, action[1])
-                    print(f"Opponent switched to {self.opponent_team.active_pokemon[i].name}!")
+                if action[0] == 'switch' and self.opponent_team.switch_pokemon(i, action[1]):
+                    self.log(f"Opponent switched to {self.opponent_team.active_pokemon[i].name}!")
 
             # Get all active Pokemon and their speeds
             active_pokemon = [
@@ -284,8 +633,8 @@ class Battle:
                 (self.opponent_team.active_pokemon[1], opponent_actions[1], 'opponent', 1)
             ]
 
-            # Sort by speed
-            active_pokemon.sort(key=lambda x: x[0].speed, reverse=True)
+            # Sort by move priority, then speed
+            active_pokemon.sort(key=lambda x: self.action_order_key(x[0], x[1]), reverse=True)
 
             # Execute moves in order
             for pokemon, action, team, position in active_pokemon:
@@ -299,6 +648,8 @@ class Battle:
                     if not target.is_fainted():
                         self.execute_move(pokemon, target, action[1])
 
+        self.apply_end_of_turn()
+
     def is_battle_over(self) -> bool:
         """Check if the battle is over."""
         return self.player_team.is_defeated() or self.opponent_team.is_defeated()
@@ -314,26 +665,8 @@ def main():
     battle_mode = BattleMode.DOUBLE if input("Choose battle mode (single/double): ").lower() == "double" else BattleMode.SINGLE
     
     # Create two teams of 6 Pokemon
-    player_pokemon = [
-        Pokemon.from_data("charizard"),
-        Pokemon.from_data("blastoise"),
-        Pokemon.from_data("venusaur"),
-        Pokemon.from_data("pikachu"),
-        Pokemon.from_data("snorlax"),
-        Pokemon.from_data("gyarados")
-    ]
-    
-    opponent_pokemon = [
-        Pokemon.from_data("tyranitar"),
-        Pokemon.from_data("metagross"),
-        Pokemon.from_data("salamence"),
-        Pokemon.from_data("garchomp"),
-        Pokemon.from_data("dragonite"),
-        Pokemon.from_data("hydreigon")
-    ]
-    
-    player_team = Team(player_pokemon, battle_mode)
-    opponent_team = Team(opponent_pokemon, battle_mode)
+    player_team = TeamTemplate.from_names(DEFAULT_PLAYER_TEAM).instantiate(battle_mode)
+    opponent_team = TeamTemplate.from_names(DEFAULT_OPPONENT_TEAM).instantiate(battle_mode)
     
     # Create adversary for opponent team
     from pokemon_adversary import Adversary
@@ -0,0 +1,227 @@
+from typing import Optional
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import weakref
+import argparse
+import functools
+
+from pokemon_battle import Team, BattleMode, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+from pokemon_stats import STAT_NAMES, DEFAULT_STAT_PRESET
+from pokemon_matchup import MatchupEstimate, MatchupSimulator, TeamSpec, estimate_win_rate
+
+# Code and data that decide battle outcomes; changing any of them invalidates cached results
+ENGINE_FILES = [
+    "pokemon_battle.py",
+    "pokemon_adversary.py",
+    "pokemon_abilities.py",
+    "pokemon_damage.py",
+    "pokemon_endgame.py",
+    "pokemon_env.py",
+    "pokemon_selfplay.py",
+    "pokemon_zobrist.py",
+    "pokemon_stats.py",
+    "src/collected-data/pokemon_data.json",
+    "src/collected-data/moves_data.json",
+    "src/collected-data/move_effects.json",
+    "src/collected-data/types_data.json",
+    "src/collected-data/abilities_data.json",
+]
+
+DEFAULT_CACHE_PATH = "simulation_cache.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matchups (
+    key TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    description TEXT NOT NULL,
+    wins INTEGER NOT NULL,
+    losses INTEGER NOT NULL,
+    draws INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS streams (
+    key TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    next INTEGER NOT NULL
+)
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def engine_fingerprint(root: str = ".") -> str:
+    """Hash of the engine code and data bundle, so results from a different engine are never reused."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name in ENGINE_FILES:
+        path = os.path.join(root, name)
+        digest.update(name.encode())
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def canonical_team(spec: TeamSpec, level: int) -> list:
+    """Species, level, moves and stats of each slot, in team order.
+
+    Teams given as species names have their movesets sampled per battle, which is
+    recorded as moves=None, and their stats built under the default preset, which is
+    recorded by name. Built teams record their actual stats, so teams that differ only
+    in stat preset get different keys.
+    """
+    if isinstance(spec, Team):
+        return [[p.name, p.level, [m.name for m in p.moves], [getattr(p, stat) for stat in STAT_NAMES]]
+                for p in spec.pokemon]
+    return [[name, level, None, DEFAULT_STAT_PRESET] for name in spec]
+
+
+class SimulationCache:
+    """SQLite store of matchup results that later runs add to.
+
+    Each row holds the sufficient statistics (wins, losses, draws) of one matchup under
+    one engine fingerprint. simulator() resumes a matchup from the stored counts and
+    save() adds whatever was simulated since, so repeated sweeps only pay for the
+    battles they need beyond what is already known. Each matchup's battles are seeded
+    from its key, and every simulator plays its own battle stream, reserved in the
+    database, so extending a stored matchup plays new battles rather than replaying old
+    ones, even with several processes extending the same matchup at once.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, fingerprint: Optional[str] = None):
+        self.path = path
+        self.fingerprint = fingerprint or engine_fingerprint()
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        # simulator -> (key, description, counts already in the database)
+        self._loaded = weakref.WeakKeyDictionary()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def describe(self, player: TeamSpec, opponent: TeamSpec, battle_mode: BattleMode = BattleMode.SINGLE,
+                 player_policy: str = "adversary", opponent_policy: str = "adversary",
+                 level: int = 50, max_turns: int = 200) -> str:
+        """Canonical JSON description of a matchup."""
+        return json.dumps({
+            "player": canonical_team(player, level),
+            "opponent": canonical_team(opponent, level),
+            "battle_mode": battle_mode.value,
+            "player_policy": player_policy,
+            "opponent_policy": opponent_policy,
+            "max_turns": max_turns,
+        }, sort_keys=True, separators=(",", ":"))
+
+    def key(self, description: str) -> str:
+        return hashlib.blake2b(f"{self.fingerprint}:{description}".encode(), digest_size=16).hexdigest()
+
+    def lookup(self, key: str) -> MatchupEstimate:
+        """Stored results for a matchup key (all zero if it was never simulated)."""
+        row = self.connection.execute("SELECT wins, losses, draws FROM matchups WHERE key = ?", (key,)).fetchone()
+        return MatchupEstimate(*row) if row else MatchupEstimate()
+
+    def reserve_stream(self, key: str) -> int:
+        """A battle stream of a matchup that no other caller, in any process, has been or will be given."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO streams (key, engine, next) VALUES (?, ?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET next = next + 1", (key, self.fingerprint))
+            return self.connection.execute("SELECT next FROM streams WHERE key = ?", (key,)).fetchone()[0] - 1
+
+    def add(self, key: str, description: str, wins: int, losses: int, draws: int):
+        """Add results to a matchup; concurrent writers each add their own counts.
+
+        The battles behind the counts must come from a stream reserved with
+        reserve_stream, so that no two writers count the same battle.
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO matchups (key, engine, description, wins, losses, draws, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "wins = wins + excluded.wins, losses = losses + excluded.losses, "
+                "draws = draws + excluded.draws, updated = excluded.updated",
+                (key, self.fingerprint, description, wins, losses, draws, time.time()))
+
+    def simulator(self, player: TeamSpec, opponent: TeamSpec, battle_mode: BattleMode = BattleMode.SINGLE,
+                  player_policy: str = "adversary", opponent_policy: str = "adversary",
+                  level: int = 50, max_turns: int = 200) -> MatchupSimulator:
+        """A MatchupSimulator on a newly reserved stream that starts from the stored results of this matchup."""
+        description = self.describe(player, opponent, battle_mode, player_policy, opponent_policy, level, max_turns)
+        key = self.key(description)
+        simulator = MatchupSimulator(player, opponent, battle_mode, player_policy, opponent_policy,
+                                     level=level, max_turns=max_turns, seed=int(key[:12], 16),
+                                     stream=self.reserve_stream(key))
+        simulator.estimate = self.lookup(key)
+        counts = (simulator.estimate.wins, simulator.estimate.losses, simulator.estimate.draws)
+        self._loaded[simulator] = (key, description, counts)
+        return simulator
+
+    def save(self, simulator: MatchupSimulator):
+        """Add the battles a simulator from simulator() played since it was loaded (or last saved)."""
+        key, description, (wins, losses, draws) = self._loaded[simulator]
+        estimate = simulator.estimate
+        if estimate.battles > wins + losses + draws:
+            self.add(key, description, estimate.wins - wins, estimate.losses - losses, estimate.draws - draws)
+        self._loaded[simulator] = (key, description, (estimate.wins, estimate.losses, estimate.draws))
+
+    def stats(self) -> dict:
+        rows, battles = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(wins + losses + draws), 0) FROM matchups WHERE engine = ?",
+            (self.fingerprint,)).fetchone()
+        stale = self.connection.execute("SELECT COUNT(*) FROM matchups WHERE engine != ?",
+                                        (self.fingerprint,)).fetchone()[0]
+        return {"matchups": rows, "battles": battles, "stale_matchups": stale}
+
+    def prune(self) -> int:
+        """Delete results recorded under other engine fingerprints; returns the number of rows removed."""
+        with self.connection:
+            self.connection.execute("DELETE FROM streams WHERE engine != ?", (self.fingerprint,))
+            return self.connection.execute("DELETE FROM matchups WHERE engine != ?", (self.fingerprint,)).rowcount
+
+
+def cached_win_rate(cache: SimulationCache, player: TeamSpec, opponent: TeamSpec, **kwargs) -> MatchupEstimate:
+    """estimate_win_rate that starts from, and adds to, the cached results of the matchup."""
+    simulator_args = {k: kwargs.pop(k) for k in ("battle_mode", "player_policy", "opponent_policy", "level",
+                                                 "max_turns") if k in kwargs}
+    simulator = cache.simulator(player, opponent, **simulator_args)
+    estimate = estimate_win_rate(simulator, **kwargs)
+    cache.save(simulator)
+    return estimate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate a matchup win rate, reusing cached simulation results.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--width", type=float, default=0.1)
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--stats", action="store_true", help="Print cache statistics and exit")
+    parser.add_argument("--prune", action="store_true", help="Delete results from other engine versions and exit")
+    args = parser.parse_args()
+
+    with SimulationCache(args.cache) as cache:
+        if args.prune:
+            print(f"Removed {cache.prune()} stale matchups")
+            return
+        if args.stats:
+            print(f"Engine {cache.fingerprint}: {cache.stats()}")
+            return
+        battle_mode = BattleMode.DOUBLE if args.mode == "double" else BattleMode.SINGLE
+        before = cache.lookup(cache.key(cache.describe(DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM, battle_mode)))
+        started = time.perf_counter()
+        estimate = cached_win_rate(cache, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM, battle_mode=battle_mode,
+                                   width=args.width)
+        low, high = estimate.interval()
+        print(f"Win rate {estimate.win_rate:.3f} [{low:.3f}, {high:.3f}] from {estimate.battles} battles, "
+              f"{estimate.battles - before.battles} simulated now in {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
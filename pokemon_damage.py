@@ -0,0 +1,253 @@
+from typing import Dict, List, Optional, Sequence
+import math
+import time
+import random
+import argparse
+import numpy as np
+
+from pokemon_battle import (Pokemon, Move, Battle, Team, BattleMode, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM,
+                            OP_MULTI_HIT, MULTI_HIT_COUNTS, get_type_effectiveness)
+
+ROLL_LOW = 0.85
+ROLL_HIGH = 1.00
+
+
+def _stage_multiplier(stage: int) -> float:
+    """Same scaling as Battle.apply_stat_stages."""
+    if stage > 0:
+        return (2 + stage) / 2
+    elif stage < 0:
+        return 2 / (2 - stage)
+    return 1.0
+
+
+def damage_scale(attacker: Pokemon, defender: Pokemon, move: Move,
+                 attacker_stages: Optional[Dict[str, int]] = None,
+                 defender_stages: Optional[Dict[str, int]] = None) -> float:
+    """Damage of one hit before the random roll, i.e. hit damage = int(scale * roll).
+
+    Mirrors Battle.calculate_damage: base formula, stat stages, type effectiveness and
+    burn. Abilities are not included.
+
+    Args:
+        attacker_stages: Stat stages to use instead of the attacker's current ones
+        defender_stages: Stat stages to use instead of the defender's current ones
+    """
+    if move.damage_class == "status":
+        return 0.0
+    attacker_stages = attacker_stages if attacker_stages is not None else attacker.stat_stages
+    defender_stages = defender_stages if defender_stages is not None else defender.stat_stages
+    if move.damage_class == "physical":
+        attack = attacker.attack * _stage_multiplier(attacker_stages.get("attack", 0))
+        defense = defender.defense * _stage_multiplier(defender_stages.get("defense", 0))
+    else:
+        attack = attacker.special_attack * _stage_multiplier(attacker_stages.get("special_attack", 0))
+        defense = defender.special_defense * _stage_multiplier(defender_stages.get("special_defense", 0))
+
+    scale = (2 * attacker.level / 5 + 2) * move.power * (attack / defense) / 50 + 2
+    for defender_type in defender.types:
+        scale *= get_type_effectiveness(move.type, defender_type)
+    if attacker.status == "burn" and move.damage_class == "physical":
+        scale *= 0.5
+    return scale
+
+
+def roll_distributions(scales: Sequence[float]) -> np.ndarray:
+    """Exact distribution of int(scale * roll), roll ~ Uniform(0.85, 1.00), for each scale.
+
+    Returns:
+        Array of shape (len(scales), max damage + 1); row i, column k is P(damage = k)
+    """
+    scales = np.asarray(scales, dtype=np.float64)
+    width = int(np.floor(scales.max())) + 1 if len(scales) else 1
+    k = np.arange(width, dtype=np.float64)
+    safe = np.where(scales > 0, scales, 1.0)[:, None]
+    low = np.clip(k / safe, ROLL_LOW, ROLL_HIGH)
+    high = np.clip((k + 1) / safe, ROLL_LOW, ROLL_HIGH)
+    pmfs = (high - low) / (ROLL_HIGH - ROLL_LOW)
+    pmfs[scales <= 0] = 0.0
+    pmfs[scales <= 0, 0] = 1.0
+    return pmfs
+
+
+def hit_count_distribution(move: Move) -> np.ndarray:
+    """P(number of hits = k) for one use of a move that connects, indexed by k."""
+    for op in move.effects:
+        if op[0] == OP_MULTI_HIT:
+            low, high = op[1], op[2]
+            counts = np.zeros(high + 1)
+            if low == high:
+                counts[low] = 1.0
+            elif (low, high) == (2, 5):
+                for hits in MULTI_HIT_COUNTS:
+                    counts[hits] += 1 / len(MULTI_HIT_COUNTS)
+            else:
+                counts[low:high + 1] = 1 / (high - low + 1)
+            return counts
+    return np.array([0.0, 1.0])
+
+
+def _pad_columns(arrays: List[np.ndarray]) -> np.ndarray:
+    width = max(len(a) for a in arrays)
+    out = np.zeros((len(arrays), width))
+    for i, a in enumerate(arrays):
+        out[i, :len(a)] = a
+    return out
+
+
+def _use_spectra(hit_pmfs: np.ndarray, accuracy: np.ndarray, hit_counts: np.ndarray, size: int) -> np.ndarray:
+    """Fourier transform of the per-use damage distribution: a miss, or a random number of hits."""
+    hit_spectra = np.fft.rfft(hit_pmfs, n=size, axis=1)
+    spectra = np.zeros_like(hit_spectra)
+    power = np.ones_like(hit_spectra)
+    for k in range(hit_counts.shape[1]):
+        spectra += hit_counts[:, k:k + 1] * power
+        power *= hit_spectra
+    return (1 - accuracy)[:, None] + accuracy[:, None] * spectra
+
+
+def ko_probabilities(hit_pmfs: np.ndarray, hp: Sequence[float], max_uses: int,
+                     accuracy: Optional[Sequence[float]] = None,
+                     hit_counts: Optional[np.ndarray] = None) -> np.ndarray:
+    """Probability of a KO within 1..max_uses uses, vectorized over rows.
+
+    Each use misses with probability 1 - accuracy, otherwise lands a random number of
+    hits drawn from `hit_counts`, each with an independent damage roll from `hit_pmfs`.
+    The n-use total is the n-fold convolution of the per-use distribution, computed for
+    all rows at once with FFTs; results are exact up to floating-point rounding.
+
+    Args:
+        hit_pmfs: (rows, damage) per-hit damage distributions, e.g. from roll_distributions
+        hp: Remaining HP of the defender for each row
+        max_uses: Largest number of uses to report
+        accuracy: Hit probability per row (defaults to 1)
+        hit_counts: (rows, hits) distribution of hits per use (defaults to one hit)
+
+    Returns:
+        Array of shape (rows, max_uses); column n - 1 is P(KO within n uses)
+    """
+    hit_pmfs = np.atleast_2d(np.asarray(hit_pmfs, dtype=np.float64))
+    rows = len(hit_pmfs)
+    hp = np.broadcast_to(np.asarray(hp, dtype=np.float64), (rows,))
+    accuracy = np.broadcast_to(np.asarray(1.0 if accuracy is None else accuracy, dtype=np.float64), (rows,))
+    if hit_counts is None:
+        hit_counts = np.tile([0.0, 1.0], (rows, 1))
+
+    # Any damage of `cap` or more KOs every row, so larger values can be merged into it
+    needed = np.maximum(np.ceil(hp).astype(np.int64), 1)
+    cap = int(needed.max())
+    if hit_pmfs.shape[1] > cap + 1:
+        hit_pmfs = np.concatenate([hit_pmfs[:, :cap], hit_pmfs[:, cap:].sum(axis=1, keepdims=True)], axis=1)
+    max_total = max((hit_pmfs.shape[1] - 1) * (hit_counts.shape[1] - 1) * max_uses, cap)
+    size = 1 << max(1, math.ceil(math.log2(max_total + 1)))
+
+    use = _use_spectra(hit_pmfs, accuracy, hit_counts, size)
+    out = np.empty((rows, max_uses))
+    total = np.ones_like(use)
+    for n in range(max_uses):
+        total *= use
+        pmf = np.fft.irfft(total, n=size, axis=1)
+        cdf = np.cumsum(pmf, axis=1)
+        survive = np.take_along_axis(cdf, (needed - 1)[:, None], axis=1)[:, 0]
+        out[:, n] = np.clip(1 - survive, 0.0, 1.0)
+    return out
+
+
+def damage_distribution(attacker: Pokemon, defender: Pokemon, move: Move,
+                        attacker_stages: Optional[Dict[str, int]] = None,
+                        defender_stages: Optional[Dict[str, int]] = None) -> np.ndarray:
+    """Exact distribution of the damage dealt by one use of a move, including misses and multi-hit.
+
+    Returns:
+        Array indexed by damage; entry k is P(damage = k)
+    """
+    hit = roll_distributions([damage_scale(attacker, defender, move, attacker_stages, defender_stages)])[0]
+    accuracy = min(move.accuracy, 100) / 100
+    counts = hit_count_distribution(move)
+    total = np.zeros((len(hit) - 1) * (len(counts) - 1) + 1)
+    total[0] += 1 - accuracy
+    multi = np.array([1.0])
+    for k, p in enumerate(counts):
+        if p:
+            total[:len(multi)] += accuracy * p * multi
+        multi = np.convolve(multi, hit)
+    return total
+
+
+def ko_table(attacker: Pokemon, moves: Sequence[Move], defenders: Sequence[Pokemon], max_uses: int = 3,
+             attacker_stages: Optional[Dict[str, int]] = None) -> np.ndarray:
+    """KO probabilities for every (move, defender) pair against the defenders' current HP.
+
+    Returns:
+        Array of shape (len(moves), len(defenders), max_uses)
+    """
+    pairs = [(move, defender) for move in moves for defender in defenders]
+    hit_pmfs = roll_distributions([damage_scale(attacker, d, m, attacker_stages) for m, d in pairs])
+    hit_counts = _pad_columns([hit_count_distribution(m) for m, _ in pairs])
+    accuracy = [min(m.accuracy, 100) / 100 for m, _ in pairs]
+    hp = [d.current_hp for _, d in pairs]
+    table = ko_probabilities(hit_pmfs, hp, max_uses, accuracy, hit_counts)
+    return table.reshape(len(moves), len(defenders), max_uses)
+
+
+def ko_chance(attacker: Pokemon, defender: Pokemon, move: Move, uses: int = 1) -> float:
+    """Probability that `move` KOs `defender` from its current HP within `uses` uses."""
+    return float(ko_table(attacker, [move], [defender], uses)[0, 0, -1])
+
+
+def sample_ko_probabilities(battle: Battle, attacker: Pokemon, defender: Pokemon, move: Move,
+                            max_uses: int, samples: int) -> np.ndarray:
+    """Monte Carlo estimate of the same quantity as ko_table, using the engine's own rolls."""
+    kos = np.zeros(max_uses)
+    hits = hit_count_distribution(move)
+    for _ in range(samples):
+        total = 0
+        for n in range(max_uses):
+            if battle.rng.randint(1, 100) <= move.accuracy:
+                for _ in range(battle.rng.choices(range(len(hits)), hits)[0]):
+                    total += battle.calculate_damage(attacker, defender, move)
+            if total >= defender.current_hp:
+                kos[n:] += 1
+                break
+    return kos / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare exact KO probabilities with sampled ones.")
+    parser.add_argument("--samples", type=int, default=2000, help="Simulated sequences per (move, defender) pair")
+    parser.add_argument("--uses", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    player = Team([Pokemon.from_data(name, rng=rng) for name in DEFAULT_PLAYER_TEAM], BattleMode.SINGLE)
+    opponent = Team([Pokemon.from_data(name, rng=rng) for name in DEFAULT_OPPONENT_TEAM], BattleMode.SINGLE)
+    battle = Battle(player, opponent, verbose=False, rng=rng)
+
+    started = time.perf_counter()
+    tables = [ko_table(attacker, attacker.moves, opponent.pokemon, args.uses) for attacker in player.pokemon]
+    exact_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    worst = 0.0
+    for attacker, table in zip(player.pokemon, tables):
+        for i, move in enumerate(attacker.moves):
+            for j, defender in enumerate(opponent.pokemon):
+                sampled = sample_ko_probabilities(battle, attacker, defender, move, args.uses, args.samples)
+                worst = max(worst, float(np.abs(sampled - table[i, j]).max()))
+    sample_time = time.perf_counter() - started
+
+    pairs = sum(len(a.moves) for a in player.pokemon) * len(opponent.pokemon)
+    print(f"{pairs} (move, defender) pairs, KO within 1..{args.uses} uses")
+    print(f"Exact:   {exact_time * 1000:.1f} ms")
+    print(f"Sampled: {sample_time * 1000:.1f} ms ({args.samples} samples per pair)")
+    print(f"Largest difference between exact and sampled probabilities: {worst:.4f}")
+
+    attacker = player.pokemon[0]
+    print(f"\n{attacker.name} vs {opponent.pokemon[0].name}:")
+    for move, row in zip(attacker.moves, tables[0][:, 0]):
+        print(f"  {move.name:16s} " + "  ".join(f"{n + 1}HKO {p:6.1%}" for n, p in enumerate(row)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+from typing import List, Optional, Sequence, Dict, Iterator, Tuple
+import os
+import time
+import argparse
+import resource
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from pokemon_selfplay import load_manifest
+
+
+class ShardDataset:
+    """Memory-mapped view of a sharded self-play dataset (see pokemon_selfplay).
+
+    Column files are mapped with np.load(mmap_mode='r'), so opening a dataset reads
+    only the manifest and .npy headers; pages are loaded on demand as rows are read.
+    """
+
+    def __init__(self, directory: str, columns: Optional[Sequence[str]] = None):
+        self.directory = directory
+        self.manifest = load_manifest(directory)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No dataset manifest found in {directory}")
+        self.columns = list(columns) if columns is not None else list(self.manifest["columns"])
+        unknown = set(self.columns) - set(self.manifest["columns"])
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+
+        self.shards = []
+        for shard in self.manifest["shards"]:
+            path = os.path.join(directory, shard["name"])
+            self.shards.append({name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                                for name in self.columns})
+        self.shard_sizes = [shard["records"] for shard in self.manifest["shards"]]
+
+    def __len__(self) -> int:
+        return sum(self.shard_sizes)
+
+    def read(self, shard: int, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """Memory-mapped slices of rows [start, stop) of one shard (no copy is made)."""
+        return {name: column[start:stop] for name, column in self.shards[shard].items()}
+
+
+class MinibatchLoader:
+    """Streams shuffled minibatches from a ShardDataset with a block-shuffle buffer.
+
+    Each epoch the dataset is cut into contiguous blocks of `block_size` rows, the block
+    order is permuted, and consecutive groups of `buffer_blocks` blocks are read into a
+    buffer whose rows are shuffled before being cut into minibatches. Reads stay
+    sequential within a block while the row order is well mixed, and only a few buffers
+    are ever resident. Buffers are filled by background threads, `prefetch` buffers
+    ahead of the consumer. The order depends only on (seed, epoch).
+    """
+
+    def __init__(self, dataset: ShardDataset, batch_size: int, block_size: int = 256,
+                 buffer_blocks: int = 64, seed: int = 0, num_threads: int = 2, prefetch: int = 2,
+                 drop_last: bool = False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.block_size = block_size
+        self.buffer_blocks = buffer_blocks
+        self.seed = seed
+        self.num_threads = num_threads
+        self.prefetch = max(1, prefetch)
+        self.drop_last = drop_last
+        self.epoch = 0
+
+        self.blocks: List[Tuple[int, int, int]] = []
+        for shard, size in enumerate(dataset.shard_sizes):
+            for start in range(0, size, block_size):
+                self.blocks.append((shard, start, min(start + block_size, size)))
+
+    def __len__(self) -> int:
+        """Number of minibatches per epoch."""
+        rows = len(self.dataset)
+        return rows // self.batch_size if self.drop_last else -(-rows // self.batch_size)
+
+    def _plan(self, epoch: int) -> List[Tuple[np.ndarray, int]]:
+        rng = np.random.default_rng([self.seed, epoch])
+        order = rng.permutation(len(self.blocks))
+        windows = [order[i:i + self.buffer_blocks] for i in range(0, len(order), self.buffer_blocks)]
+        window_seeds = rng.integers(0, 2**63 - 1, size=len(windows))
+        return list(zip(windows, window_seeds))
+
+    def _load_buffer(self, block_ids: np.ndarray, seed: int) -> Dict[str, np.ndarray]:
+        parts = [self.dataset.read(*self.blocks[i]) for i in block_ids]
+        rows = sum(len(part[self.dataset.columns[0]]) for part in parts)
+        permutation = np.random.default_rng(seed).permutation(rows)
+        buffer = {}
+        for name in self.dataset.columns:
+            column = np.concatenate([part[name] for part in parts])
+            buffer[name] = column[permutation]
+        return buffer
+
+    def iter_epoch(self, epoch: int) -> Iterator[Dict[str, np.ndarray]]:
+        """Yield the minibatches of one epoch as dicts of column arrays."""
+        plan = self._plan(epoch)
+        executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        pending = deque()
+        carry = None
+        try:
+            for block_ids, seed in plan:
+                pending.append(executor.submit(self._load_buffer, block_ids, seed))
+                if len(pending) <= self.prefetch:
+                    continue
+                carry = yield from self._emit(pending.popleft().result(), carry)
+            while pending:
+                carry = yield from self._emit(pending.popleft().result(), carry)
+            if carry is not None and not self.drop_last:
+                yield carry
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _emit(self, buffer: Dict[str, np.ndarray], carry: Optional[Dict[str, np.ndarray]]):
+        if carry is not None:
+            buffer = {name: np.concatenate([carry[name], column]) for name, column in buffer.items()}
+        rows = len(buffer[self.dataset.columns[0]])
+        full = rows - rows % self.batch_size
+        for start in range(0, full, self.batch_size):
+            yield {name: column[start:start + self.batch_size] for name, column in buffer.items()}
+        if full == rows:
+            return None
+        return {name: column[full:] for name, column in buffer.items()}
+
+    def __iter__(self) -> Iterator[Dict[str, np.ndarray]]:
+        """Iterate the next epoch."""
+        epoch = self.epoch
+        self.epoch += 1
+        return self.iter_epoch(epoch)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark minibatch streaming from a sharded self-play dataset.")
+    parser.add_argument("dataset", help="Directory written by pokemon_selfplay.py")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--block-size", type=int, default=256)
+    parser.add_argument("--buffer-blocks", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dataset = ShardDataset(args.dataset)
+    loader = MinibatchLoader(dataset, args.batch_size, block_size=args.block_size,
+                             buffer_blocks=args.buffer_blocks, seed=args.seed, num_threads=args.threads)
+    print(f"{len(dataset)} records in {len(dataset.shard_sizes)} shards, {len(loader)} minibatches per epoch")
+    print(f"Peak RSS after opening: {peak_rss_mb():.1f} MiB")
+
+    for epoch in range(args.epochs):
+        batches = 0
+        rows = 0
+        started = time.perf_counter()
+        for batch in loader:
+            batches += 1
+            rows += len(batch["states"]) if "states" in batch else len(next(iter(batch.values())))
+        elapsed = time.perf_counter() - started
+        print(f"Epoch {epoch}: {batches / elapsed:.1f} minibatches/s, {rows / elapsed:.0f} records/s, "
+              f"peak RSS {peak_rss_mb():.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import sys
+import json
+import math
+import random
+import argparse
+import numpy as np
+
+from pokemon_battle import Battle, BattleMode, Team, TeamPool, TeamTemplate
+from pokemon_cache import engine_fingerprint
+from pokemon_env import replace_fainted
+from pokemon_selfplay import battle_rng, play_battle, random_team_names
+from pokemon_tournament import entrant_factory
+from pokemon_zobrist import TeamHashTracker
+
+TRACE_VERSION = 1
+
+# A golden trace file is JSON lines: a header
+#   {"version": 1, "engine": <pokemon_cache.engine_fingerprint()>, "config": {...}}
+# followed by one battle per line:
+#   {"battle": 0, "seed": 0, "rng_seed": 0, "mode": "single", "level": 50, "max_turns": 200,
+#    "player": {"species": [...6 names], "moves": [[move names] x 6]}, "opponent": {...},
+#    "turns": [{"actions": [player, opponent], "hp": [[side, slot, change], ...],
+#               "fainted": [[side, slot], ...], "active": [[indices], [indices]]}, ...],
+#    "winner": 1 | -1 | 0, "turn_count": n}
+# Actions are lists of [kind, move name or switch index, target] per active slot; side
+# 0 is the player. Each turn lists the HP changes and faints of that turn and the
+# active Pokemon once fainted ones have been replaced. Teams and policy choices are
+# drawn from (seed, battle), while the engine draws from battle_rng(rng_seed, battle)
+# alone, so the recorded actions replay on any engine. Traces that differ only in
+# rng_seed play the same matchups with independent draws (see compare_distributions).
+
+# Golden traces committed with the repo, checked by `python pokemon_difftest.py check` with no file
+# arguments. They were recorded on the engine of commit b00f0be, before the ability hooks and the move
+# opcode table, with seed 0, 40 battles per mode, level 50 and adversary against adversary. Their
+# movesets hold only damaging moves without entries in move_effects.json (config "moves": "plain"), as
+# the opcode table changed the mechanics of the other moves on purpose; every rewrite since must still
+# play these battles exactly as the original execute_turn did.
+GOLDEN_TRACES = ("golden_traces/single.jsonl", "golden_traces/double.jsonl")
+
+# Fields of a turn, in the order a diff reports them
+TURN_FIELDS = ("actions", "hp", "fainted", "active")
+
+
+def encode_actions(actions: Union[tuple, List[tuple]]) -> list:
+    """JSON form of a sanitized single or double battle action."""
+    if isinstance(actions, tuple):
+        actions = [actions]
+    return [[action[0], action[1].name if action[0] == 'move' else action[1], action[2] if len(action) > 2 else 0]
+            for action in actions]
+
+
+def decode_actions(team: Team, encoded: list) -> Union[tuple, List[tuple]]:
+    """Engine actions of `team` for an encode_actions result; moves are looked up by name on the active Pokemon."""
+    active = [team.pokemon[index] for index in team.active_pokemon_indices]
+    actions = []
+    for pokemon, (kind, data, target) in zip(active, encoded):
+        if kind == 'move':
+            moves = [move for move in pokemon.moves if move.name == data]
+            if not moves:
+                raise ValueError(f"{pokemon.name} does not know {data}")
+            data = moves[0]
+        actions.append((kind, data, target))
+    if team.battle_mode == BattleMode.SINGLE:
+        return actions[0][:2]
+    return actions
+
+
+def _team_record(template: TeamTemplate) -> dict:
+    return {"species": list(template.species), "moves": [list(moves) for moves in template.moves]}
+
+
+def _template(record: dict, level: int) -> TeamTemplate:
+    return TeamTemplate(tuple(record["species"]), tuple(tuple(moves) for moves in record["moves"]), level)
+
+
+class BattleTracer:
+    """Builds the trace of a battle; call before_turn with the actions of every turn, then finish()."""
+
+    def __init__(self, battle: Battle):
+        self.battle = battle
+        self.turns: List[dict] = []
+        self._teams = (battle.player_team, battle.opponent_team)
+        self._hp = self._snapshot()
+        self._actions = None
+
+    def _snapshot(self) -> List[List[float]]:
+        return [[pokemon.current_hp for pokemon in team.pokemon] for team in self._teams]
+
+    def _close_turn(self):
+        if self._actions is None:
+            return
+        hp = self._snapshot()
+        changes, fainted = [], []
+        for side, (old_side, new_side) in enumerate(zip(self._hp, hp)):
+            for slot, (old, new) in enumerate(zip(old_side, new_side)):
+                if new != old:
+                    changes.append([side, slot, new - old])
+                    if old > 0 >= new:
+                        fainted.append([side, slot])
+        self.turns.append({"actions": self._actions, "hp": changes, "fainted": fainted,
+                           "active": [list(team.active_pokemon_indices) for team in self._teams]})
+        self._hp = hp
+        self._actions = None
+
+    def before_turn(self, battle: Battle, player_actions, opponent_actions):
+        """Record the actions of the turn about to execute (the play_battle on_turn signature)."""
+        self._close_turn()
+        self._actions = [encode_actions(player_actions), encode_actions(opponent_actions)]
+
+    def finish(self) -> dict:
+        self._close_turn()
+        battle = self.battle
+        winner = 0
+        if battle.is_battle_over():
+            winner = -1 if battle.player_team.is_defeated() else 1
+        return {"turns": self.turns, "winner": winner, "turn_count": battle.turn_count}
+
+
+def record_battle(battle_id: int, seed: int = 0, battle_mode: BattleMode = BattleMode.SINGLE,
+                  player: str = "adversary", opponent: str = "adversary", level: int = 50,
+                  max_turns: int = 200, rng_seed: Optional[int] = None) -> dict:
+    """Play one seeded battle between two entrants (see pokemon_tournament) on the reference engine and trace it.
+
+    Args:
+        seed: Seed of the teams and the policies' random choices
+        rng_seed: Seed of the engine's draws (defaults to `seed`)
+    """
+    rng_seed = seed if rng_seed is None else rng_seed
+    team_rng = random.Random(f"teams:{seed}:{battle_id}")
+    templates = [TeamTemplate.from_names(random_team_names(team_rng), level, team_rng) for _ in range(2)]
+    player_team, opponent_team = (template.instantiate(battle_mode) for template in templates)
+    battle = Battle(player_team, opponent_team, verbose=False, rng=battle_rng(rng_seed, battle_id))
+    policy_rng = random.Random(f"policies:{seed}:{battle_id}")
+    tracer = BattleTracer(battle)
+    play_battle(battle, entrant_factory(player)(player_team, battle_mode, rng=policy_rng),
+                entrant_factory(opponent)(opponent_team, battle_mode, rng=policy_rng), max_turns,
+                on_turn=tracer.before_turn)
+    return dict({"battle": battle_id, "seed": seed, "rng_seed": rng_seed, "mode": battle_mode.value, "level": level,
+                 "max_turns": max_turns, "player": _team_record(templates[0]),
+                 "opponent": _team_record(templates[1])}, **tracer.finish())
+
+
+class ReferenceEngine:
+    """Replays traced battles with fresh Teams and Battle.execute_turn, the way play_battle drives them.
+
+    Subclasses change how teams and battles are set up; replay() returns the trace of
+    the replayed battle, with an "error" entry if a recorded action could not be
+    played (which only happens once the battle has already diverged).
+    """
+
+    def teams(self, record: dict) -> Tuple[Team, Team]:
+        mode = BattleMode(record["mode"])
+        return (_template(record["player"], record["level"]).instantiate(mode),
+                _template(record["opponent"], record["level"]).instantiate(mode))
+
+    def release(self, record: dict, teams: Tuple[Team, Team]):
+        pass
+
+    def battle(self, record: dict, teams: Tuple[Team, Team]) -> Battle:
+        return Battle(*teams, verbose=False, rng=battle_rng(record["rng_seed"], record["battle"]))
+
+    def replay(self, record: dict) -> dict:
+        teams = self.teams(record)
+        battle = self.battle(record, teams)
+        tracer = BattleTracer(battle)
+        error = None
+        for turn in record["turns"]:
+            if battle.is_battle_over() or battle.turn_count >= record["max_turns"]:
+                break
+            try:
+                player_actions = decode_actions(battle.player_team, turn["actions"][0])
+                opponent_actions = decode_actions(battle.opponent_team, turn["actions"][1])
+            except (ValueError, IndexError) as e:
+                error = f"turn {battle.turn_count + 1}: {e}"
+                break
+            tracer.before_turn(battle, player_actions, opponent_actions)
+            battle.execute_turn(player_actions, opponent_actions)
+            if not battle.is_battle_over():
+                replace_fainted(battle.player_team)
+                replace_fainted(battle.opponent_team)
+        trace = dict({key: record[key] for key in ("battle", "seed", "rng_seed", "mode", "level", "max_turns",
+                                                   "player", "opponent")}, **tracer.finish())
+        if error is not None:
+            trace["error"] = error
+        self.release(record, teams)
+        return trace
+
+
+class PooledEngine(ReferenceEngine):
+    """Teams come from per-template TeamPools, so every battle after the first runs on reset() teams."""
+
+    def __init__(self):
+        self.pools: Dict[tuple, TeamPool] = {}
+
+    def _pool(self, record: dict, side: str) -> TeamPool:
+        key = (record["mode"], record["level"], json.dumps(record[side]))
+        if key not in self.pools:
+            self.pools[key] = TeamPool(_template(record[side], record["level"]), BattleMode(record["mode"]))
+        return self.pools[key]
+
+    def teams(self, record: dict) -> Tuple[Team, Team]:
+        return self._pool(record, "player").acquire(), self._pool(record, "opponent").acquire()
+
+    def release(self, record: dict, teams: Tuple[Team, Team]):
+        self._pool(record, "player").release(teams[0])
+        self._pool(record, "opponent").release(teams[1])
+
+
+class HashedEngine(ReferenceEngine):
+    """Both teams carry incremental Zobrist hash trackers, whose hooks run inside every state change."""
+
+    def teams(self, record: dict) -> Tuple[Team, Team]:
+        teams = super().teams(record)
+        for team in teams:
+            TeamHashTracker(team)
+        return teams
+
+
+ENGINES = {
+    "reference": ReferenceEngine,
+    "pooled": PooledEngine,
+    "hashed": HashedEngine,
+}
+
+
+def diff_traces(expected: dict, actual: dict) -> Optional[str]:
+    """First difference between two traces of the same battle, or None if they agree."""
+    if "error" in actual:
+        return actual["error"]
+    for index, (old, new) in enumerate(zip(expected["turns"], actual["turns"])):
+        for key in TURN_FIELDS:
+            if old[key] != new[key]:
+                return f"turn {index + 1} {key}: expected {old[key]}, got {new[key]}"
+    for key in ("turn_count", "winner"):
+        if expected[key] != actual[key]:
+            return f"{key}: expected {expected[key]}, got {actual[key]}"
+    return None
+
+
+def check_engine(engine: ReferenceEngine, records: Iterable[dict]) -> List[Tuple[int, str]]:
+    """Replay every record on `engine`; returns (battle, first difference) for each battle that diverged."""
+    failures = []
+    for record in records:
+        difference = diff_traces(record, engine.replay(record))
+        if difference is not None:
+            failures.append((record["battle"], difference))
+    return failures
+
+
+def save_traces(path: str, records: Iterable[dict], config: dict):
+    with open(path, 'w') as f:
+        f.write(json.dumps({"version": TRACE_VERSION, "engine": engine_fingerprint(), "config": config}) + "\n")
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def load_traces(path: str) -> Tuple[dict, List[dict]]:
+    """(header, battle records) of a trace file."""
+    with open(path, 'r') as f:
+        header = json.loads(f.readline())
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} trace file")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def chi_square_p_value(a: Sequence[int], b: Sequence[int]) -> float:
+    """p-value of a chi-square test that two samples of category counts share one distribution."""
+    table = np.array([a, b], dtype=float)
+    table = table[:, table.sum(axis=0) > 0]
+    if table.shape[1] < 2 or (table.sum(axis=1) == 0).any():
+        return 1.0
+    expected = table.sum(axis=1, keepdims=True) * table.sum(axis=0) / table.sum()
+    statistic = ((table - expected) ** 2 / expected).sum()
+    degrees = table.shape[1] - 1
+    if degrees > 2:
+        raise ValueError("Only 2 or 3 categories are supported")
+    # Chi-square survival function with 1 or 2 degrees of freedom
+    if degrees == 1:
+        return math.erfc(math.sqrt(statistic / 2))
+    return math.exp(-statistic / 2)
+
+
+def ks_p_value(a: Sequence[float], b: Sequence[float]) -> Tuple[float, float]:
+    """(statistic, asymptotic p-value) of a two-sample Kolmogorov-Smirnov test."""
+    a, b = np.sort(np.asarray(a, dtype=float)), np.sort(np.asarray(b, dtype=float))
+    if len(a) == 0 or len(b) == 0:
+        return 0.0, 1.0
+    values = np.concatenate([a, b])
+    statistic = float(np.abs(np.searchsorted(a, values, side="right") / len(a)
+                             - np.searchsorted(b, values, side="right") / len(b)).max())
+    n = math.sqrt(len(a) * len(b) / (len(a) + len(b)))
+    x = (n + 0.12 + 0.11 / n) * statistic
+    if x < 0.2:
+        return statistic, 1.0
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * x * x) for k in range(1, 101))
+    return statistic, min(1.0, max(0.0, p))
+
+
+def trace_statistics(records: Sequence[dict]) -> dict:
+    """Per-battle samples for the statistical comparison (one value per battle, so samples are independent)."""
+    damage = []
+    for r in records:
+        hits = [-change for t in r["turns"] for _, _, change in t["hp"] if change < 0]
+        damage.append(sum(hits) / len(hits) if hits else 0.0)
+    return {
+        "outcomes": [sum(r["winner"] == w for r in records) for w in (1, 0, -1)],
+        "turns": [r["turn_count"] for r in records],
+        "damage": damage,
+        "faints": [sum(len(t["fainted"]) for t in r["turns"]) for r in records],
+    }
+
+
+def compare_distributions(expected: Sequence[dict], actual: Sequence[dict]) -> List[Tuple[str, str, float]]:
+    """Statistical comparison of two sets of traces, for engines that cannot reproduce the reference draws.
+
+    Both sets should play the same matchups (record them with the same seed and
+    different rng_seeds), so that only the engine's randomness differs. Outcomes
+    (win/draw/loss) get a chi-square test; battle length, mean HP lost per damaging
+    event and faints per battle a two-sample Kolmogorov-Smirnov test.
+
+    Returns:
+        (quantity, summary, p-value) per test
+    """
+    a, b = trace_statistics(expected), trace_statistics(actual)
+    results = [("outcomes", f"W/D/L {'/'.join(map(str, a['outcomes']))} vs {'/'.join(map(str, b['outcomes']))}",
+                chi_square_p_value(a["outcomes"], b["outcomes"]))]
+    for key in ("turns", "damage", "faints"):
+        statistic, p = ks_p_value(a[key], b[key])
+        results.append((key, f"mean {np.mean(a[key]):.2f} vs {np.mean(b[key]):.2f}, D={statistic:.3f}", p))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record golden battle traces on the reference engine and check "
+                                                 "other engines against them.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record = subparsers.add_parser("record", help="Play and trace seeded battles")
+    record.add_argument("output", help="Trace file to write (.jsonl)")
+    record.add_argument("--battles", type=int, default=200)
+    record.add_argument("--first-battle", type=int, default=0)
+    record.add_argument("--mode", choices=["single", "double"], default="single")
+    record.add_argument("--player", default="adversary", help="Entrant (see pokemon_tournament)")
+    record.add_argument("--opponent", default="adversary")
+    record.add_argument("--max-turns", type=int, default=200)
+    record.add_argument("--seed", type=int, default=0, help="Seed of the teams and policy choices")
+    record.add_argument("--rng-seed", type=int, help="Seed of the engine's draws (default: --seed)")
+    check = subparsers.add_parser("check", help="Replay trace files on engines and diff the traces")
+    check.add_argument("traces", nargs="*", default=list(GOLDEN_TRACES),
+                       help="Trace files to replay (default: the committed golden traces)")
+    check.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    check.add_argument("--show", type=int, default=10, help="Divergent battles to print per engine")
+    compare = subparsers.add_parser("compare", help="Compare the distributions of two trace files")
+    compare.add_argument("expected")
+    compare.add_argument("actual")
+    compare.add_argument("--alpha", type=float, default=0.01, help="Significance level of each test")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        battle_mode = BattleMode(args.mode)
+        for name in (args.player, args.opponent):
+            try:
+                entrant_factory(name)
+            except ValueError as e:
+                parser.error(str(e))
+        battles = range(args.first_battle, args.first_battle + args.battles)
+        records = [record_battle(i, args.seed, battle_mode, args.player, args.opponent, max_turns=args.max_turns,
+                                 rng_seed=args.rng_seed) for i in battles]
+        config = {"mode": args.mode, "player": args.player, "opponent": args.opponent, "seed": args.seed,
+                  "rng_seed": args.seed if args.rng_seed is None else args.rng_seed,
+                  "battles": [battles.start, battles.stop], "max_turns": args.max_turns}
+        save_traces(args.output, records, config)
+        turns = sum(r["turn_count"] for r in records)
+        print(f"Wrote {len(records)} battles ({turns} turns) to {args.output}")
+        return
+
+    if args.command == "check":
+        failed = False
+        for path in args.traces:
+            header, records = load_traces(path)
+            if header["engine"] != engine_fingerprint():
+                print(f"Engine code changed since {path} was recorded; checking it still plays the same battles")
+            for name in args.engines:
+                failures = check_engine(ENGINES[name](), records)
+                print(f"{name}: {len(records) - len(failures)}/{len(records)} battles identical")
+                for battle_id, difference in failures[:args.show]:
+                    print(f"  battle {battle_id}: {difference}")
+                failed = failed or bool(failures)
+        sys.exit(1 if failed else 0)
+
+    _, expected = load_traces(args.expected)
+    _, actual = load_traces(args.actual)
+    results = compare_distributions(expected, actual)
+    for quantity, summary, p in results:
+        print(f"{quantity:<9} {summary}  p={p:.3f}{'  DIFFERENT' if p < args.alpha else ''}")
+    sys.exit(1 if any(p < args.alpha for _, _, p in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+from typing import Optional, Sequence
+import random
+import time
+import numpy as np
+
+from pokemon_battle import (Pokemon, Team, Battle, BattleMode, TYPES_DATA, DEFAULT_PLAYER_TEAM,
+                            DEFAULT_OPPONENT_TEAM, get_type_effectiveness)
+from pokemon_stats import DEFAULT_STAT_PRESET, stat_table
+
+# Every type that can appear on a species or move; fairy is missing from the type chart
+TYPE_NAMES = list(TYPES_DATA) + [t for t in ("fairy",) if t not in TYPES_DATA]
+TYPE_INDEX = {name: i for i, name in enumerate(TYPE_NAMES)}
+DAMAGE_CLASSES = ["physical", "special", "status"]
+STATUS_NAMES = ["burn", "freeze", "paralysis", "poison", "bad-poison", "sleep"]
+STAT_STAGE_NAMES = ["attack", "defense", "special_attack", "special_defense", "speed", "accuracy", "evasion"]
+
+NUM_TYPES = len(TYPE_NAMES)
+NUM_MOVES = 4
+TEAM_SIZE = 6
+
+# Scales that keep every feature roughly within [-1, 1]. BattleEncoder widens HP_SCALE and
+# STAT_SCALE to the largest stats of its stat preset.
+HP_SCALE = 700.0
+STAT_SCALE = 255.0
+POWER_SCALE = 250.0
+TURN_SCALE = 100.0
+MAX_EFFECTIVENESS = 4.0
+
+# Per Pokemon: hp fraction, active, fainted, stat stages, status one-hot, then the static block
+DYNAMIC_SIZE = 3 + len(STAT_STAGE_NAMES) + len(STATUS_NAMES)
+MOVE_SIZE = 1 + 2 + NUM_TYPES + len(DAMAGE_CLASSES)  # present, power, accuracy, type, class
+STATIC_SIZE = 6 + NUM_TYPES + NUM_MOVES * MOVE_SIZE
+POKEMON_SIZE = DYNAMIC_SIZE + STATIC_SIZE
+
+# Type chart as nested lists for fast scalar lookups, indexed [attack_type][defend_type]
+TYPE_CHART = [[get_type_effectiveness(attack, defend) for defend in TYPE_NAMES] for attack in TYPE_NAMES]
+
+
+class BattleEncoder:
+    """Encodes a battle into a fixed-size float32 feature vector.
+
+    Layout: both teams (the perspective's team first) as TEAM_SIZE blocks of POKEMON_SIZE
+    in team order, then the effectiveness of every active move against every active
+    opponent for both sides, then the turn count. Static per-Pokemon features (stats,
+    types, move data) are computed once per Pokemon object and copied in on later calls,
+    so encoding writes into the caller's buffer without building intermediate lists.
+
+    Stats are scaled so that every species at every level of `stat_preset` (see
+    pokemon_stats) encodes within [0, 1]; larger stats, from another preset or past
+    MAX_LEVEL, are clipped to 1.
+    """
+
+    def __init__(self, battle_mode: BattleMode, cache_size: int = 4096, stat_preset: str = DEFAULT_STAT_PRESET):
+        self.battle_mode = battle_mode
+        table = stat_table(stat_preset)
+        self.hp_scale = max(HP_SCALE, float(table.hp.max()))
+        self.stat_scale = max(STAT_SCALE, float(table.stats.max()))
+        self.num_active = 1 if battle_mode == BattleMode.SINGLE else 2
+        self.effectiveness_size = self.num_active * NUM_MOVES * self.num_active
+        self.team_size = TEAM_SIZE * POKEMON_SIZE
+        self.size = 2 * self.team_size + 2 * self.effectiveness_size + 1
+        self.cache_size = cache_size
+        # id(pokemon) -> (pokemon, static feature block, type indices, move type indices)
+        self._static = {}
+
+    def allocate(self, rows: Optional[int] = None) -> np.ndarray:
+        """Allocate a zeroed buffer for one encoding or a batch of `rows` encodings."""
+        shape = (self.size,) if rows is None else (rows, self.size)
+        return np.zeros(shape, dtype=np.float32)
+
+    def _static_entry(self, pokemon: Pokemon):
+        entry = self._static.get(id(pokemon))
+        if entry is not None and entry[0] is pokemon:
+            return entry
+        if len(self._static) >= self.cache_size:
+            self._static.clear()
+
+        block = np.zeros(STATIC_SIZE, dtype=np.float32)
+        block[0] = min(pokemon.hp / self.hp_scale, 1.0)
+        block[1] = min(pokemon.attack / self.stat_scale, 1.0)
+        block[2] = min(pokemon.defense / self.stat_scale, 1.0)
+        block[3] = min(pokemon.special_attack / self.stat_scale, 1.0)
+        block[4] = min(pokemon.special_defense / self.stat_scale, 1.0)
+        block[5] = min(pokemon.speed / self.stat_scale, 1.0)
+        type_indices = [TYPE_INDEX[t] for t in pokemon.types]
+        for t in type_indices:
+            block[6 + t] = 1.0
+        move_types = []
+        for slot, move in enumerate(pokemon.moves[:NUM_MOVES]):
+            base = 6 + NUM_TYPES + slot * MOVE_SIZE
+            block[base] = 1.0
+            block[base + 1] = move.power / POWER_SCALE
+            block[base + 2] = move.accuracy / 100.0
+            block[base + 3 + TYPE_INDEX[move.type]] = 1.0
+            block[base + 3 + NUM_TYPES + DAMAGE_CLASSES.index(move.damage_class)] = 1.0
+            move_types.append(TYPE_INDEX[move.type])
+
+        entry = (pokemon, block, type_indices, move_types)
+        self._static[id(pokemon)] = entry
+        return entry
+
+    def _encode_team(self, team: Team, out: np.ndarray, offset: int):
+        active = team.active_pokemon_indices
+        for index, pokemon in enumerate(team.pokemon):
+            base = offset + index * POKEMON_SIZE
+            out[base] = pokemon.current_hp / pokemon.hp
+            out[base + 1] = index in active
+            out[base + 2] = pokemon.current_hp <= 0
+            stages = pokemon.stat_stages
+            for i, stat in enumerate(STAT_STAGE_NAMES):
+                out[base + 3 + i] = stages[stat] / 6.0
+            status_base = base + 3 + len(STAT_STAGE_NAMES)
+            out[status_base:status_base + len(STATUS_NAMES)] = 0.0
+            if pokemon.status in STATUS_NAMES:
+                out[status_base + STATUS_NAMES.index(pokemon.status)] = 1.0
+            out[base + DYNAMIC_SIZE:base + POKEMON_SIZE] = self._static_entry(pokemon)[1]
+
+    def _encode_effectiveness(self, attackers: Team, defenders: Team, out: np.ndarray, offset: int):
+        position = offset
+        for attacker_index in attackers.active_pokemon_indices:
+            move_types = self._static_entry(attackers.pokemon[attacker_index])[3]
+            for defender_index in defenders.active_pokemon_indices:
+                defender_types = self._static_entry(defenders.pokemon[defender_index])[2]
+                for slot in range(NUM_MOVES):
+                    if slot < len(move_types):
+                        row = TYPE_CHART[move_types[slot]]
+                        effectiveness = 1.0
+                        for t in defender_types:
+                            effectiveness *= row[t]
+                        out[position + slot] = effectiveness / MAX_EFFECTIVENESS
+                    else:
+                        out[position + slot] = 0.0
+                position += NUM_MOVES
+
+    def encode(self, battle: Battle, out: np.ndarray, perspective: str = "player") -> np.ndarray:
+        """Write the encoding of `battle` into the 1-D buffer `out` and return it.
+
+        Args:
+            battle: Battle in the encoder's battle mode
+            out: float32 buffer of length `self.size`, such as one row of a batch array
+            perspective: "player" or "opponent"; that side's team is encoded first
+        """
+        if perspective == "player":
+            return self.encode_teams(battle.player_team, battle.opponent_team, battle.turn_count, out)
+        return self.encode_teams(battle.opponent_team, battle.player_team, battle.turn_count, out)
+
+    def encode_teams(self, own: Team, other: Team, turn_count: int, out: np.ndarray) -> np.ndarray:
+        """encode() from the teams alone, for policies that only see their own and the opposing team."""
+        self._encode_team(own, out, 0)
+        self._encode_team(other, out, self.team_size)
+        offset = 2 * self.team_size
+        self._encode_effectiveness(own, other, out, offset)
+        self._encode_effectiveness(other, own, out, offset + self.effectiveness_size)
+        out[self.size - 1] = min(turn_count / TURN_SCALE, 1.0)
+        return out
+
+    def encode_batch(self, battles: Sequence[Battle], out: np.ndarray, perspective: str = "player") -> np.ndarray:
+        """Encode each battle into the matching row of the 2-D buffer `out`."""
+        for row, battle in enumerate(battles):
+            self.encode(battle, out[row], perspective)
+        return out
+
+
+def main():
+    rng = random.Random(0)
+    for battle_mode in (BattleMode.SINGLE, BattleMode.DOUBLE):
+        battles = []
+        for _ in range(256):
+            player = Team([Pokemon.from_data(name, rng=rng) for name in DEFAULT_PLAYER_TEAM], battle_mode)
+            opponent = Team([Pokemon.from_data(name, rng=rng) for name in DEFAULT_OPPONENT_TEAM], battle_mode)
+            battles.append(Battle(player, opponent, verbose=False, rng=rng))
+        encoder = BattleEncoder(battle_mode)
+        out = encoder.allocate(len(battles))
+        encoder.encode_batch(battles, out)
+
+        repeats = 20
+        started = time.perf_counter()
+        for _ in range(repeats):
+            encoder.encode_batch(battles, out)
+        elapsed = time.perf_counter() - started
+        print(f"{battle_mode.value.title()}: {encoder.size} features, "
+              f"{repeats * len(battles) / elapsed:.0f} encodings per second")
+
+
+if __name__ == "__main__":
+    main()
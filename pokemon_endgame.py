@@ -0,0 +1,375 @@
+from typing import List, Optional, Tuple
+from itertools import combinations
+from collections import OrderedDict
+import math
+import time
+import random
+import argparse
+import numpy as np
+
+from pokemon_battle import Pokemon, Move, Battle, Team, BattleMode, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+from pokemon_damage import damage_distribution, hit_count_distribution, _stage_multiplier
+
+EPSILON = 1e-9
+MAX_FIXED_POINT_ITERATIONS = 200
+
+
+def _first_dominated(lines: np.ndarray) -> int:
+    """Index of the first row weakly dominated (from above) by another row, or -1."""
+    dominates = (lines[None, :, :] >= lines[:, None, :] - EPSILON).all(axis=2)
+    np.fill_diagonal(dominates, False)
+    dominated = np.flatnonzero(dominates.any(axis=1))
+    return int(dominated[0]) if len(dominated) else -1
+
+
+def _undominated(payoffs: np.ndarray) -> Tuple[List[int], List[int]]:
+    """Rows and columns left after iteratively removing weakly dominated strategies."""
+    rows = list(range(payoffs.shape[0]))
+    cols = list(range(payoffs.shape[1]))
+    while True:
+        sub = payoffs[np.ix_(rows, cols)]
+        r = _first_dominated(sub) if len(rows) > 1 else -1
+        if r >= 0:
+            del rows[r]
+            continue
+        c = _first_dominated(-sub.T) if len(cols) > 1 else -1
+        if c >= 0:
+            del cols[c]
+            continue
+        return rows, cols
+
+
+def _expand(strategy: np.ndarray, support: List[int], size: int) -> np.ndarray:
+    full = np.zeros(size)
+    full[support] = strategy
+    return full
+
+
+def _solve_support(payoffs: np.ndarray, rows: List[int], cols: List[int]):
+    """Equilibrium with exactly the given equal-size supports, or None if there is none."""
+    k = len(rows)
+    sub = payoffs[np.ix_(rows, cols)]
+    system = np.zeros((k + 1, k + 1))
+    system[k, :k] = 1
+    system[:k, k] = -1
+    rhs = np.zeros(k + 1)
+    rhs[k] = 1
+    try:
+        system[:k, :k] = sub
+        col_solution = np.linalg.solve(system, rhs)
+        system[:k, :k] = sub.T
+        row_solution = np.linalg.solve(system, rhs)
+    except np.linalg.LinAlgError:
+        return None
+    if col_solution[:k].min() < -EPSILON or row_solution[:k].min() < -EPSILON:
+        return None
+    value = col_solution[k]
+    row_strategy = _expand(np.clip(row_solution[:k], 0, 1), rows, payoffs.shape[0])
+    col_strategy = _expand(np.clip(col_solution[:k], 0, 1), cols, payoffs.shape[1])
+    if (payoffs @ col_strategy).max() > value + EPSILON or (row_strategy @ payoffs).min() < value - EPSILON:
+        return None
+    return float(value), row_strategy, col_strategy
+
+
+def solve_matrix_game(payoffs: np.ndarray, hint: Optional[Tuple[List[int], List[int]]] = None
+                      ) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Value and optimal mixed strategies of a zero-sum game; the row player maximizes.
+
+    Tries for a saddle point first, then the supports in `hint` (typically those of a
+    neighbouring state), then removes dominated strategies and enumerates equal-size
+    supports of what is left, which is exact and fast for the at most 4x4 games of a
+    1v1 endgame.
+
+    Returns:
+        (value, row strategy, column strategy)
+    """
+    num_rows, num_cols = payoffs.shape
+    row_mins = payoffs.min(axis=1)
+    col_maxs = payoffs.max(axis=0)
+    best_row = int(row_mins.argmax())
+    best_col = int(col_maxs.argmin())
+    if col_maxs[best_col] - row_mins[best_row] <= EPSILON:
+        return float(row_mins[best_row]), np.eye(num_rows)[best_row], np.eye(num_cols)[best_col]
+
+    if hint is not None and len(hint[0]) == len(hint[1]) > 1:
+        solution = _solve_support(payoffs, *hint)
+        if solution is not None:
+            return solution
+
+    rows, cols = _undominated(payoffs)
+    for k in range(2, min(len(rows), len(cols)) + 1):
+        for row_support in combinations(rows, k):
+            for col_support in combinations(cols, k):
+                solution = _solve_support(payoffs, list(row_support), list(col_support))
+                if solution is not None:
+                    return solution
+
+    # Degenerate games: fall back to the pure maximin strategy
+    return float(row_mins[best_row]), np.eye(num_rows)[best_row], np.eye(num_cols)[best_col]
+
+
+def _support(strategy: np.ndarray) -> List[int]:
+    return [int(i) for i in np.flatnonzero(strategy > EPSILON)]
+
+
+def _solve_state(base: np.ndarray, loop: np.ndarray, hint: Optional[Tuple[List[int], List[int]]] = None,
+                 guess: Optional[float] = None) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Solve v = val(base + loop * v) for a state that can repeat itself (both sides dealing no damage).
+
+    The iteration starts from `guess` (e.g. the value of a neighbouring state) when every
+    pair of moves can leave the state, in which case the fixed point is unique. Otherwise
+    it starts from 0 and converges to the least fixed point, so a position neither side
+    can ever leave is valued as not won. When the iteration settles on a pure pair of
+    moves the fixed point is solved for directly.
+    """
+    if loop.max() <= 0:
+        return solve_matrix_game(base, hint)
+    value = guess if guess is not None and loop.max() < 1 else 0.0
+    _, row_strategy, col_strategy = solve_matrix_game(base + loop * value, hint)
+    for _ in range(MAX_FIXED_POINT_ITERATIONS):
+        i, j = int(row_strategy.argmax()), int(col_strategy.argmax())
+        if row_strategy[i] == 1 and col_strategy[j] == 1 and loop[i, j] < 1:
+            candidate = base[i, j] / (1 - loop[i, j])
+            payoffs = base + loop * candidate
+            if payoffs[i].min() >= candidate - EPSILON and payoffs[:, j].max() <= candidate + EPSILON:
+                return float(candidate), row_strategy, col_strategy
+        new_value, row_strategy, col_strategy = solve_matrix_game(base + loop * value, hint)
+        if abs(new_value - value) <= EPSILON:
+            return new_value, row_strategy, col_strategy
+        value = new_value
+    return value, row_strategy, col_strategy
+
+
+def _effective_speed(pokemon: Pokemon) -> float:
+    """Same as Battle.effective_speed."""
+    speed = pokemon.speed * _stage_multiplier(pokemon.stat_stages["speed"])
+    if pokemon.status == "paralysis":
+        speed *= 0.5
+    return speed
+
+
+def _use_pmfs(attacker: Pokemon, defender: Pokemon, cap: int) -> np.ndarray:
+    """Per-use damage distributions of each of the attacker's moves, with damage >= cap merged into cap."""
+    pmfs = np.zeros((len(attacker.moves), cap + 1))
+    for i, move in enumerate(attacker.moves):
+        pmf = damage_distribution(attacker, defender, move)
+        width = min(len(pmf), cap)
+        pmfs[i, :width] = pmf[:width]
+        pmfs[i, cap] += pmf[cap:].sum()
+    return pmfs
+
+
+class EndgameTable:
+    """Exact win probabilities for a 1v1 between two Pokemon, for every pair of HP values.
+
+    States are the remaining HP of both sides, rounded up to whole points since damage
+    is always an integer. Each turn is a simultaneous choice of moves; the turn is
+    resolved with the engine's damage, accuracy, multi-hit and priority/speed order
+    model, using the exact distributions from pokemon_damage. The value of each state
+    is the value of the resulting zero-sum matrix game, computed bottom-up from
+    lower-HP states. Move effects beyond damage (stat changes, status, recoil, drain,
+    healing, charge turns) and switching are not modelled. Battle.execute_turn lets the
+    player side move first on priority and speed ties, so `a_wins_ties` must say whether
+    a is the player.
+    """
+
+    def __init__(self, pokemon_a: Pokemon, pokemon_b: Pokemon, a_wins_ties: bool = True):
+        self.max_hp_a = math.ceil(pokemon_a.hp)
+        self.max_hp_b = math.ceil(pokemon_b.hp)
+        self.moves_a = list(pokemon_a.moves)
+        self.moves_b = list(pokemon_b.moves)
+        self.pmfs_a = _use_pmfs(pokemon_a, pokemon_b, self.max_hp_b)
+        self.pmfs_b = _use_pmfs(pokemon_b, pokemon_a, self.max_hp_a)
+        self.cdfs_a = np.cumsum(self.pmfs_a, axis=1)
+        self.cdfs_b = np.cumsum(self.pmfs_b, axis=1)
+        speed_a, speed_b = _effective_speed(pokemon_a), _effective_speed(pokemon_b)
+        self.a_wins_ties = a_wins_ties
+        self.a_first = np.array([[(ma.priority, speed_a) > (mb.priority, speed_b) or
+                                  (a_wins_ties and (ma.priority, speed_a) == (mb.priority, speed_b))
+                                  for mb in self.moves_b] for ma in self.moves_a])
+        self.loop = np.outer(self.pmfs_a[:, 0], self.pmfs_b[:, 0])
+        # values[hp_a, hp_b] = probability that a wins
+        self.values = np.zeros((self.max_hp_a + 1, self.max_hp_b + 1))
+        self.values[1:, 0] = 1.0
+        self._solve()
+
+    def _win_now(self, hp_a: int, hp_b: int) -> np.ndarray:
+        """P(a KOs b this turn before being KOed) for every pair of moves."""
+        ko = 1 - self.cdfs_a[:, hp_b - 1]
+        survives = self.cdfs_b[:, hp_a - 1]
+        return np.where(self.a_first, ko[:, None], ko[:, None] * survives[None, :])
+
+    def _solve(self):
+        values = self.values
+        pmfs_a, pmfs_b = self.pmfs_a, self.pmfs_b
+        miss_a, miss_b = pmfs_a[:, 0], pmfs_b[:, 0]
+        ko = 1 - self.cdfs_a[:, :-1]  # ko[i, hp_b - 1] = P(a's move i deals at least hp_b)
+        for hp_a in range(1, self.max_hp_a + 1):
+            survives = self.cdfs_b[:, hp_a - 1]
+            # Winning this turn, for every move pair and every hp_b at once
+            win = np.where(self.a_first[:, :, None], ko[:, None, :], ko[:, None, :] * survives[None, :, None])
+            # after[j, b] = E[value | b damages a by 1..hp_a-1 with its move j, b left at HP b]
+            after = pmfs_b[:, 1:hp_a] @ values[hp_a - 1:0:-1, :]
+            row_base = win + miss_a[:, None, None] * after[None, :, 1:]
+            # both[j, b] additionally includes b dealing no damage, once values[hp_a, b] is known
+            both = np.zeros_like(after)
+            hint = None
+            for hp_b in range(1, self.max_hp_b + 1):
+                base = row_base[:, :, hp_b - 1] + pmfs_a[:, 1:hp_b] @ both[:, hp_b - 1:0:-1].T
+                guess = values[hp_a, hp_b - 1] if hp_b > 1 else None
+                value, row_strategy, col_strategy = _solve_state(base, self.loop, hint, guess)
+                hint = (_support(row_strategy), _support(col_strategy))
+                values[hp_a, hp_b] = value
+                both[:, hp_b] = after[:, hp_b] + miss_b * value
+
+    def _stage_game(self, hp_a: int, hp_b: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Payoff matrix of one state, split into the part not involving the state itself and its self-loop."""
+        block = self.values[hp_a:0:-1, hp_b:0:-1].T.copy()  # block[d, e] = values[hp_a - e, hp_b - d]
+        block[0, 0] = 0.0
+        base = self._win_now(hp_a, hp_b) + self.pmfs_a[:, :hp_b] @ block @ self.pmfs_b[:, :hp_a].T
+        return base, self.loop
+
+    def _state(self, hp_a: float, hp_b: float) -> Tuple[int, int]:
+        return min(self.max_hp_a, max(0, math.ceil(hp_a))), min(self.max_hp_b, max(0, math.ceil(hp_b)))
+
+    def win_probability(self, hp_a: float, hp_b: float) -> float:
+        """Probability that a wins from the given remaining HP, with both sides playing optimally."""
+        return float(self.values[self._state(hp_a, hp_b)])
+
+    def strategies(self, hp_a: float, hp_b: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Optimal (possibly mixed) move probabilities for a and for b at the given HP."""
+        hp_a, hp_b = self._state(hp_a, hp_b)
+        if hp_a == 0 or hp_b == 0:
+            return np.full(len(self.moves_a), 1 / len(self.moves_a)), np.full(len(self.moves_b), 1 / len(self.moves_b))
+        _, row_strategy, col_strategy = _solve_state(*self._stage_game(hp_a, hp_b))
+        return row_strategy, col_strategy
+
+
+def _pokemon_key(pokemon: Pokemon) -> tuple:
+    return (pokemon.name, pokemon.level, pokemon.hp, pokemon.attack, pokemon.defense, pokemon.special_attack,
+            pokemon.special_defense, pokemon.speed, tuple(pokemon.types), tuple(m.name for m in pokemon.moves),
+            tuple(sorted(pokemon.stat_stages.items())), pokemon.status)
+
+
+# Tables are memoized per matchup (everything but the current HP goes into the key),
+# keeping the MAX_ENDGAME_TABLES most recently used ones
+MAX_ENDGAME_TABLES = 64
+_TABLES: "OrderedDict[tuple, EndgameTable]" = OrderedDict()
+
+
+def endgame_table(pokemon_a: Pokemon, pokemon_b: Pokemon, a_wins_ties: bool = True) -> EndgameTable:
+    """The (memoized) endgame table for a vs b, with a moving first on ties if `a_wins_ties`.
+
+    A new matchup is solved over every HP state, which takes about 0.4-1.5 s at level
+    50 (most of the cost of Adversary(endgame=True)); a table takes about 100-200 KB.
+    """
+    key = (_pokemon_key(pokemon_a), _pokemon_key(pokemon_b), a_wins_ties)
+    table = _TABLES.get(key)
+    if table is None:
+        table = EndgameTable(pokemon_a, pokemon_b, a_wins_ties)
+        _TABLES[key] = table
+        if len(_TABLES) > MAX_ENDGAME_TABLES:
+            _TABLES.popitem(last=False)
+    else:
+        _TABLES.move_to_end(key)
+    return table
+
+
+def clear_endgame_tables():
+    _TABLES.clear()
+
+
+def win_probability(pokemon_a: Pokemon, pokemon_b: Pokemon, a_wins_ties: bool = True) -> float:
+    """Probability that a beats b 1v1 from their current HP."""
+    return endgame_table(pokemon_a, pokemon_b, a_wins_ties).win_probability(pokemon_a.current_hp,
+                                                                          pokemon_b.current_hp)
+
+
+def choose_endgame_move(pokemon: Pokemon, opponent: Pokemon, rng: Optional[random.Random] = None,
+                        wins_ties: bool = True) -> Move:
+    """Sample a move from the optimal endgame strategy of `pokemon` against `opponent`.
+
+    `wins_ties` says whether `pokemon` moves first on priority and speed ties, i.e. is
+    on the battle's player side.
+    """
+    rng = rng if rng is not None else random
+    table = endgame_table(pokemon, opponent, wins_ties)
+    strategy, _ = table.strategies(pokemon.current_hp, opponent.current_hp)
+    return rng.choices(table.moves_a, weights=strategy)[0]
+
+
+def simulate_endgame(battle: Battle, pokemon_a: Pokemon, pokemon_b: Pokemon, table: EndgameTable,
+                     samples: int) -> float:
+    """Monte Carlo win rate of a when both sides follow the table's strategies, using the engine's damage."""
+    rng = battle.rng
+    start_a, start_b = pokemon_a.current_hp, pokemon_b.current_hp
+    hit_counts = {id(m): hit_count_distribution(m) for m in table.moves_a + table.moves_b}
+    speed_a, speed_b = _effective_speed(pokemon_a), _effective_speed(pokemon_b)
+    wins = 0
+    for _ in range(samples):
+        hp = {id(pokemon_a): start_a, id(pokemon_b): start_b}
+        for _ in range(500):
+            strategy_a, strategy_b = table.strategies(hp[id(pokemon_a)], hp[id(pokemon_b)])
+            move_a = rng.choices(table.moves_a, weights=strategy_a)[0]
+            move_b = rng.choices(table.moves_b, weights=strategy_b)[0]
+            order = [(pokemon_a, pokemon_b, move_a), (pokemon_b, pokemon_a, move_b)]
+            key_a, key_b = (move_a.priority, speed_a), (move_b.priority, speed_b)
+            if key_a < key_b or (key_a == key_b and not table.a_wins_ties):
+                order.reverse()
+            for attacker, defender, move in order:
+                if rng.randint(1, 100) <= move.accuracy:
+                    counts = hit_counts[id(move)]
+                    for _ in range(rng.choices(range(len(counts)), counts)[0]):
+                        hp[id(defender)] -= battle.calculate_damage(attacker, defender, move)
+                if hp[id(defender)] <= 0:
+                    break
+            if hp[id(pokemon_b)] <= 0:
+                wins += 1
+                break
+            if hp[id(pokemon_a)] <= 0:
+                break
+    return wins / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a 1v1 endgame exactly and check it against simulation.")
+    parser.add_argument("pokemon_a", nargs="?", default=DEFAULT_PLAYER_TEAM[0])
+    parser.add_argument("pokemon_b", nargs="?", default=DEFAULT_OPPONENT_TEAM[0])
+    parser.add_argument("--level", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    player = Team([Pokemon.from_data(args.pokemon_a, args.level, rng)] +
+                  [Pokemon.from_data(name, args.level, rng) for name in DEFAULT_PLAYER_TEAM[1:]], BattleMode.SINGLE)
+    opponent = Team([Pokemon.from_data(args.pokemon_b, args.level, rng)] +
+                    [Pokemon.from_data(name, args.level, rng) for name in DEFAULT_OPPONENT_TEAM[1:]], BattleMode.SINGLE)
+    pokemon_a, pokemon_b = player.pokemon[0], opponent.pokemon[0]
+    battle = Battle(player, opponent, verbose=False, rng=rng)
+
+    started = time.perf_counter()
+    table = endgame_table(pokemon_a, pokemon_b)
+    solve_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(1000):
+        win_probability(pokemon_a, pokemon_b)
+    lookup_time = (time.perf_counter() - started) / 1000
+
+    print(f"{pokemon_a.name} ({', '.join(m.name for m in pokemon_a.moves)}) vs "
+          f"{pokemon_b.name} ({', '.join(m.name for m in pokemon_b.moves)})")
+    print(f"Solved {table.values.size} HP states in {solve_time * 1000:.0f} ms, "
+          f"memoized lookups take {lookup_time * 1e6:.1f} us")
+    strategy_a, strategy_b = table.strategies(pokemon_a.hp, pokemon_b.hp)
+    print(f"Exact win probability from full HP: {table.win_probability(pokemon_a.hp, pokemon_b.hp):.4f}")
+    print("Optimal moves: " + ", ".join(f"{m.name} {p:.2f}" for m, p in zip(table.moves_a, strategy_a) if p > 0) +
+          " / " + ", ".join(f"{m.name} {p:.2f}" for m, p in zip(table.moves_b, strategy_b) if p > 0))
+
+    started = time.perf_counter()
+    simulated = simulate_endgame(battle, pokemon_a, pokemon_b, table, args.samples)
+    print(f"Simulated win rate over {args.samples} rollouts: {simulated:.4f} "
+          f"({time.perf_counter() - started:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
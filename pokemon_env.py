@@ -0,0 +1,457 @@
+from typing import List, Optional, Union, Sequence, Dict, Tuple
+import random
+import time
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+from pokemon_battle import Pokemon, Team, Battle, BattleMode, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+from pokemon_adversary import Adversary
+from pokemon_encoder import BattleEncoder
+from pokemon_stats import DEFAULT_STAT_PRESET
+
+try:
+    import gymnasium as gym
+    from gymnasium import spaces
+except ImportError:  # gymnasium is optional, the environments follow its API either way
+    gym = None
+    spaces = None
+
+NUM_MOVES = 4
+TEAM_SIZE = 6
+# Single battles: actions 0-3 use that move, 4-9 switch to team index (action - 4)
+SINGLE_ACTIONS = NUM_MOVES + TEAM_SIZE
+# Double battles, per active slot: actions 0-7 use move (action // 2) on target (action % 2),
+# 8-13 switch to team index (action - 8)
+DOUBLE_ACTIONS = NUM_MOVES * 2 + TEAM_SIZE
+
+PASS_ACTION = ('pass', None, 0)
+
+
+def num_actions(battle_mode: BattleMode) -> int:
+    """Number of discrete actions per active slot."""
+    return SINGLE_ACTIONS if battle_mode == BattleMode.SINGLE else DOUBLE_ACTIONS
+
+
+def action_mask_shape(battle_mode: BattleMode) -> tuple:
+    """Shape of the legal action mask for one battle."""
+    if battle_mode == BattleMode.SINGLE:
+        return (SINGLE_ACTIONS,)
+    return (2, DOUBLE_ACTIONS)
+
+
+def action_mask(team: Team, opponent_team: Team, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Write the legal actions for `team` into `out` (allocated if not given)."""
+    if out is None:
+        out = np.zeros(action_mask_shape(team.battle_mode), dtype=bool)
+    else:
+        out[...] = False
+    switches = team.get_available_switches()
+
+    if team.battle_mode == BattleMode.SINGLE:
+        active = team.active_pokemon
+        if not active.is_fainted():
+            out[:min(NUM_MOVES, len(active.moves))] = True
+        for index in switches:
+            out[NUM_MOVES + index] = True
+        return out
+
+    targets = [not p.is_fainted() for p in opponent_team.active_pokemon]
+    for slot, active in enumerate(team.active_pokemon):
+        if active.is_fainted():
+            continue
+        for move_index in range(min(NUM_MOVES, len(active.moves))):
+            out[slot, move_index * 2] = targets[0]
+            out[slot, move_index * 2 + 1] = targets[1]
+        for index in switches:
+            out[slot, NUM_MOVES * 2 + index] = True
+    return out
+
+
+def decode_action(team: Team, action, mask: np.ndarray) -> Union[tuple, List[tuple]]:
+    """Turn discrete action(s) into the tuples expected by Battle.execute_turn.
+
+    Illegal actions are replaced by the first legal one; slots with no legal action pass, as does
+    a second slot switching to the same bench Pokemon (see sanitize_actions).
+    """
+    if team.battle_mode == BattleMode.SINGLE:
+        action = int(action)
+        if not mask[action]:
+            action = int(mask.argmax())
+        if action < NUM_MOVES:
+            return ('move', team.active_pokemon.moves[action])
+        return ('switch', action - NUM_MOVES)
+
+    actions = []
+    for slot, active in enumerate(team.active_pokemon):
+        slot_action = int(action[slot])
+        if not mask[slot, slot_action]:
+            if not mask[slot].any():
+                actions.append(PASS_ACTION)
+                continue
+            slot_action = int(mask[slot].argmax())
+        if slot_action < NUM_MOVES * 2:
+            actions.append(('move', active.moves[slot_action // 2], slot_action % 2))
+        else:
+            actions.append(('switch', slot_action - NUM_MOVES * 2, 0))
+    return sanitize_actions(team, actions)
+
+
+def encode_action(team: Team, actions: Union[tuple, List[tuple]], out: np.ndarray) -> np.ndarray:
+    """Inverse of decode_action: write the discrete index of each engine action into `out`.
+
+    `out` has one entry per active slot; passing slots are written as -1.
+    """
+    if team.battle_mode == BattleMode.SINGLE:
+        if actions[0] == 'move':
+            out[0] = team.active_pokemon.moves.index(actions[1])
+        elif actions[0] == 'switch':
+            out[0] = NUM_MOVES + actions[1]
+        else:
+            out[0] = -1
+        return out
+
+    for slot, (active, action) in enumerate(zip(team.active_pokemon, actions)):
+        if action[0] == 'move':
+            out[slot] = active.moves.index(action[1]) * 2 + action[2]
+        elif action[0] == 'switch':
+            out[slot] = NUM_MOVES * 2 + action[1]
+        else:
+            out[slot] = -1
+    return out
+
+
+def sanitize_actions(team: Team, actions: Union[tuple, List[tuple]]) -> Union[tuple, List[tuple]]:
+    """Make fainted active Pokemon in a double battle pass instead of attacking.
+
+    A slot that switches to the bench Pokemon the other slot already switches to passes as well,
+    since only the first of the two switches could happen.
+    """
+    if team.battle_mode == BattleMode.SINGLE:
+        return actions
+    sanitized = []
+    for pokemon, action in zip(team.active_pokemon, actions):
+        if pokemon.is_fainted() or (action[0] == 'switch' and any(
+                taken[0] == 'switch' and taken[1] == action[1] for taken in sanitized)):
+            action = PASS_ACTION
+        sanitized.append(action)
+    return sanitized
+
+
+def replace_fainted(team: Team):
+    """Send in the first healthy bench Pokemon for every fainted active slot."""
+    for position, index in enumerate(team.active_pokemon_indices):
+        if team.pokemon[index].is_fainted():
+            switches = team.get_available_switches()
+            if switches:
+                team.switch_pokemon(position, switches[0])
+
+
+_EnvBase = gym.Env if gym is not None else object
+
+
+class PokemonBattleEnv(_EnvBase):
+    """Single battle environment with the Gym reset/step API.
+
+    The agent controls the player team; the opponent team is driven by `opponent_policy`,
+    any factory called as `opponent_policy(team, battle_mode, rng=rng)` that returns an
+    object with `choose_action(opponent_team)` (Adversary by default). Fainted active
+    Pokemon are replaced automatically between turns. Rewards are +1 for a win, -1 for
+    a loss and 0 otherwise. Both teams are built under `stat_preset` (see pokemon_stats).
+    """
+
+    metadata = {"render_modes": []}
+
+    def __init__(self, battle_mode: BattleMode = BattleMode.SINGLE,
+                 player_team: Sequence[str] = DEFAULT_PLAYER_TEAM,
+                 opponent_team: Sequence[str] = DEFAULT_OPPONENT_TEAM,
+                 opponent_policy=Adversary, level: int = 50, max_turns: int = 200,
+                 stat_preset: str = DEFAULT_STAT_PRESET):
+        self.battle_mode = battle_mode
+        self.player_names = list(player_team)
+        self.opponent_names = list(opponent_team)
+        self.opponent_policy = opponent_policy
+        self.level = level
+        self.stat_preset = stat_preset
+        self.max_turns = max_turns
+        self.encoder = BattleEncoder(battle_mode, stat_preset=stat_preset)
+        self.observation_size = self.encoder.size
+        self.rng = random.Random()
+        self.battle = None
+        self.opponent = None
+        self._obs = np.zeros(self.observation_size, dtype=np.float32)
+        self._mask = np.zeros(action_mask_shape(battle_mode), dtype=bool)
+
+        if spaces is not None:
+            self.observation_space = spaces.Box(-1.0, 1.0, (self.observation_size,), np.float32)
+            if battle_mode == BattleMode.SINGLE:
+                self.action_space = spaces.Discrete(SINGLE_ACTIONS)
+            else:
+                self.action_space = spaces.MultiDiscrete([DOUBLE_ACTIONS, DOUBLE_ACTIONS])
+
+    def _build_team(self, names: Sequence[str]) -> Team:
+        return Team([Pokemon.from_data(name, self.level, rng=self.rng, stat_preset=self.stat_preset)
+                     for name in names], self.battle_mode)
+
+    def reset(self, seed: Optional[int] = None, options: Optional[dict] = None):
+        """Start a new battle and return (observation, info)."""
+        if seed is not None:
+            self.rng.seed(seed)
+        player_team = self._build_team(self.player_names)
+        opponent_team = self._build_team(self.opponent_names)
+        self.battle = Battle(player_team, opponent_team, verbose=False, rng=self.rng)
+        self.opponent = self.opponent_policy(opponent_team, self.battle_mode, rng=self.rng)
+        self.observe(self._obs)
+        return self._obs, {}
+
+    def step(self, action):
+        """Play one turn and return (observation, reward, terminated, truncated, info)."""
+        reward, terminated, truncated = self.advance(action)
+        self.observe(self._obs)
+        info = {"turn": self.battle.turn_count}
+        if terminated:
+            info["winner"] = "player" if reward > 0 else "opponent"
+        return self._obs, reward, terminated, truncated, info
+
+    def advance(self, action) -> Tuple[float, bool, bool]:
+        """Play one turn without building an observation; returns (reward, terminated, truncated)."""
+        battle = self.battle
+        action_mask(battle.player_team, battle.opponent_team, self._mask)
+        player_actions = decode_action(battle.player_team, action, self._mask)
+        opponent_actions = sanitize_actions(battle.opponent_team,
+                                            self.opponent.choose_action(battle.player_team))
+        battle.execute_turn(player_actions, opponent_actions)
+
+        if battle.is_battle_over():
+            return (1.0 if battle.opponent_team.is_defeated() else -1.0), True, False
+        replace_fainted(battle.player_team)
+        replace_fainted(battle.opponent_team)
+        return 0.0, False, battle.turn_count >= self.max_turns
+
+    def observe(self, out: np.ndarray) -> np.ndarray:
+        """Write the current observation (see BattleEncoder) into `out`."""
+        return self.encoder.encode(self.battle, out)
+
+    def action_masks(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Legal actions for the player team, shaped like `action_mask_shape(battle_mode)`."""
+        return action_mask(self.battle.player_team, self.battle.opponent_team,
+                           self._mask if out is None else out)
+
+
+def _make_buffers(specs: Dict[str, tuple], shared: bool):
+    """Allocate named arrays, optionally backed by shared memory blocks."""
+    arrays, blocks = {}, {}
+    for name, (shape, dtype) in specs.items():
+        if shared:
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            blocks[name] = shared_memory.SharedMemory(create=True, size=size)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+            arrays[name][...] = 0
+        else:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+    return arrays, blocks
+
+
+def _attach_buffers(specs: Dict[str, tuple], names: Dict[str, str]):
+    """Map shared memory blocks created by the parent process."""
+    arrays, blocks = {}, {}
+    for name, (shape, dtype) in specs.items():
+        blocks[name] = shared_memory.SharedMemory(name=names[name])
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+    return arrays, blocks
+
+
+def _reset_block(envs: List[PokemonBattleEnv], start: int, buffers: Dict[str, np.ndarray], seed: Optional[int]):
+    for offset, env in enumerate(envs):
+        i = start + offset
+        env.reset(seed=None if seed is None else seed + i)
+        env.observe(buffers["obs"][i])
+        env.action_masks(buffers["masks"][i])
+
+
+def _step_block(envs: List[PokemonBattleEnv], start: int, buffers: Dict[str, np.ndarray]):
+    actions = buffers["actions"]
+    for offset, env in enumerate(envs):
+        i = start + offset
+        reward, terminated, truncated = env.advance(actions[i])
+        buffers["rewards"][i] = reward
+        buffers["terminated"][i] = terminated
+        buffers["truncated"][i] = truncated
+        if terminated or truncated:
+            env.observe(buffers["final_obs"][i])
+            buffers["episode_turns"][i] = env.battle.turn_count
+            env.reset()
+        env.observe(buffers["obs"][i])
+        env.action_masks(buffers["masks"][i])
+
+
+def _worker(conn, specs, names, start, count, env_kwargs):
+    """Run a block of environments in a subprocess, reading actions from and writing results to shared memory."""
+    buffers, blocks = _attach_buffers(specs, names)
+    envs = [PokemonBattleEnv(**env_kwargs) for _ in range(count)]
+    try:
+        while True:
+            command, data = conn.recv()
+            if command == "step":
+                _step_block(envs, start, buffers)
+            elif command == "reset":
+                _reset_block(envs, start, buffers, data)
+            elif command == "close":
+                break
+            conn.send(True)
+    finally:
+        del buffers
+        for block in blocks.values():
+            block.close()
+        conn.close()
+
+
+class VectorBattleEnv:
+    """Steps `num_envs` battles per call and returns stacked NumPy arrays.
+
+    Finished battles are reset automatically; their last observation is kept in
+    `infos["final_observation"]` and their length in `infos["episode_turns"]`, both
+    valid for the rows where `terminated | truncated`. With `num_workers > 0` the
+    battles are split across subprocesses that exchange observations, masks, actions
+    and rewards through shared memory. The returned arrays are reused between calls;
+    copy them if they need to outlive the next step.
+    """
+
+    def __init__(self, num_envs: int, num_workers: int = 0, **env_kwargs):
+        self.num_envs = num_envs
+        self.num_workers = min(num_workers, num_envs)
+        self.env_kwargs = env_kwargs
+        template = PokemonBattleEnv(**env_kwargs)
+        self.battle_mode = template.battle_mode
+        self.observation_size = template.observation_size
+        action_shape = () if self.battle_mode == BattleMode.SINGLE else (2,)
+        self._specs = {
+            "obs": ((num_envs, self.observation_size), np.float32),
+            "final_obs": ((num_envs, self.observation_size), np.float32),
+            "rewards": ((num_envs,), np.float32),
+            "terminated": ((num_envs,), np.bool_),
+            "truncated": ((num_envs,), np.bool_),
+            "episode_turns": ((num_envs,), np.int32),
+            "masks": ((num_envs,) + action_mask_shape(self.battle_mode), np.bool_),
+            "actions": ((num_envs,) + action_shape, np.int64),
+        }
+        self.buffers, self._blocks = _make_buffers(self._specs, shared=self.num_workers > 0)
+        self.total_steps = 0
+        self.step_time = 0.0
+        self._closed = False
+
+        self.envs = []
+        self._workers = []
+        if self.num_workers == 0:
+            self.envs = [template] + [PokemonBattleEnv(**env_kwargs) for _ in range(num_envs - 1)]
+            return
+
+        names = {name: block.name for name, block in self._blocks.items()}
+        bounds = np.linspace(0, num_envs, self.num_workers + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            parent_conn, child_conn = mp.Pipe()
+            process = mp.Process(target=_worker, daemon=True,
+                                 args=(child_conn, self._specs, names, int(start), int(stop - start), env_kwargs))
+            process.start()
+            child_conn.close()
+            self._workers.append((parent_conn, process))
+
+    def _broadcast(self, command: str, data=None):
+        for conn, _ in self._workers:
+            conn.send((command, data))
+        for conn, _ in self._workers:
+            conn.recv()
+
+    def reset(self, seed: Optional[int] = None):
+        """Reset every battle; battle i is seeded with seed + i. Returns (observations, infos)."""
+        if self._workers:
+            self._broadcast("reset", seed)
+        else:
+            _reset_block(self.envs, 0, self.buffers, seed)
+        return self.buffers["obs"], {}
+
+    def step(self, actions: np.ndarray):
+        """Step every battle; returns (observations, rewards, terminated, truncated, infos)."""
+        started = time.perf_counter()
+        self.buffers["actions"][...] = actions
+        if self._workers:
+            self._broadcast("step")
+        else:
+            _step_block(self.envs, 0, self.buffers)
+        self.step_time += time.perf_counter() - started
+        self.total_steps += self.num_envs
+
+        infos = {"final_observation": self.buffers["final_obs"],
+                 "episode_turns": self.buffers["episode_turns"]}
+        return (self.buffers["obs"], self.buffers["rewards"], self.buffers["terminated"],
+                self.buffers["truncated"], infos)
+
+    def action_masks(self) -> np.ndarray:
+        """Legal actions for every battle, refreshed by reset() and step()."""
+        return self.buffers["masks"]
+
+    @property
+    def steps_per_second(self) -> float:
+        """Environment steps (battle turns) per second spent inside step()."""
+        return self.total_steps / self.step_time if self.step_time else 0.0
+
+    def close(self):
+        """Stop the worker processes and release shared memory."""
+        if self._closed:
+            return
+        self._closed = True
+        for conn, process in self._workers:
+            conn.send(("close", None))
+        for conn, process in self._workers:
+            process.join()
+            conn.close()
+        self.buffers = {}
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def sample_legal_actions(masks: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Pick a uniformly random legal action for every row of a stacked action mask."""
+    scores = rng.random(masks.shape)
+    scores[~masks] = -1.0
+    return scores.argmax(axis=-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the vectorized battle environment with random legal actions.")
+    parser.add_argument("--num-envs", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    battle_mode = BattleMode.DOUBLE if args.mode == "double" else BattleMode.SINGLE
+    env = VectorBattleEnv(args.num_envs, num_workers=args.workers, battle_mode=battle_mode)
+    rng = np.random.default_rng(args.seed)
+    env.reset(seed=args.seed)
+    episodes = 0
+    wins = 0.0
+    for _ in range(args.steps):
+        _, rewards, terminated, truncated, _ = env.step(sample_legal_actions(env.action_masks(), rng))
+        done = terminated | truncated
+        episodes += int(done.sum())
+        wins += float((rewards > 0).sum())
+    env.close()
+
+    print(f"{args.mode.title()} battles, {args.num_envs} envs, {args.workers} workers")
+    print(f"Steps: {env.total_steps}, finished battles: {episodes}, random-policy wins: {int(wins)}")
+    print(f"Environment steps per second: {env.steps_per_second:.0f}")
+
+
+if __name__ == "__main__":
+    main()
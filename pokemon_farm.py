@@ -0,0 +1,515 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import itertools
+from collections import deque
+
+from pokemon_battle import BattleMode, DEFAULT_OPPONENT_TEAM
+from pokemon_cache import SimulationCache, engine_fingerprint
+from pokemon_matchup import MatchupEstimate, MatchupSimulator
+from pokemon_selfplay import random_team_names
+from pokemon_metrics import Gauge, add_metrics_arguments, start_metrics
+
+# Protocol: one JSON object per line, one response per request, always started by the worker.
+#   {"op": "hello", "name": "host-1", "engine": "<fingerprint>"}  -> {"event": "welcome", "worker": "host-1#3"}
+#   {"op": "lease"}                    -> {"event": "chunk", "chunk_id": 7, "matchup": {...}, "start": 200, "stop": 400}
+#                                         {"event": "wait", "delay": 0.5} or {"event": "done"}
+#   {"op": "results", "chunk_id": 7, "results": [[200, 1], [201, -1]], "final": false}
+#                                      -> {"event": "ack", "stop": 300}   (stop is null once the chunk was taken away)
+# Results are battle indices with 1 (player win), -1 (loss) or 0 (draw). Failures are
+# answered with {"event": "error", "message": ...}.
+
+DEFAULT_PORT = 8766
+
+# Results per battle index; 0 means not played yet
+_UNPLAYED, _WIN, _LOSS, _DRAW = 0, 1, 2, 3
+_CODES = {1: _WIN, -1: _LOSS, 0: _DRAW}
+
+
+def matchup_spec(player: Sequence[str], opponent: Sequence[str], battle_mode: BattleMode = BattleMode.SINGLE,
+                 player_policy: str = "adversary", opponent_policy: str = "adversary", level: int = 50,
+                 max_turns: int = 200, seed: int = 0, stream: int = 0) -> dict:
+    """JSON-serializable description of a matchup that a worker turns back into a MatchupSimulator.
+
+    Teams are species names, so movesets are sampled per battle from the battle's seed.
+    """
+    return {"player": list(player), "opponent": list(opponent), "battle_mode": battle_mode.value,
+            "player_policy": player_policy, "opponent_policy": opponent_policy, "level": level,
+            "max_turns": max_turns, "seed": seed, "stream": stream}
+
+
+def simulator_from_spec(spec: dict) -> MatchupSimulator:
+    return MatchupSimulator(spec["player"], spec["opponent"], BattleMode(spec["battle_mode"]),
+                            spec["player_policy"], spec["opponent_policy"], level=spec["level"],
+                            max_turns=spec["max_turns"], seed=spec["seed"], stream=spec["stream"])
+
+
+@dataclass
+class FarmMatchup:
+    """A matchup being simulated over battle indices start .. start + battles - 1."""
+    spec: dict
+    start: int
+    battles: int
+    results: bytearray = field(init=False)
+    estimate: MatchupEstimate = field(default_factory=MatchupEstimate)
+
+    def __post_init__(self):
+        self.results = bytearray(self.battles)
+
+    @property
+    def stop(self) -> int:
+        return self.start + self.battles
+
+    def played(self, index: int) -> bool:
+        return self.results[index - self.start] != _UNPLAYED
+
+
+@dataclass
+class Chunk:
+    """A range of battle indices of one matchup, leased to at most one worker at a time."""
+    chunk_id: int
+    matchup: int
+    start: int
+    stop: int
+    next: int = 0
+    owner: Optional[str] = None
+    last_seen: float = 0.0
+
+    def __post_init__(self):
+        self.next = max(self.next, self.start)
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.stop - self.next)
+
+
+class FarmCoordinator:
+    """Hands out chunks of (matchup, battle range) to workers over TCP and merges their results.
+
+    Every battle index is seeded on its own (see MatchupSimulator.battle_result), so any
+    worker can play any index and the merged estimates equal a single-process run of the
+    same battles. Chunks go out in order; once the queue is empty an idle worker steals
+    the back half of the chunk with the most battles left, and the owner learns its new
+    end from the next acknowledgement. A worker that disconnects, or reports nothing for
+    `lease_timeout` seconds, loses its chunks, whose unplayed battles go back in the
+    queue. Results are merged as they stream in and battles reported twice (by a slow
+    worker and its replacement) are counted once.
+    """
+
+    def __init__(self, matchups: Sequence[FarmMatchup], chunk_size: int = 200, lease_timeout: float = 30.0,
+                 min_steal: int = 10, engine: Optional[str] = None, progress_interval: float = 5.0):
+        self.matchups = list(matchups)
+        self.chunk_size = chunk_size
+        self.lease_timeout = lease_timeout
+        self.min_steal = min_steal
+        self.engine = engine or engine_fingerprint()
+        self.progress_interval = progress_interval
+        self._chunk_ids = itertools.count(1)
+        self._worker_ids = itertools.count(1)
+        self.pending = deque()
+        self.leases: Dict[int, Chunk] = {}
+        self._issued: Dict[int, int] = {}
+        self.unplayed = sum(m.battles for m in self.matchups)
+        self.workers: Dict[str, int] = {}
+        self.stats = {"chunks": 0, "steals": 0, "redispatched": 0, "duplicates": 0, "workers_lost": 0}
+        self.finished = asyncio.Event()
+        for i, matchup in enumerate(self.matchups):
+            for start in range(matchup.start, matchup.stop, chunk_size):
+                self._queue(i, start, min(start + chunk_size, matchup.stop))
+        if not self.unplayed:
+            self.finished.set()
+
+    def _queue(self, matchup: int, start: int, stop: int):
+        if start < stop:
+            self.pending.append(Chunk(next(self._chunk_ids), matchup, start, stop))
+
+    def _requeue(self, chunk: Chunk):
+        """Take a chunk away from its owner and queue whatever it has not reported yet."""
+        self.leases.pop(chunk.chunk_id, None)
+        if chunk.remaining:
+            self.stats["redispatched"] += 1
+            self._queue(chunk.matchup, chunk.next, chunk.stop)
+
+    def _grant(self, chunk: Chunk, worker: str) -> dict:
+        chunk.owner = worker
+        chunk.last_seen = time.monotonic()
+        self.leases[chunk.chunk_id] = chunk
+        self._issued[chunk.chunk_id] = chunk.matchup
+        self.stats["chunks"] += 1
+        return {"event": "chunk", "chunk_id": chunk.chunk_id, "matchup": self.matchups[chunk.matchup].spec,
+                "start": chunk.start, "stop": chunk.stop}
+
+    def lease(self, worker: str) -> dict:
+        if self.unplayed == 0:
+            return {"event": "done"}
+        while self.pending:
+            chunk = self.pending.popleft()
+            matchup = self.matchups[chunk.matchup]
+            while chunk.next < chunk.stop and matchup.played(chunk.next):
+                chunk.next += 1
+            if chunk.remaining:
+                chunk.start = chunk.next
+                return self._grant(chunk, worker)
+
+        # Nothing queued: steal the back half of the largest chunk someone else is playing
+        victim = max((c for c in self.leases.values() if c.owner != worker), key=lambda c: c.remaining, default=None)
+        if victim is None or victim.remaining < 2 * self.min_steal:
+            return {"event": "wait", "delay": 0.5}
+        middle = victim.next + victim.remaining // 2
+        stolen = Chunk(next(self._chunk_ids), victim.matchup, middle, victim.stop)
+        victim.stop = middle
+        self.stats["steals"] += 1
+        return self._grant(stolen, worker)
+
+    def report(self, worker: str, chunk_id: int, results: List[list], final: bool) -> dict:
+        matchup = self.matchups[self._issued[chunk_id]]
+        for index, result in results:
+            self._record(matchup, index, result)
+        chunk = self.leases.get(chunk_id)
+        if chunk is None or chunk.owner != worker:
+            # The chunk was re-dispatched after a lease timeout; its results still count
+            return {"event": "ack", "stop": None}
+        if results:
+            chunk.next = max(chunk.next, results[-1][0] + 1)
+        chunk.last_seen = time.monotonic()
+        self.workers[worker] = self.workers.get(worker, 0) + len(results)
+        if final:
+            self.leases.pop(chunk_id, None)
+            if chunk.remaining:
+                self._queue(chunk.matchup, chunk.next, chunk.stop)
+            return {"event": "ack", "stop": None}
+        return {"event": "ack", "stop": chunk.stop}
+
+    def _record(self, matchup: FarmMatchup, index: int, result: int):
+        if not matchup.start <= index < matchup.stop or result not in _CODES:
+            raise ValueError(f"Invalid result {result!r} for battle {index}")
+        if matchup.played(index):
+            self.stats["duplicates"] += 1
+            return
+        matchup.results[index - matchup.start] = _CODES[result]
+        matchup.estimate.record(result)
+        self.unplayed -= 1
+        if self.unplayed == 0:
+            self.finished.set()
+
+    def dispatch(self, message: dict, worker: Optional[str]) -> dict:
+        op = message.get("op")
+        if op == "hello":
+            if message.get("engine") != self.engine:
+                return {"event": "error", "message": f"Engine {message.get('engine')} does not match "
+                                                     f"coordinator engine {self.engine}"}
+            return {"event": "welcome", "worker": f"{message.get('name', 'worker')}#{next(self._worker_ids)}"}
+        if worker is None:
+            return {"event": "error", "message": "Send hello first"}
+        if op == "lease":
+            return self.lease(worker)
+        if op == "results":
+            return self.report(worker, message["chunk_id"], message["results"], bool(message.get("final")))
+        return {"event": "error", "message": f"Unknown op {op!r}"}
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    response = self.dispatch(message, worker)
+                except (KeyError, ValueError, TypeError) as e:
+                    response = {"event": "error", "message": str(e)}
+                if response["event"] == "welcome":
+                    worker = response["worker"]
+                    self.workers.setdefault(worker, 0)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+                if response["event"] == "error" and worker is None:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            lost = [c for c in self.leases.values() if c.owner == worker]
+            if lost:
+                self.stats["workers_lost"] += 1
+            for chunk in lost:
+                self._requeue(chunk)
+            writer.close()
+
+    async def _expire_leases(self):
+        while True:
+            await asyncio.sleep(max(self.lease_timeout / 4, 0.1))
+            deadline = time.monotonic() - self.lease_timeout
+            for chunk in [c for c in self.leases.values() if c.last_seen < deadline]:
+                self._requeue(chunk)
+
+    async def _print_progress(self):
+        total = sum(m.battles for m in self.matchups)
+        started = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            done = total - self.unplayed
+            print(f"{done}/{total} battles, {done / (time.perf_counter() - started):.0f}/s, "
+                  f"{len(self.leases)} chunks out, {len(self.pending)} queued")
+
+    def register_metrics(self):
+        """Expose the work queue: chunks waiting, chunks leased, battles without a result and workers seen."""
+        Gauge("pokemon_farm_chunks_queued", "Chunks waiting for a worker.", lambda: len(self.pending))
+        Gauge("pokemon_farm_chunks_leased", "Chunks being played by workers.", lambda: len(self.leases))
+        Gauge("pokemon_farm_battles_unplayed", "Battles without a result yet.", lambda: self.unplayed)
+        Gauge("pokemon_farm_workers", "Workers that have connected.", lambda: len(self.workers))
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                    on_listening=None) -> List[MatchupEstimate]:
+        """Serve workers until every battle has a result, then return the estimate per matchup.
+
+        Args:
+            on_listening: Called with the bound port once the server accepts connections
+                (useful with port 0)
+        """
+        server = await asyncio.start_server(self.handle_worker, host, port)
+        port = server.sockets[0].getsockname()[1]
+        print(f"Farm coordinator listening on {host}:{port} ({self.unplayed} battles in {len(self.pending)} chunks)")
+        if on_listening is not None:
+            on_listening(port)
+        background = [asyncio.create_task(self._expire_leases())]
+        if self.progress_interval:
+            background.append(asyncio.create_task(self._print_progress()))
+        async with server:
+            await self.finished.wait()
+        for task in background:
+            task.cancel()
+        return [m.estimate for m in self.matchups]
+
+
+class FarmWorker:
+    """Plays leased chunks and streams results back, at least every `report_interval` seconds.
+
+    Battles run synchronously; the coordinator only has to hear from the worker within
+    its lease timeout, which a report after each finished battle guarantees as long as
+    single battles are shorter than that.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, name: Optional[str] = None,
+                 report_interval: float = 0.5):
+        self.host = host
+        self.port = port
+        self.name = name or socket.gethostname()
+        self.report_interval = report_interval
+        self.simulators: Dict[str, MatchupSimulator] = {}
+        self.battles_played = 0
+
+    def _request(self, stream, message: dict) -> dict:
+        stream.write(json.dumps(message).encode() + b"\n")
+        stream.flush()
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("Coordinator closed the connection")
+        response = json.loads(line)
+        if response.get("event") == "error":
+            raise RuntimeError(response["message"])
+        return response
+
+    def _simulator(self, spec: dict) -> MatchupSimulator:
+        key = json.dumps(spec, sort_keys=True)
+        if key not in self.simulators:
+            self.simulators[key] = simulator_from_spec(spec)
+        return self.simulators[key]
+
+    def _play_chunk(self, stream, lease: dict):
+        simulator = self._simulator(lease["matchup"])
+        index, stop = lease["start"], lease["stop"]
+        results = []
+        last_report = time.monotonic()
+        while index < stop:
+            results.append([index, simulator.battle_result(index)])
+            index += 1
+            self.battles_played += 1
+            if index < stop and time.monotonic() - last_report >= self.report_interval:
+                ack = self._request(stream, {"op": "results", "chunk_id": lease["chunk_id"], "results": results,
+                                             "final": False})
+                results = []
+                last_report = time.monotonic()
+                if ack["stop"] is None:
+                    return
+                stop = ack["stop"]
+        self._request(stream, {"op": "results", "chunk_id": lease["chunk_id"], "results": results, "final": True})
+
+    def run(self) -> int:
+        """Work until the coordinator has no battles left; returns the number of battles played."""
+        with socket.create_connection((self.host, self.port)) as sock:
+            stream = sock.makefile("rwb")
+            self.name = self._request(stream, {"op": "hello", "name": self.name,
+                                               "engine": engine_fingerprint()})["worker"]
+            while True:
+                lease = self._request(stream, {"op": "lease"})
+                if lease["event"] == "done":
+                    break
+                if lease["event"] == "wait":
+                    time.sleep(lease["delay"])
+                    continue
+                self._play_chunk(stream, lease)
+        return self.battles_played
+
+
+def candidate_sweep(candidates: int, battles: int, battle_mode: BattleMode = BattleMode.SINGLE, seed: int = 0,
+                    cache: Optional[SimulationCache] = None) -> List[FarmMatchup]:
+    """Random candidate teams against the default opponent, `battles` new battles each.
+
+    With a cache, each matchup continues from its stored battles with the cache's seed
+    on a stream reserved for it, so its battles are new to the cache even if other
+    processes extend the same matchups meanwhile.
+    """
+    rng = random.Random(seed)
+    opponent = list(DEFAULT_OPPONENT_TEAM)
+    matchups = []
+    for i in range(candidates):
+        player = random_team_names(rng)
+        if cache is not None:
+            simulator = cache.simulator(player, opponent, battle_mode)
+            spec = matchup_spec(player, opponent, battle_mode, seed=simulator.seed, stream=simulator.stream)
+            matchups.append(FarmMatchup(spec, simulator.estimate.battles, battles))
+        else:
+            matchups.append(FarmMatchup(matchup_spec(player, opponent, battle_mode, seed=seed, stream=i), 0, battles))
+    return matchups
+
+
+def load_sweep(path: str, battles: int) -> List[FarmMatchup]:
+    """Matchups from a JSON list of matchup_spec keyword arguments (battle_mode as "single"/"double")."""
+    with open(path) as f:
+        entries = json.load(f)
+    matchups = []
+    for i, entry in enumerate(entries):
+        entry = dict(entry)
+        entry["battle_mode"] = BattleMode(entry.get("battle_mode", "single"))
+        entry.setdefault("stream", i)
+        matchups.append(FarmMatchup(matchup_spec(**entry), 0, entry.get("battles", battles)))
+    return matchups
+
+
+def save_to_cache(cache: SimulationCache, matchups: Sequence[FarmMatchup]):
+    """Add the farm's results to the cache entries the matchups were started from."""
+    for matchup in matchups:
+        spec = matchup.spec
+        description = cache.describe(spec["player"], spec["opponent"], BattleMode(spec["battle_mode"]),
+                                     spec["player_policy"], spec["opponent_policy"], spec["level"], spec["max_turns"])
+        key = cache.key(description)
+        if int(key[:12], 16) != spec["seed"]:
+            raise RuntimeError(f"Cache entry for {spec['player']} belongs to a different engine or matchup")
+        estimate = matchup.estimate
+        cache.add(key, description, estimate.wins, estimate.losses, estimate.draws)
+
+
+def print_estimates(matchups: Sequence[FarmMatchup]):
+    for matchup in sorted(matchups, key=lambda m: -m.estimate.win_rate):
+        low, high = matchup.estimate.interval()
+        print(f"  {', '.join(matchup.spec['player'])}: {matchup.estimate.win_rate:.3f} "
+              f"[{low:.3f}, {high:.3f}] over {matchup.estimate.battles} battles")
+
+
+async def local_demo(matchups: List[FarmMatchup], workers: int, kill_after: float, chunk_size: int,
+                     lease_timeout: float) -> FarmCoordinator:
+    """Run a coordinator and `workers` worker processes on localhost, killing one worker after `kill_after` s."""
+    coordinator = FarmCoordinator(matchups, chunk_size=chunk_size, lease_timeout=lease_timeout, progress_interval=2.0)
+    listening = asyncio.get_running_loop().create_future()
+    serving = asyncio.create_task(coordinator.serve(port=0, on_listening=listening.set_result))
+    port = await listening
+    processes = [await asyncio.create_subprocess_exec(sys.executable, __file__, "worker", "--port", str(port),
+                                                      "--name", f"local-{i}")
+                 for i in range(workers)]
+    if kill_after > 0 and workers > 1:
+        await asyncio.wait([serving], timeout=kill_after)
+        if not serving.done():
+            print(f"Killing worker local-0 (pid {processes[0].pid})")
+            processes[0].kill()
+    await serving
+    for process in processes:
+        await process.wait()
+    return coordinator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spread a battle simulation sweep over worker processes on many hosts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("coordinator", "worker", "demo"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("--port", type=int, default=DEFAULT_PORT if name != "demo" else 0)
+        if name != "demo":
+            sub.add_argument("--host", default="127.0.0.1",
+                             help="Address to listen on (coordinator; use 0.0.0.0 for remote workers) or connect to")
+    for name in ("coordinator", "demo"):
+        sub = subparsers.choices[name]
+        sub.add_argument("--candidates", type=int, default=8, help="Random candidate teams against the default opponent")
+        sub.add_argument("--battles", type=int, default=400, help="Battles per matchup")
+        sub.add_argument("--mode", choices=["single", "double"], default="single")
+        sub.add_argument("--seed", type=int, default=0)
+        sub.add_argument("--chunk-size", type=int, default=200)
+        sub.add_argument("--lease-timeout", type=float, default=30.0)
+    for name in ("coordinator", "worker"):
+        add_metrics_arguments(subparsers.choices[name])
+    coordinator = subparsers.choices["coordinator"]
+    coordinator.add_argument("--sweep", help="JSON list of matchups instead of random candidates")
+    coordinator.add_argument("--cache", help="SQLite simulation cache to continue from and add to (see pokemon_cache)")
+    worker = subparsers.choices["worker"]
+    worker.add_argument("--name", help="Worker name shown by the coordinator (defaults to the host name)")
+    demo = subparsers.choices["demo"]
+    demo.add_argument("--workers", type=int, default=3)
+    demo.add_argument("--kill-after", type=float, default=1.0, help="Kill one worker after this many seconds (0: never)")
+    demo.add_argument("--verify", action="store_true", help="Replay every matchup in this process and compare")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        start_metrics(args)
+        worker = FarmWorker(args.host, args.port, args.name)
+        try:
+            worker.run()
+        except ConnectionError as e:
+            print(f"Lost the coordinator: {e}")
+        print(f"Worker {worker.name} played {worker.battles_played} battles")
+        return
+
+    battle_mode = BattleMode.DOUBLE if args.mode == "double" else BattleMode.SINGLE
+    started = time.perf_counter()
+    if args.command == "demo":
+        matchups = candidate_sweep(args.candidates, args.battles, battle_mode, args.seed)
+        farm = asyncio.run(local_demo(matchups, args.workers, args.kill_after, args.chunk_size, args.lease_timeout))
+    else:
+        cache = SimulationCache(args.cache) if args.cache else None
+        if args.sweep:
+            matchups = load_sweep(args.sweep, args.battles)
+        else:
+            matchups = candidate_sweep(args.candidates, args.battles, battle_mode, args.seed, cache)
+        farm = FarmCoordinator(matchups, chunk_size=args.chunk_size, lease_timeout=args.lease_timeout)
+        if start_metrics(args):
+            farm.register_metrics()
+        asyncio.run(farm.serve(args.host, args.port))
+        if cache is not None:
+            save_to_cache(cache, matchups)
+            cache.close()
+
+    elapsed = time.perf_counter() - started
+    total = sum(m.battles for m in matchups)
+    print(f"{total} battles in {elapsed:.1f} s ({total / elapsed:.0f}/s) from {len(farm.workers)} workers: "
+          + ", ".join(f"{name} {count}" for name, count in sorted(farm.workers.items())))
+    print("  " + ", ".join(f"{key} {value}" for key, value in farm.stats.items()))
+    print_estimates(matchups)
+
+    if args.command == "demo" and args.verify:
+        mismatches = 0
+        for matchup in matchups:
+            simulator = simulator_from_spec(matchup.spec)
+            local = MatchupEstimate()
+            for index in range(matchup.start, matchup.stop):
+                local.record(simulator.battle_result(index))
+            mismatches += local != matchup.estimate
+        print(f"Verified against a local replay: {mismatches} mismatching matchups")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+from typing import List, Optional, Union
+import time
+import asyncio
+import inspect
+import argparse
+from concurrent.futures import Executor
+import numpy as np
+
+from pokemon_battle import Team, Battle, BattleMode, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+from pokemon_adversary import Adversary
+from pokemon_encoder import BattleEncoder
+from pokemon_env import action_mask, action_mask_shape, decode_action, num_actions, replace_fainted, sanitize_actions
+from pokemon_metrics import Histogram, battle_recorder
+from pokemon_selfplay import battle_rng, build_team, random_team_names
+
+# A batched policy is any object with
+#   evaluate(observations, masks) -> actions
+# taking float32 observations of shape (batch, encoder size) and bool masks of shape
+# (batch, *action_mask_shape(mode)), and returning int action indices of shape
+# (batch, active slots) that are legal wherever the mask allows any action.
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+INFERENCE_BATCH_SIZE = Histogram("pokemon_inference_batch_size", "Decisions evaluated per batched policy call.",
+                                 buckets=BATCH_SIZE_BUCKETS)
+INFERENCE_SECONDS = Histogram("pokemon_inference_seconds", "Batched policy evaluation latency.")
+
+
+def masked_argmax(logits: np.ndarray, masks: np.ndarray) -> np.ndarray:
+    """Index of the best legal logit on the last axis (0 where nothing is legal)."""
+    return np.where(masks, logits, -np.inf).argmax(axis=-1)
+
+
+class LinearPolicy:
+    """Linear scores over the encoded battle, one set per active slot, played greedily among legal actions.
+
+    The simplest learned policy; its evaluation is a single matrix product for the
+    whole batch.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, battle_mode: BattleMode):
+        self.battle_mode = battle_mode
+        self.num_active = 1 if battle_mode == BattleMode.SINGLE else 2
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        if self.weights.shape[1] != self.num_active * num_actions(battle_mode):
+            raise ValueError(f"Expected {self.num_active * num_actions(battle_mode)} outputs, "
+                             f"got {self.weights.shape[1]}")
+
+    @classmethod
+    def random(cls, battle_mode: BattleMode, seed: int = 0, scale: float = 0.1) -> "LinearPolicy":
+        """Randomly initialized weights, e.g. for benchmarks or as a training starting point."""
+        rng = np.random.default_rng(seed)
+        outputs = (1 if battle_mode == BattleMode.SINGLE else 2) * num_actions(battle_mode)
+        size = BattleEncoder(battle_mode).size
+        return cls(rng.normal(0.0, scale, (size, outputs)), np.zeros(outputs), battle_mode)
+
+    def evaluate(self, observations: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        logits = observations @ self.weights + self.bias
+        logits = logits.reshape(len(observations), self.num_active, num_actions(self.battle_mode))
+        return masked_argmax(logits, masks.reshape(logits.shape))
+
+
+class PolicyBatcher:
+    """Coalesces decision requests from many concurrent battles into batched policy calls.
+
+    Requests are encoded straight into a shared batch buffer. A batch is evaluated
+    once it holds `max_batch_size` requests or `max_delay` seconds after its first
+    request (0 means as soon as the event loop has run every battle that is ready),
+    and each request's future is resolved with its row of the result. With an
+    `executor` the evaluation runs off the event loop, so battles keep filling the
+    next batch meanwhile.
+    """
+
+    def __init__(self, policy, battle_mode: BattleMode, max_batch_size: int = 256, max_delay: float = 0.002,
+                 executor: Optional[Executor] = None):
+        self.policy = policy
+        self.battle_mode = battle_mode
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.executor = executor
+        self.encoder = BattleEncoder(battle_mode)
+        self.mask_shape = action_mask_shape(battle_mode)
+        self.batches = 0
+        self.requests = 0
+        self._futures: List[asyncio.Future] = []
+        self._timer = None
+        self._observations, self._masks = self._allocate()
+
+    def _allocate(self):
+        return (self.encoder.allocate(self.max_batch_size),
+                np.zeros((self.max_batch_size,) + self.mask_shape, dtype=bool))
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+    def decide(self, battle: Battle, perspective: str, mask: np.ndarray) -> asyncio.Future:
+        """Queue a decision for one side of `battle`; the returned future resolves to its action indices.
+
+        Args:
+            battle: The battle, encoded now, so it may change once this returns
+            perspective: "player" or "opponent"
+            mask: Legal actions of that side (see pokemon_env.action_mask)
+        """
+        loop = asyncio.get_running_loop()
+        row = len(self._futures)
+        self.encoder.encode(battle, self._observations[row], perspective)
+        self._masks[row] = mask
+        future = loop.create_future()
+        self._futures.append(future)
+        if row + 1 >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            if self.max_delay > 0:
+                self._timer = loop.call_later(self.max_delay, self.flush)
+            else:
+                self._timer = loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        """Evaluate the queued requests now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        futures = self._futures
+        if not futures:
+            return
+        observations, masks = self._observations[:len(futures)], self._masks[:len(futures)]
+        self._futures = []
+        self.batches += 1
+        self.requests += len(futures)
+        INFERENCE_BATCH_SIZE.observe(len(futures))
+        if self.executor is None:
+            self._resolve(futures, self._evaluate, observations, masks)
+        else:
+            # The evaluation still reads these buffers, so the next batch gets new ones
+            self._observations, self._masks = self._allocate()
+            call = asyncio.get_running_loop().run_in_executor(self.executor, self._evaluate, observations, masks)
+            call.add_done_callback(lambda done: self._resolve(futures, done.result))
+
+    def _evaluate(self, observations: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        started = time.perf_counter()
+        actions = self.policy.evaluate(observations, masks)
+        INFERENCE_SECONDS.observe(time.perf_counter() - started)
+        return actions
+
+    @staticmethod
+    def _resolve(futures: List[asyncio.Future], evaluate, *args):
+        try:
+            actions = evaluate(*args)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, row in zip(futures, actions.tolist()):
+            if not future.done():
+                future.set_result(row)
+
+
+class BatchedPolicyClient:
+    """One side of one battle, deciding through a shared PolicyBatcher.
+
+    Its choose_action is a coroutine, for play_battle_async.
+    """
+
+    def __init__(self, batcher: PolicyBatcher, battle: Battle, perspective: str = "player"):
+        self.batcher = batcher
+        self.battle = battle
+        self.perspective = perspective
+        self.team = battle.player_team if perspective == "player" else battle.opponent_team
+        self.mask = np.zeros(batcher.mask_shape, dtype=bool)
+
+    async def choose_action(self, opponent_team: Team) -> Union[tuple, List[tuple]]:
+        action_mask(self.team, opponent_team, self.mask)
+        indices = await self.batcher.decide(self.battle, self.perspective, self.mask)
+        if self.team.battle_mode == BattleMode.SINGLE:
+            return decode_action(self.team, indices[0], self.mask)
+        return decode_action(self.team, indices, self.mask)
+
+
+async def _choose(policy, opponent_team: Team):
+    actions = policy.choose_action(opponent_team)
+    return await actions if inspect.isawaitable(actions) else actions
+
+
+async def play_battle_async(battle: Battle, player_ai, opponent_ai, max_turns: int = 200) -> int:
+    """pokemon_selfplay.play_battle for policies whose choose_action may be a coroutine.
+
+    Both sides decide concurrently, so two batched clients of one battle share a batch.
+
+    Returns:
+        1 if the player won, -1 if the opponent won, 0 for a draw
+    """
+    # Coroutine decisions wait on a shared batch, so only the synchronous ones are timed
+    policies = (player_ai, opponent_ai)
+    recorder = battle_recorder(battle, policies,
+                               [p for p in policies if not inspect.iscoroutinefunction(p.choose_action)])
+    result = 0
+    while not battle.is_battle_over():
+        if battle.turn_count >= max_turns:
+            break
+        player_actions, opponent_actions = await asyncio.gather(_choose(player_ai, battle.opponent_team),
+                                                                _choose(opponent_ai, battle.player_team))
+        battle.execute_turn(sanitize_actions(battle.player_team, player_actions),
+                            sanitize_actions(battle.opponent_team, opponent_actions))
+        if not battle.is_battle_over():
+            replace_fainted(battle.player_team)
+            replace_fainted(battle.opponent_team)
+    else:
+        result = -1 if battle.player_team.is_defeated() else 1
+    if recorder is not None:
+        recorder.finish(result)
+    return result
+
+
+async def play_batched(policy, num_battles: int, battle_mode: BattleMode = BattleMode.SINGLE,
+                       opponent: str = "adversary", random_teams: bool = False, level: int = 50,
+                       max_turns: int = 200, seed: int = 0, concurrency: int = 256, **batcher_kwargs):
+    """Play battles [0, num_battles) concurrently with `policy` on the player side of every one.
+
+    Args:
+        opponent: "adversary" for the rule-based opponent, or "self" for `policy` on both sides
+        concurrency: Battles in flight at once
+        batcher_kwargs: Passed on to PolicyBatcher
+
+    Returns:
+        (outcome per battle, the batcher)
+    """
+    batcher = PolicyBatcher(policy, battle_mode, **batcher_kwargs)
+    outcomes = [0] * num_battles
+    ids = iter(range(num_battles))
+
+    async def run():
+        for battle_id in ids:
+            rng = battle_rng(seed, battle_id)
+            if random_teams:
+                player_names, opponent_names = random_team_names(rng), random_team_names(rng)
+            else:
+                player_names, opponent_names = DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+            battle = Battle(build_team(player_names, battle_mode, level, rng),
+                            build_team(opponent_names, battle_mode, level, rng), verbose=False, rng=rng)
+            if opponent == "self":
+                opponent_ai = BatchedPolicyClient(batcher, battle, "opponent")
+            else:
+                opponent_ai = Adversary(battle.opponent_team, battle_mode, rng=rng)
+            outcomes[battle_id] = await play_battle_async(battle, BatchedPolicyClient(batcher, battle, "player"),
+                                                          opponent_ai, max_turns)
+
+    await asyncio.gather(*(run() for _ in range(min(concurrency, num_battles))))
+    return outcomes, batcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one-at-a-time and batched policy inference "
+                                                 "over many concurrent battles.")
+    parser.add_argument("--battles", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-delay", type=float, default=0.0, help="Seconds to wait for a batch to fill")
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--opponent", choices=["adversary", "self"], default="self")
+    parser.add_argument("--random-teams", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    battle_mode = BattleMode(args.mode)
+    policy = LinearPolicy.random(battle_mode, args.seed)
+    results = []
+    for max_batch_size in (1, args.max_batch_size):
+        policy_seconds = INFERENCE_SECONDS.labels().totals()[-1]
+        started = time.perf_counter()
+        outcomes, batcher = asyncio.run(play_batched(
+            policy, args.battles, battle_mode, args.opponent, args.random_teams, seed=args.seed,
+            concurrency=args.concurrency, max_batch_size=max_batch_size, max_delay=args.max_delay))
+        elapsed = time.perf_counter() - started
+        policy_seconds = INFERENCE_SECONDS.labels().totals()[-1] - policy_seconds
+        results.append(outcomes)
+        print(f"max batch {max_batch_size}: {batcher.requests} decisions in {elapsed:.2f} s "
+              f"({batcher.requests / elapsed:.0f}/s), mean batch {batcher.mean_batch_size:.1f}, "
+              f"{policy_seconds / batcher.requests * 1e6:.1f} us policy time per decision, "
+              f"record {outcomes.count(1)}-{outcomes.count(-1)}-{outcomes.count(0)}")
+    print("Outcomes identical: " + ("yes" if results[0] == results[1] else "NO"))
+
+
+if __name__ == "__main__":
+    main()
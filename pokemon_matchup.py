@@ -0,0 +1,258 @@
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, Union
+import copy
+import math
+import time
+import random
+import argparse
+
+from pokemon_battle import Team, Battle, BattleMode, DEFAULT_OPPONENT_TEAM
+from pokemon_selfplay import POLICIES, battle_rng, build_team, play_battle, random_team_names
+
+# A team for simulation: species names (movesets are sampled per battle) or a fixed Team,
+# which every battle starts from full health
+TeamSpec = Union[Sequence[str], Team]
+
+# Normal quantiles for common confidence levels
+Z_SCORES = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+
+def z_score(confidence: float) -> float:
+    if confidence not in Z_SCORES:
+        raise ValueError(f"Unsupported confidence {confidence}; use one of {sorted(Z_SCORES)}")
+    return Z_SCORES[confidence]
+
+
+def wilson_interval(score: float, n: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """Wilson score interval for a win rate from `score` points (draws count 1/2) in `n` battles."""
+    if n == 0:
+        return 0.0, 1.0
+    z = z_score(confidence)
+    p = score / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+@dataclass
+class MatchupEstimate:
+    """Running result of simulated battles between a player team and an opponent team."""
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+
+    @property
+    def battles(self) -> int:
+        return self.wins + self.losses + self.draws
+
+    @property
+    def score(self) -> float:
+        return self.wins + 0.5 * self.draws
+
+    @property
+    def win_rate(self) -> float:
+        return self.score / self.battles if self.battles else 0.5
+
+    def interval(self, confidence: float = 0.95) -> Tuple[float, float]:
+        return wilson_interval(self.score, self.battles, confidence)
+
+    def record(self, result: int):
+        if result > 0:
+            self.wins += 1
+        elif result < 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+
+class MatchupSimulator:
+    """Plays reproducible battles between two teams, one at a time.
+
+    Battle `i` of stream `stream` always uses the same random source, so a run that
+    stops early is a prefix of a longer run with the same seed.
+    """
+
+    def __init__(self, player: TeamSpec, opponent: TeamSpec, battle_mode: BattleMode = BattleMode.SINGLE,
+                 player_policy: str = "adversary", opponent_policy: str = "adversary",
+                 level: int = 50, max_turns: int = 200, seed: int = 0, stream: int = 0):
+        self.player = player
+        self.opponent = opponent
+        self.battle_mode = battle_mode
+        self.player_policy = POLICIES[player_policy]
+        self.opponent_policy = POLICIES[opponent_policy]
+        self.level = level
+        self.max_turns = max_turns
+        self.seed = seed
+        self.stream = stream
+        self.estimate = MatchupEstimate()
+        # side -> working copy of a fixed Team spec, reset in place before each battle
+        self._fixed = {}
+
+    def _team(self, side: str, spec: TeamSpec, rng: random.Random) -> Team:
+        if isinstance(spec, Team):
+            team = self._fixed.get(side)
+            if team is None:
+                team = self._fixed[side] = copy.deepcopy(spec)
+            team.reset()
+            return team
+        return build_team(spec, self.battle_mode, self.level, rng)
+
+    def battle_result(self, index: int) -> int:
+        """Play battle `index` of this stream without recording it (1 win, -1 loss, 0 draw)."""
+        rng = battle_rng(self.seed, (self.stream << 24) + index)
+        player = self._team("player", self.player, rng)
+        opponent = self._team("opponent", self.opponent, rng)
+        battle = Battle(player, opponent, verbose=False, rng=rng)
+        return play_battle(battle, self.player_policy(player, self.battle_mode, rng=rng),
+                           self.opponent_policy(opponent, self.battle_mode, rng=rng), self.max_turns)
+
+    def play(self, battles: int = 1) -> MatchupEstimate:
+        """Play `battles` more battles and return the updated estimate."""
+        for _ in range(battles):
+            self.estimate.record(self.battle_result(self.estimate.battles))
+        return self.estimate
+
+
+def estimate_win_rate(simulator: MatchupSimulator, width: float = 0.1, confidence: float = 0.95,
+                      min_battles: int = 10, max_battles: int = 1000, batch: int = 5) -> MatchupEstimate:
+    """Simulate until the Wilson interval is at most `width` wide (or `max_battles` is reached).
+
+    Lopsided matchups reach a narrow interval after a handful of battles, while close
+    ones keep simulating; the interval is checked after every `batch` battles.
+    """
+    estimate = simulator.play(max(0, min(min_battles, max_battles) - simulator.estimate.battles))
+    while estimate.battles < max_battles:
+        low, high = estimate.interval(confidence)
+        if high - low <= width:
+            break
+        estimate = simulator.play(min(batch, max_battles - estimate.battles))
+    return estimate
+
+
+def sprt(simulator: MatchupSimulator, p0: float = 0.45, p1: float = 0.55, alpha: float = 0.05,
+         beta: float = 0.05, max_battles: int = 1000) -> Tuple[Optional[bool], MatchupEstimate]:
+    """Sequential probability ratio test of H0: win rate = p0 against H1: win rate = p1.
+
+    Draws carry no information about which side is stronger and are skipped.
+
+    Returns:
+        (True if H1 is accepted, False if H0 is accepted, None if undecided after
+        max_battles; the estimate)
+    """
+    upper = math.log((1 - beta) / alpha)
+    lower = math.log(beta / (1 - alpha))
+    win_step = math.log(p1 / p0)
+    loss_step = math.log((1 - p1) / (1 - p0))
+    while simulator.estimate.battles < max_battles:
+        estimate = simulator.play()
+        llr = estimate.wins * win_step + estimate.losses * loss_step
+        if llr >= upper:
+            return True, estimate
+        if llr <= lower:
+            return False, estimate
+    return None, simulator.estimate
+
+
+def rank_candidates(candidates: Sequence[TeamSpec], opponent: TeamSpec, top_k: int = 1,
+                    confidence: float = 0.95, tolerance: float = 0.1, min_battles: int = 10,
+                    budget: int = 5000, batch: int = 5, seed: int = 0,
+                    battle_mode: BattleMode = BattleMode.SINGLE, cache=None, **simulator_kwargs
+                    ) -> Tuple[List[int], List[MatchupEstimate]]:
+    """Find the `top_k` candidates with the best win rate against `opponent`, bandit style.
+
+    Every candidate gets `min_battles` battles, then each round simulates only the two
+    arms that decide the top-k boundary (LUCB): the weakest-looking member of the top
+    set (lowest lower bound) and the strongest-looking outsider (highest upper bound).
+    It stops once those intervals are separated, up to `tolerance`, or the total budget
+    is spent, so clearly good or clearly bad candidates stop getting simulations early.
+    With a SimulationCache (see pokemon_cache), candidates start from their stored
+    results, only new battles count against the budget, and results are saved back.
+
+    Returns:
+        (candidate indices ordered by estimated win rate, estimate per candidate)
+    """
+    if cache is not None:
+        simulators = [cache.simulator(candidate, opponent, battle_mode, **simulator_kwargs) for candidate in candidates]
+    else:
+        simulators = [MatchupSimulator(candidate, opponent, battle_mode, seed=seed, stream=i, **simulator_kwargs)
+                      for i, candidate in enumerate(candidates)]
+    spent = 0
+    for simulator in simulators:
+        missing = max(0, min_battles - simulator.estimate.battles)
+        simulator.play(missing)
+        spent += missing
+
+    while top_k < len(simulators) and spent < budget:
+        rates = [s.estimate.win_rate for s in simulators]
+        order = sorted(range(len(simulators)), key=lambda i: -rates[i])
+        top, rest = order[:top_k], order[top_k:]
+        intervals = [s.estimate.interval(confidence) for s in simulators]
+        weakest = min(top, key=lambda i: intervals[i][0])
+        challenger = max(rest, key=lambda i: intervals[i][1])
+        if intervals[challenger][1] - intervals[weakest][0] <= tolerance:
+            break
+        for i in (weakest, challenger):
+            simulators[i].play(batch)
+        spent += 2 * batch
+
+    if cache is not None:
+        for simulator in simulators:
+            cache.save(simulator)
+    estimates = [s.estimate for s in simulators]
+    ranking = sorted(range(len(simulators)), key=lambda i: -estimates[i].win_rate)
+    return ranking, estimates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank random candidate teams against an opponent with adaptive simulation.")
+    parser.add_argument("--candidates", type=int, default=12)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--fixed-battles", type=int, default=100, help="Battles per candidate for the fixed-N comparison")
+    parser.add_argument("--width", type=float, default=0.2, help="Interval width for the single-matchup estimates")
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", help="SQLite simulation cache to reuse and extend (see pokemon_cache)")
+    args = parser.parse_args()
+
+    battle_mode = BattleMode.DOUBLE if args.mode == "double" else BattleMode.SINGLE
+    rng = random.Random(args.seed)
+    candidates = [random_team_names(rng) for _ in range(args.candidates)]
+    opponent = list(DEFAULT_OPPONENT_TEAM)
+
+    started = time.perf_counter()
+    used = []
+    for i, candidate in enumerate(candidates):
+        estimate = estimate_win_rate(MatchupSimulator(candidate, opponent, battle_mode, seed=args.seed, stream=i),
+                                     width=args.width)
+        used.append(estimate.battles)
+    print(f"Sequential estimates to width {args.width}: {sum(used)} battles "
+          f"(min {min(used)}, max {max(used)}) in {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    cache = None
+    if args.cache:
+        from pokemon_cache import SimulationCache
+        cache = SimulationCache(args.cache)
+    ranking, estimates = rank_candidates(candidates, opponent, top_k=args.top_k, seed=args.seed,
+                                         battle_mode=battle_mode, cache=cache)
+    adaptive_battles = sum(e.battles for e in estimates)
+    if cache is not None:
+        cache.close()
+    print(f"Adaptive top-{args.top_k}: {adaptive_battles} battles in {time.perf_counter() - started:.1f} s")
+    for i in ranking[:args.top_k]:
+        low, high = estimates[i].interval()
+        print(f"  {', '.join(candidates[i])}: {estimates[i].win_rate:.2f} [{low:.2f}, {high:.2f}] "
+              f"over {estimates[i].battles} battles")
+
+    started = time.perf_counter()
+    fixed = [MatchupSimulator(c, opponent, battle_mode, seed=args.seed, stream=i).play(args.fixed_battles)
+             for i, c in enumerate(candidates)]
+    fixed_ranking = sorted(range(len(fixed)), key=lambda i: -fixed[i].win_rate)
+    print(f"Fixed {args.fixed_battles} per candidate: {args.fixed_battles * len(candidates)} battles in "
+          f"{time.perf_counter() - started:.1f} s, top-{args.top_k} {fixed_ranking[:args.top_k]} "
+          f"(adaptive: {ranking[:args.top_k]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import os
+import atexit
+import time
+from bisect import bisect_left
+import random
+import argparse
+import functools
+import itertools
+import threading
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets (seconds) for decisions and turns: 10 us .. 1 s
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 0.1, 1.0)
+
+DEFAULT_METRICS_PORT = 9108
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Cells:
+    """Per-thread value cells of one metric (or label combination).
+
+    Each thread updates only its own cell (a list found through a threading.local), so
+    the hot path takes no lock; the lock is taken once per thread to register its cell,
+    and scrapes sum all cells. Reads can race with updates and be one increment behind,
+    which a monitoring scrape tolerates.
+    """
+    __slots__ = ("_width", "_local", "_cells", "_lock")
+
+    def __init__(self, width: int):
+        self._width = width
+        self._local = threading.local()
+        self._cells: List[list] = []
+        self._lock = threading.Lock()
+
+    def _register(self) -> list:
+        cell = [0] * self._width
+        with self._lock:
+            self._cells.append(cell)
+        self._local.cell = cell
+        return cell
+
+    def totals(self) -> list:
+        with self._lock:
+            cells = list(self._cells)
+        return [sum(column) for column in zip(*cells)] if cells else [0] * self._width
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["MetricsRegistry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The child for one combination of label values (created on first use).
+
+        Hot paths should keep the child rather than look it up on every update.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(suffix, label text, value) of every sample to expose."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{suffix}{labels} {_format_value(value)}" for suffix, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class _CounterChild(_Cells):
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._register()
+        cell[0] += amount
+
+    def value(self) -> float:
+        return self.totals()[0]
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. battles finished."""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+    def value(self) -> float:
+        return self._children[()].value()
+
+    def samples(self):
+        return [("", _format_labels(self.labelnames, values), child.value())
+                for values, child in list(self._children.items())]
+
+
+class _HistogramChild(_Cells):
+    __slots__ = ("_bounds",)
+
+    def __init__(self, bounds: Sequence[float]):
+        # One count per bucket (the last is +Inf), then the sum; the total count is their sum
+        super().__init__(len(bounds) + 2)
+        self._bounds = bounds
+
+    def observe(self, value: float):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._register()
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def count(self) -> int:
+        return sum(self.totals()[:-1])
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (typically latencies in seconds) over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional["MetricsRegistry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def time(self):
+        return self._children[()].time()
+
+    def samples(self):
+        samples = []
+        for values, child in list(self._children.items()):
+            totals = child.totals()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), totals):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                samples.append(("_bucket", _format_labels(self.labelnames, values, le), cumulative))
+            samples.append(("_sum", _format_labels(self.labelnames, values), totals[-1]))
+            samples.append(("_count", _format_labels(self.labelnames, values), cumulative))
+        return samples
+
+
+class Gauge(_Metric):
+    """Current level (queue depth, hit rate), either set() by its owner or read from `function` at scrape time.
+
+    A callback costs nothing between scrapes; set() is a plain attribute store, so it is
+    meant for levels that one thread maintains.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None,
+                 registry: Optional["MetricsRegistry"] = None):
+        self.function = function
+        self.value = 0
+        super().__init__(name, documentation, (), registry)
+
+    def _new_child(self):
+        return None
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        if self.function is None:
+            return [("", "", self.value)]
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        return [] if value is None else [("", "", value)]
+
+
+class MetricsRegistry:
+    """Named metrics, rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Engine metrics, updated once instrument_engine() has been called
+BATTLES_STARTED = Counter("pokemon_battles_started_total", "Battles created.")
+BATTLES_FINISHED = Counter("pokemon_battles_finished_total", "Battles that ended with a winner.")
+TURN_SECONDS = Histogram("pokemon_turn_seconds", "Battle.execute_turn latency (sampled battles).")
+TURNS = Counter("pokemon_turns_total", "Turns executed.")
+DECISION_SECONDS = Histogram("pokemon_decision_seconds", "choose_action latency by policy (sampled battles).",
+                             ["policy"])
+DECISIONS = Counter("pokemon_decisions_total", "AI decisions (choose_action calls) by policy.", ["policy"])
+SELFPLAY_BATTLES = Counter("pokemon_selfplay_battles_total", "Self-play battles whose records were written.")
+SELFPLAY_RECORDS = Counter("pokemon_selfplay_records_total", "Self-play decision records written.")
+SELFPLAY_CHUNKS_IN_FLIGHT = Gauge("pokemon_selfplay_chunks_in_flight", "Self-play chunks queued to worker processes.")
+CACHE_LOOKUPS = Counter("pokemon_cache_lookups_total", "Lookups in result and position caches.", ["cache", "result"])
+
+_PROCESS_START = time.time()
+Gauge("process_start_time_seconds", "Start time of the process since the epoch.", lambda: _PROCESS_START)
+Gauge("process_cpu_seconds_total", "CPU time used by the process.", time.process_time)
+
+
+def cache_hit_rate(cache: str) -> Optional[float]:
+    """Fraction of lookups in `cache` that hit so far (None before the first lookup)."""
+    hits = CACHE_LOOKUPS.labels(cache, "hit").value()
+    total = hits + CACHE_LOOKUPS.labels(cache, "miss").value()
+    return hits / total if total else None
+
+
+def register_queue_gauge(name: str, documentation: str, function: Callable[[], float]) -> Gauge:
+    """Expose a queue depth (or any other level) that `function` reads when scraped."""
+    return Gauge(name, documentation, function)
+
+
+# One battle in this many has its turns and decisions timed; counts cover every battle
+TIMING_SAMPLE_EVERY = 8
+
+_instrumented = False
+_instrument_lock = threading.Lock()
+_battle_numbers = itertools.count()
+
+
+def _timed(method, child: "_HistogramChild"):
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            child.observe(perf_counter() - started)
+    return timed
+
+
+class BattleRecorder:
+    """Engine metrics of one battle, recorded by the game loop that plays it.
+
+    Counts are exact and added once, by finish(): the battle, its turns, one decision
+    per turn for each of `policies`, transposition table lookups, and a winner if there
+    was one. One battle in TIMING_SAMPLE_EVERY is also timed: its execute_turn and the
+    choose_action of `timed_policies` (default: `policies`) are wrapped on the instances
+    until finish(), so every other battle runs without per-call overhead.
+    """
+
+    def __init__(self, battle, policies: Sequence = (), timed_policies: Optional[Sequence] = None):
+        self.battle = battle
+        self.policies = list(policies)
+        self.start_turn = battle.turn_count
+        self.timed = next(_battle_numbers) % TIMING_SAMPLE_EVERY == 0
+        self._wrapped = []
+        self._finished = False
+        BATTLES_STARTED.inc()
+        if self.timed:
+            self._wrap(battle, "execute_turn", TURN_SECONDS.labels())
+            for policy in self.policies if timed_policies is None else timed_policies:
+                self._wrap(policy, "choose_action", DECISION_SECONDS.labels(type(policy).__name__))
+
+    def _wrap(self, owner, name: str, child: "_HistogramChild"):
+        setattr(owner, name, _timed(getattr(owner, name), child))
+        self._wrapped.append((owner, name))
+
+    def finish(self, result: Optional[int] = None):
+        """Add the battle's counts and unwrap it; `result` is None for a battle abandoned
+        unfinished and 0 for a draw. Later calls do nothing."""
+        if self._finished:
+            return
+        self._finished = True
+        for owner, name in self._wrapped:
+            delattr(owner, name)
+        turns = self.battle.turn_count - self.start_turn
+        TURNS.inc(turns)
+        tables = {}
+        for policy in self.policies:
+            DECISIONS.labels(type(policy).__name__).inc(turns)
+            table = getattr(policy, "transposition_table", None)
+            if table is not None:
+                tables[id(table)] = table
+        # Tables count their own lookups; each report adds what happened since the last one
+        for table in tables.values():
+            hits, misses = table.__dict__.get("_reported_lookups", (0, 0))
+            table._reported_lookups = (table.hits, table.misses)
+            CACHE_LOOKUPS.labels("transposition", "hit").inc(table.hits - hits)
+            CACHE_LOOKUPS.labels("transposition", "miss").inc(table.misses - misses)
+        if result:
+            BATTLES_FINISHED.inc()
+
+
+def battle_recorder(battle, policies: Sequence = (), timed_policies: Optional[Sequence] = None
+                    ) -> Optional[BattleRecorder]:
+    """A BattleRecorder for a battle about to be played, or None unless instrument_engine() was called."""
+    if not _instrumented:
+        return None
+    return BattleRecorder(battle, policies, timed_policies)
+
+
+def instrument_engine():
+    """Turn on engine metrics; idempotent, and free when never called.
+
+    Game loops record their battles through battle_recorder() (pokemon_selfplay.play_battle,
+    which self-play, matchups, the farm, tournaments and the tuner use, and the server and
+    batched inference loops), and SimulationCache.lookup, called once per matchup, is
+    wrapped to count hits.
+    """
+    global _instrumented
+    with _instrument_lock:
+        if _instrumented:
+            return
+        _instrumented = True
+    from pokemon_cache import SimulationCache
+
+    simulation_lookup = SimulationCache.lookup
+
+    @functools.wraps(simulation_lookup)
+    def counted_simulation_lookup(self, key):
+        estimate = simulation_lookup(self, key)
+        CACHE_LOOKUPS.labels("simulation", "hit" if estimate.battles else "miss").inc()
+        return estimate
+
+    SimulationCache.lookup = counted_simulation_lookup
+    for cache in ("simulation", "transposition"):
+        Gauge(f"pokemon_{cache}_cache_hit_ratio", f"Hit fraction of {cache} cache lookups.",
+              functools.partial(cache_hit_rate, cache))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int = DEFAULT_METRICS_PORT, host: str = "127.0.0.1",
+                      registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread; call shutdown() on the result to stop it."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_metrics_file(path: str, registry: MetricsRegistry = REGISTRY):
+    """Write the current metrics atomically (e.g. for node_exporter's textfile collector)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_file_writer(path: str, interval: float = 10.0, registry: MetricsRegistry = REGISTRY) -> threading.Event:
+    """Rewrite `path` every `interval` seconds from a daemon thread, and once more at exit.
+
+    Set the returned event to stop the thread.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            write_metrics_file(path, registry)
+
+    threading.Thread(target=run, name="metrics-file", daemon=True).start()
+    atexit.register(write_metrics_file, path, registry)
+    return stop
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this local port")
+    parser.add_argument("--metrics-file", help="Periodically write Prometheus metrics to this file")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between metrics file writes")
+
+
+def start_metrics(args: argparse.Namespace) -> bool:
+    """Instrument the engine and start the exporters requested by add_metrics_arguments' options.
+
+    Returns:
+        Whether metrics are enabled
+    """
+    if args.metrics_port is None and not args.metrics_file:
+        return False
+    instrument_engine()
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
+    if args.metrics_file:
+        start_file_writer(args.metrics_file, args.metrics_interval)
+    return True
+
+
+def _battle_throughput(battles: int, seed: int) -> float:
+    from pokemon_battle import BattleMode
+    from pokemon_matchup import MatchupSimulator
+    from pokemon_selfplay import random_team_names
+    rng = random.Random(seed)
+    simulator = MatchupSimulator(random_team_names(rng), random_team_names(rng), BattleMode.SINGLE, seed=seed)
+    started = time.perf_counter()
+    simulator.play(battles)
+    return battles / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure instrumentation overhead and show the exported metrics.")
+    parser.add_argument("--battles", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3, help="Timing runs per configuration (the best counts)")
+    parser.add_argument("--threads", type=int, default=2, help="Threads playing battles after instrumenting")
+    parser.add_argument("--seed", type=int, default=0)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    # Run as a script, this module is __main__, while the game loops record into pokemon_metrics
+    import pokemon_metrics as metrics
+    if not metrics.start_metrics(args):
+        metrics.instrument_engine()
+    # Plain and instrumented runs alternate, so drifts in machine load hit both alike
+    plain = instrumented = 0.0
+    for _ in range(args.repeats):
+        metrics._instrumented = False
+        plain = max(plain, _battle_throughput(args.battles, args.seed))
+        metrics._instrumented = True
+        instrumented = max(instrumented, _battle_throughput(args.battles, args.seed))
+    print(f"{plain:.0f} battles/s plain, {instrumented:.0f} battles/s instrumented "
+          f"({(plain / instrumented - 1) * 100:+.1f}% time)")
+
+    threads = [threading.Thread(target=_battle_throughput, args=(args.battles // args.threads, args.seed + i))
+               for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(metrics.REGISTRY.render())
+
+
+if __name__ == "__main__":
+    main()
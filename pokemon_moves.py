@@ -0,0 +1,160 @@
+from typing import Dict, List
+import re
+import json
+import argparse
+from collections import Counter
+
+from pokemon_battle import (MOVES_DATA, MOVE_EFFECTS_PATH, OP_STAT_STAGE, OP_STATUS, OP_RECOIL, OP_DRAIN,
+                            OP_HEAL, OP_MULTI_HIT, OP_PRIORITY, OP_CHARGE, OPCODE_NAMES, USER, TARGET)
+
+STAT_NAMES = {
+    "attack": "attack",
+    "defense": "defense",
+    "special attack": "special_attack",
+    "special defense": "special_defense",
+    "speed": "speed",
+    "accuracy": "accuracy",
+    "evasion": "evasion",
+}
+ALL_STATS = ["attack", "defense", "special_attack", "special_defense", "speed"]
+STAGE_COUNTS = {"one": 1, "two": 2, "three": 3}
+STATUS_VERBS = {
+    "badly poison": "bad-poison",
+    "paralyze": "paralysis",
+    "poison": "poison",
+    "burn": "burn",
+    "freeze": "freeze",
+}
+FRACTIONS = {"half": 0.5, "three quarters": 0.75}
+
+# moves_data.json predates the collector recording move priority and the effect text
+# never states it, so these are used for moves whose data has no 'priority' field
+KNOWN_PRIORITIES = {
+    "helping-hand": 5,
+    "protect": 4, "detect": 4, "endure": 4, "magic-coat": 4, "snatch": 4, "spiky-shield": 4,
+    "kings-shield": 4, "baneful-bunker": 4, "obstruct": 4, "silk-trap": 4,
+    "fake-out": 3, "quick-guard": 3, "wide-guard": 3, "crafty-shield": 3, "upper-hand": 3,
+    "extreme-speed": 2, "feint": 2, "first-impression": 2, "follow-me": 2, "rage-powder": 2,
+    "ally-switch": 2, "zippy-zap": 2,
+    "quick-attack": 1, "mach-punch": 1, "aqua-jet": 1, "bullet-punch": 1, "ice-shard": 1,
+    "shadow-sneak": 1, "vacuum-wave": 1, "sucker-punch": 1, "accelerock": 1, "water-shuriken": 1,
+    "jet-punch": 1, "baby-doll-eyes": 1, "ion-deluge": 1, "powder": 1, "thunderclap": 1, "bide": 1,
+    "vital-throw": -1,
+    "focus-punch": -3, "beak-blast": -3, "shell-trap": -3,
+    "avalanche": -4, "revenge": -4,
+    "counter": -5, "mirror-coat": -5,
+    "roar": -6, "whirlwind": -6, "dragon-tail": -6, "circle-throw": -6, "teleport": -6,
+    "trick-room": -7,
+}
+
+_STAT_CHANGE = re.compile(r"(raises?|lowers?) (?:all of )?(?:the )?(user|target)'s ([a-z ,]+?) by (one|two|three) stages?")
+_STATUS = re.compile(r"(?:^|to )(badly poison|paralyze|poison|burn|freeze)s? the target|(?:^|to )puts? the target to sleep")
+_RECOIL = re.compile(r"user (?:receives|takes) (\d+)/(\d+) (?:of )?the damage")
+_DRAIN = re.compile(r"drains (half|three quarters|(\d+)%) (?:of )?the damage")
+_HEAL = re.compile(r"^heals the user (?:by|for) half its max hp")
+_MULTI_HIT = re.compile(r"hits (\d+)[-–](\d+) times|hits (twice|three times)")
+_CHARGE = re.compile(r"requires a turn to charge|charges for one turn|"
+                     r"user (?:flies|digs|dives|bounces|vanishes|springs)[^.]*(?:hits|attacks|strikes) (?:on the )?(?:next|second) turn")
+_CHANCE = re.compile(r"(\d+)% chance")
+
+
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in re.split(r"\.\s+", text.lower()) if s.strip()]
+
+
+def _stats_in(text: str) -> List[str]:
+    """Stat names mentioned in a fragment such as "attack, special attack, and speed"."""
+    if text.strip() == "stats":
+        return list(ALL_STATS)
+    names = [part.strip() for part in re.split(r",\s*(?:and\s+)?|\s+and\s+", text)]
+    if not names or any(name not in STAT_NAMES for name in names):
+        return []
+    return [STAT_NAMES[name] for name in names]
+
+
+def compile_move_effect(move_name: str, move_data: dict) -> List[list]:
+    """Compile one move's effect text into a list of opcodes.
+
+    Each opcode is a list starting with one of the OP_* codes from pokemon_battle,
+    followed by its operands (see OPCODE_NAMES there for the layouts). Effects that
+    match none of the known patterns are left out.
+    """
+    ops = []
+    for sentence in _sentences(move_data.get('short_effect') or ""):
+        chance = _CHANCE.search(sentence)
+        chance = int(chance.group(1)) if chance else 100
+        for match in _STAT_CHANGE.finditer(sentence):
+            verb, who, stats, count = match.groups()
+            delta = STAGE_COUNTS[count] * (1 if verb.startswith("raise") else -1)
+            for stat in _stats_in(stats):
+                ops.append([OP_STAT_STAGE, USER if who == "user" else TARGET, stat, delta, chance])
+        for match in _STATUS.finditer(sentence):
+            status = STATUS_VERBS[match.group(1)] if match.group(1) else "sleep"
+            ops.append([OP_STATUS, status, chance])
+        match = _RECOIL.search(sentence)
+        if match:
+            ops.append([OP_RECOIL, int(match.group(1)) / int(match.group(2))])
+        match = _DRAIN.search(sentence)
+        if match:
+            fraction = int(match.group(2)) / 100 if match.group(2) else FRACTIONS[match.group(1)]
+            ops.append([OP_DRAIN, fraction])
+        if _HEAL.search(sentence):
+            ops.append([OP_HEAL, 0.5])
+        match = _MULTI_HIT.search(sentence)
+        if match:
+            if match.group(3):
+                hits = 2 if match.group(3) == "twice" else 3
+                ops.append([OP_MULTI_HIT, hits, hits])
+            else:
+                ops.append([OP_MULTI_HIT, int(match.group(1)), int(match.group(2))])
+        if _CHARGE.search(sentence):
+            ops.append([OP_CHARGE])
+
+    priority = move_data.get('priority')
+    if priority is None:
+        priority = KNOWN_PRIORITIES.get(move_name, 0)
+    if priority:
+        ops.append([OP_PRIORITY, priority])
+    return ops
+
+
+def compile_moves(moves_data: dict) -> Dict[str, List[list]]:
+    """Compile every move with a recognised effect; moves without one are omitted."""
+    compiled = {}
+    for name, data in moves_data.items():
+        ops = compile_move_effect(name, data)
+        if ops:
+            compiled[name] = ops
+    return compiled
+
+
+def write_move_effects(compiled: Dict[str, List[list]], path: str = MOVE_EFFECTS_PATH):
+    """Write the table as JSON with one move per line."""
+    with open(path, 'w') as f:
+        f.write("{\n")
+        f.write(",\n".join(f" {json.dumps(name)}: {json.dumps(ops)}" for name, ops in sorted(compiled.items())))
+        f.write("\n}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile move effect text into the opcode table loaded by the engine.")
+    parser.add_argument("--output", default=MOVE_EFFECTS_PATH, help="Where to write the compiled table")
+    parser.add_argument("--show", metavar="MOVE", help="Print the opcodes compiled for one move and exit")
+    args = parser.parse_args()
+
+    if args.show:
+        print(MOVES_DATA[args.show]['short_effect'])
+        for op in compile_move_effect(args.show, MOVES_DATA[args.show]):
+            print(f"  {OPCODE_NAMES[op[0]]} {op[1:]}")
+        return
+
+    compiled = compile_moves(MOVES_DATA)
+    write_move_effects(compiled, args.output)
+    counts = Counter(OPCODE_NAMES[op[0]] for ops in compiled.values() for op in ops)
+    print(f"Compiled effects for {len(compiled)} of {len(MOVES_DATA)} moves into {args.output}")
+    for name, count in counts.most_common():
+        print(f"  {name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
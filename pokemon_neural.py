@@ -0,0 +1,408 @@
+from typing import List, Optional, Sequence, Tuple, Union
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import functools
+import threading
+import numpy as np
+
+from pokemon_battle import Team, Battle, BattleMode
+from pokemon_adversary import Adversary
+from pokemon_encoder import BattleEncoder
+from pokemon_env import action_mask, action_mask_shape, decode_action, num_actions, replace_fainted
+from pokemon_inference import masked_argmax
+from pokemon_selfplay import battle_rng, build_team, random_team_names
+
+WEIGHTS_VERSION = 1
+DEFAULT_HIDDEN = (256, 128)
+WEIGHT_FORMATS = ("float32", "int8")
+# Logit given to illegal actions during training (finite, so fully masked slots stay NaN-free)
+MASKED_LOGIT = -1e9
+
+
+def _quantize(weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 weights with one float32 scale per output column."""
+    scales = np.abs(weights).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(weights / scales).astype(np.int8), scales.astype(np.float32)
+
+
+class PolicyValueNet:
+    """Multilayer perceptron over BattleEncoder features with a policy head and a value head.
+
+    Hidden layers use ReLU. The last layer outputs one logit per action for every active
+    slot, followed by the value (tanh of the last output: the expected outcome for the
+    encoded side, from -1 to 1). Inference runs in float32 with np.matmul writing into
+    activation buffers that are allocated once per thread and batch capacity, so a
+    forward pass allocates nothing. Weights saved as int8 (per-column scales) are
+    dequantized on load: the file is four times smaller, and BLAS still does the math.
+    """
+
+    def __init__(self, weights: Sequence[np.ndarray], biases: Sequence[np.ndarray], battle_mode: BattleMode,
+                 weight_format: str = "float32"):
+        self.battle_mode = battle_mode
+        self.num_active = 1 if battle_mode == BattleMode.SINGLE else 2
+        self.num_actions = num_actions(battle_mode)
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in biases]
+        self.weight_format = weight_format
+        self.sizes = [self.weights[0].shape[0]] + [w.shape[1] for w in self.weights]
+        if self.sizes[0] != BattleEncoder(battle_mode).size:
+            raise ValueError(f"Network takes {self.sizes[0]} features, the {battle_mode.value} encoder makes "
+                             f"{BattleEncoder(battle_mode).size}")
+        if self.sizes[-1] != self.num_active * self.num_actions + 1:
+            raise ValueError(f"Network has {self.sizes[-1]} outputs, expected {self.num_active * self.num_actions + 1}")
+        self._local = threading.local()
+
+    @classmethod
+    def initialize(cls, battle_mode: BattleMode, hidden: Sequence[int] = DEFAULT_HIDDEN,
+                   seed: int = 0) -> "PolicyValueNet":
+        """He-initialized network, the starting point for training."""
+        rng = np.random.default_rng(seed)
+        sizes = ([BattleEncoder(battle_mode).size] + list(hidden)
+                 + [(1 if battle_mode == BattleMode.SINGLE else 2) * num_actions(battle_mode) + 1])
+        weights = [rng.normal(0.0, np.sqrt(2.0 / fan_in), (fan_in, fan_out))
+                   for fan_in, fan_out in zip(sizes[:-1], sizes[1:])]
+        return cls(weights, [np.zeros(size) for size in sizes[1:]], battle_mode)
+
+    @property
+    def parameters(self) -> int:
+        return sum(w.size + b.size for w, b in zip(self.weights, self.biases))
+
+    def _activations(self, rows: int) -> List[np.ndarray]:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None or len(buffers[0]) < rows:
+            capacity = 1 << max(0, rows - 1).bit_length()
+            buffers = [np.empty((capacity, size), dtype=np.float32) for size in self.sizes[1:]]
+            self._local.buffers = buffers
+        return buffers
+
+    def forward(self, observations: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Policy logits (batch, active slots, actions) and values (batch,) of encoded positions.
+
+        The logits are a view of this thread's activation buffer, valid until its next call.
+        """
+        rows = len(observations)
+        x = observations
+        last = len(self.weights) - 1
+        for i, (weights, bias, buffer) in enumerate(zip(self.weights, self.biases, self._activations(rows))):
+            out = buffer[:rows]
+            np.matmul(x, weights, out=out)
+            out += bias
+            if i < last:
+                np.maximum(out, 0.0, out=out)
+            x = out
+        return x[:, :-1].reshape(rows, self.num_active, self.num_actions), np.tanh(x[:, -1])
+
+    def evaluate(self, observations: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        """Greedy legal actions, the batched policy interface of pokemon_inference."""
+        logits, _ = self.forward(observations)
+        return masked_argmax(logits, masks.reshape(logits.shape))
+
+    def save(self, path: str, weight_format: str = "float32"):
+        """Write the network to a .npz weight file, with float32 or int8 weights."""
+        if weight_format not in WEIGHT_FORMATS:
+            raise ValueError(f"Unknown weight format {weight_format!r}, choose from {', '.join(WEIGHT_FORMATS)}")
+        header = {"version": WEIGHTS_VERSION, "battle_mode": self.battle_mode.value, "sizes": self.sizes,
+                  "weights": weight_format}
+        arrays = {"header": np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)}
+        for i, (weights, bias) in enumerate(zip(self.weights, self.biases)):
+            if weight_format == "int8":
+                arrays[f"w{i}"], arrays[f"s{i}"] = _quantize(weights)
+            else:
+                arrays[f"w{i}"] = weights
+            arrays[f"b{i}"] = bias
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PolicyValueNet":
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(data["header"].tobytes())
+            if header.get("version") != WEIGHTS_VERSION:
+                raise ValueError(f"{path} is not a version {WEIGHTS_VERSION} weight file")
+            layers = len(header["sizes"]) - 1
+            weights = []
+            for i in range(layers):
+                w = data[f"w{i}"]
+                weights.append(w.astype(np.float32) * data[f"s{i}"] if header["weights"] == "int8" else w)
+            biases = [data[f"b{i}"] for i in range(layers)]
+        return cls(weights, biases, BattleMode(header["battle_mode"]), header["weights"])
+
+    def quantized(self) -> "PolicyValueNet":
+        """The network as it would be after saving with int8 weights and loading again."""
+        weights = []
+        for w in self.weights:
+            q, scales = _quantize(w)
+            weights.append(q.astype(np.float32) * scales)
+        return PolicyValueNet(weights, self.biases, self.battle_mode, "int8")
+
+
+@functools.lru_cache(maxsize=None)
+def shared_encoder(battle_mode: BattleMode) -> BattleEncoder:
+    """One encoder per battle mode for all NeuralAdversary instances, so its static feature cache stays warm."""
+    return BattleEncoder(battle_mode)
+
+
+class NeuralAdversary:
+    """Learned opponent with the Adversary interface: choose_action(opponent_team) plays the network's policy.
+
+    Greedy by default; with a positive temperature the action is sampled from the
+    softmax of the legal logits. The network only sees the two teams, so the turn
+    feature counts this adversary's own decisions.
+    """
+
+    def __init__(self, team: Team, battle_mode: BattleMode, network: PolicyValueNet,
+                 rng: Optional[random.Random] = None, temperature: float = 0.0):
+        if network.battle_mode != battle_mode:
+            raise ValueError(f"Network plays {network.battle_mode.value} battles, not {battle_mode.value}")
+        self.team = team
+        self.battle_mode = battle_mode
+        self.network = network
+        self.rng = rng if rng is not None else random
+        self.temperature = temperature
+        self.encoder = shared_encoder(battle_mode)
+        self.turn = 0
+        self._observation = self.encoder.allocate(1)
+        self._mask = np.zeros(action_mask_shape(battle_mode), dtype=bool)
+
+    def _observe(self, opponent_team: Team):
+        self.encoder.encode_teams(self.team, opponent_team, self.turn, self._observation[0])
+        action_mask(self.team, opponent_team, self._mask)
+        return self.network.forward(self._observation)
+
+    def choose_action(self, opponent_team: Team) -> Union[tuple, List[tuple]]:
+        logits, _ = self._observe(opponent_team)
+        self.turn += 1
+        masks = self._mask.reshape(logits.shape[1:])
+        if self.temperature > 0:
+            indices = [self._sample(slot_logits, slot_mask) for slot_logits, slot_mask in zip(logits[0], masks)]
+        else:
+            indices = masked_argmax(logits[0], masks).tolist()
+        if self.battle_mode == BattleMode.SINGLE:
+            return decode_action(self.team, indices[0], self._mask)
+        return decode_action(self.team, indices, self._mask)
+
+    def _sample(self, logits: np.ndarray, mask: np.ndarray) -> int:
+        if not mask.any():
+            return 0
+        scaled = np.where(mask, logits / self.temperature, -np.inf)
+        weights = np.exp(scaled - scaled.max())
+        threshold = self.rng.random() * weights.sum()
+        return min(int(np.searchsorted(np.cumsum(weights), threshold, side="right")), len(weights) - 1)
+
+    def evaluate_position(self, opponent_team: Team) -> float:
+        """The value head's expected outcome for this adversary's side (-1 loss .. 1 win)."""
+        return float(self._observe(opponent_team)[1][0])
+
+
+def neural_policy(network: PolicyValueNet, temperature: float = 0.0):
+    """Policy factory for NeuralAdversary, called like the entries of pokemon_selfplay.POLICIES."""
+    return functools.partial(_make_neural_adversary, network=network, temperature=temperature)
+
+
+def _make_neural_adversary(team: Team, battle_mode: BattleMode, rng: Optional[random.Random] = None,
+                           network: Optional[PolicyValueNet] = None, temperature: float = 0.0) -> NeuralAdversary:
+    return NeuralAdversary(team, battle_mode, network, rng=rng, temperature=temperature)
+
+
+def _gradients(net: PolicyValueNet, states: np.ndarray, actions: np.ndarray, masks: np.ndarray,
+               outcomes: np.ndarray, value_weight: float):
+    """Losses, policy accuracy and parameter gradients for a minibatch of self-play records.
+
+    The policy head is trained with cross-entropy against the recorded action of every
+    slot that acted (-1 marks a pass), over the legal actions only; the value head with
+    squared error against the final outcome for the recorded side.
+    """
+    rows = len(states)
+    inputs = [states]
+    x = states
+    for i, (weights, bias) in enumerate(zip(net.weights, net.biases)):
+        x = x @ weights + bias
+        if i < len(net.weights) - 1:
+            x = np.maximum(x, 0.0)
+            inputs.append(x)
+
+    masks = masks.reshape(rows, net.num_active, net.num_actions)
+    logits = np.where(masks, x[:, :-1].reshape(masks.shape), MASKED_LOGIT)
+    logits -= logits.max(axis=-1, keepdims=True)
+    probabilities = np.exp(logits)
+    probabilities /= probabilities.sum(axis=-1, keepdims=True)
+    valid = actions >= 0
+    taken = np.where(valid, actions, 0)[..., None].astype(np.int64)
+    count = max(int(valid.sum()), 1)
+    log_taken = np.log(np.take_along_axis(probabilities, taken, axis=-1)[..., 0] + 1e-12)
+    policy_loss = -(log_taken * valid).sum() / count
+    accuracy = float(((logits.argmax(axis=-1) == actions) & valid).sum() / count)
+
+    value = np.tanh(x[:, -1])
+    error = value - outcomes
+    value_loss = 0.5 * float((error ** 2).mean())
+
+    grad_logits = probabilities
+    np.put_along_axis(grad_logits, taken, np.take_along_axis(grad_logits, taken, axis=-1) - 1.0, axis=-1)
+    grad_logits *= valid[..., None] / count
+    grad = np.concatenate([grad_logits.reshape(rows, -1),
+                           (value_weight * error * (1.0 - value ** 2) / rows)[:, None]], axis=1).astype(np.float32)
+
+    grads = [None] * len(net.weights)
+    for i in range(len(net.weights) - 1, -1, -1):
+        grads[i] = (inputs[i].T @ grad, grad.sum(axis=0))
+        if i > 0:
+            grad = (grad @ net.weights[i].T) * (inputs[i] > 0)
+    return policy_loss, value_loss, accuracy, grads
+
+
+def train(dataset_directory: str, hidden: Sequence[int] = DEFAULT_HIDDEN, epochs: int = 5, batch_size: int = 256,
+          learning_rate: float = 1e-3, value_weight: float = 0.5, seed: int = 0,
+          network: Optional[PolicyValueNet] = None) -> PolicyValueNet:
+    """Fit a network to a self-play dataset (see pokemon_selfplay) with Adam, in NumPy.
+
+    Args:
+        network: Network to continue training instead of a freshly initialized one
+    """
+    from pokemon_dataset import ShardDataset, MinibatchLoader
+
+    dataset = ShardDataset(dataset_directory, columns=["states", "actions", "masks", "outcomes"])
+    battle_mode = BattleMode(dataset.manifest["config"]["battle_mode"])
+    net = network if network is not None else PolicyValueNet.initialize(battle_mode, hidden, seed)
+    loader = MinibatchLoader(dataset, batch_size, seed=seed)
+    parameters = [p for pair in zip(net.weights, net.biases) for p in pair]
+    first_moment = [np.zeros_like(p) for p in parameters]
+    second_moment = [np.zeros_like(p) for p in parameters]
+    beta1, beta2, step = 0.9, 0.999, 0
+
+    for epoch in range(epochs):
+        totals = np.zeros(3)
+        batches = 0
+        for batch in loader:
+            policy_loss, value_loss, accuracy, grads = _gradients(
+                net, batch["states"], batch["actions"].astype(np.int64), batch["masks"],
+                batch["outcomes"].astype(np.float32), value_weight)
+            step += 1
+            correction = learning_rate * np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            for p, g, m, v in zip(parameters, (g for pair in grads for g in pair), first_moment, second_moment):
+                m *= beta1
+                m += (1 - beta1) * g
+                v *= beta2
+                v += (1 - beta2) * g * g
+                p -= correction * m / (np.sqrt(v) + 1e-8)
+            totals += (policy_loss, value_loss, accuracy)
+            batches += 1
+        policy_loss, value_loss, accuracy = totals / max(batches, 1)
+        print(f"epoch {epoch + 1}/{epochs}: policy loss {policy_loss:.3f}, value loss {value_loss:.3f}, "
+              f"action accuracy {accuracy:.1%}")
+    return net
+
+
+def sample_positions(battle_mode: BattleMode, count: int, seed: int = 0) -> Tuple[List[Tuple[Team, Team]], np.ndarray]:
+    """Positions from the first turns of random-team battles, and their encodings, for benchmarks."""
+    encoder = BattleEncoder(battle_mode)
+    observations = encoder.allocate(count)
+    positions = []
+    for i in range(count):
+        rng = battle_rng(seed, i)
+        player = build_team(random_team_names(rng), battle_mode, rng=rng)
+        opponent = build_team(random_team_names(rng), battle_mode, rng=rng)
+        battle = Battle(player, opponent, verbose=False, rng=rng)
+        for _ in range(rng.randrange(3)):
+            battle.execute_turn(Adversary(player, battle_mode, rng=rng).choose_action(opponent),
+                                Adversary(opponent, battle_mode, rng=rng).choose_action(player))
+            if battle.is_battle_over():
+                break
+            replace_fainted(player)
+            replace_fainted(opponent)
+        encoder.encode(battle, observations[i])
+        positions.append((player, opponent))
+    return positions, observations
+
+
+def benchmark(network: PolicyValueNet, positions: int = 1024, repeats: int = 20, seed: int = 0):
+    """Print forward-pass throughput by batch size, int8 agreement and file sizes, and decision latency."""
+    battle_mode = network.battle_mode
+    teams, observations = sample_positions(battle_mode, positions, seed)
+    masks = np.stack([action_mask(own, other) for own, other in teams]).reshape(
+        positions, network.num_active, network.num_actions)
+    print(f"{battle_mode.value.title()} network {'-'.join(map(str, network.sizes))}: "
+          f"{network.parameters} parameters")
+
+    for batch_size in (1, 8, 64, 256, positions):
+        batches = [observations[start:start + batch_size] for start in range(0, positions, batch_size)]
+        rounds = max(1, repeats * batch_size // positions)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for batch in batches:
+                network.forward(batch)
+        elapsed = time.perf_counter() - started
+        print(f"  batch {batch_size:5d}: {rounds * positions / elapsed:9.0f} positions/s, "
+              f"{elapsed / (rounds * len(batches)) * 1e6:8.1f} us per forward pass")
+
+    quantized = network.quantized()
+    agreement = (quantized.evaluate(observations, masks) == network.evaluate(observations, masks)).all(axis=1).mean()
+    with tempfile.TemporaryDirectory() as directory:
+        sizes = {}
+        for weight_format in WEIGHT_FORMATS:
+            path = os.path.join(directory, f"net_{weight_format}.npz")
+            network.save(path, weight_format)
+            sizes[weight_format] = os.path.getsize(path)
+    print(f"  int8 weights: {sizes['int8'] / 1024:.0f} KiB file (float32 {sizes['float32'] / 1024:.0f} KiB), "
+          f"same greedy action on {agreement:.1%} of positions")
+
+    for name, factory in (("NeuralAdversary", neural_policy(network)), ("Adversary", Adversary)):
+        policies = [(factory(own, battle_mode, rng=random.Random(i)), other) for i, (own, other) in enumerate(teams)]
+        # The second pass is timed, once both policies have their per-Pokemon caches
+        for _ in range(2):
+            started = time.perf_counter()
+            for policy, other in policies:
+                policy.choose_action(other)
+        print(f"  {name}.choose_action: {(time.perf_counter() - started) / positions * 1e6:.0f} us per decision")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train, convert and benchmark the NumPy policy/value network.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="Fit a network to a self-play dataset")
+    train_parser.add_argument("dataset", help="Self-play dataset directory (see pokemon_selfplay.py)")
+    train_parser.add_argument("output", help="Weight file to write (.npz)")
+    train_parser.add_argument("--hidden", type=int, nargs="+", default=list(DEFAULT_HIDDEN))
+    train_parser.add_argument("--epochs", type=int, default=5)
+    train_parser.add_argument("--batch-size", type=int, default=256)
+    train_parser.add_argument("--learning-rate", type=float, default=1e-3)
+    train_parser.add_argument("--resume", help="Weight file to continue training from")
+    convert_parser = subparsers.add_parser("convert", help="Rewrite a weight file in another format")
+    convert_parser.add_argument("weights")
+    convert_parser.add_argument("output")
+    for sub in (train_parser, convert_parser):
+        sub.add_argument("--format", choices=WEIGHT_FORMATS, default="float32")
+    bench_parser = subparsers.add_parser("bench", help="Benchmark inference")
+    bench_parser.add_argument("--weights", help="Weight file (default: a freshly initialized network)")
+    bench_parser.add_argument("--mode", choices=["single", "double"], default="single")
+    bench_parser.add_argument("--hidden", type=int, nargs="+", default=list(DEFAULT_HIDDEN))
+    bench_parser.add_argument("--positions", type=int, default=1024)
+    for sub in (train_parser, bench_parser):
+        sub.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        network = train(args.dataset, args.hidden, args.epochs, args.batch_size, args.learning_rate, seed=args.seed,
+                        network=PolicyValueNet.load(args.resume) if args.resume else None)
+        network.save(args.output, args.format)
+        print(f"Saved {network.parameters} parameters to {args.output} ({args.format})")
+    elif args.command == "convert":
+        PolicyValueNet.load(args.weights).save(args.output, args.format)
+        print(f"Wrote {args.output} ({args.format}, {os.path.getsize(args.output) / 1024:.0f} KiB)")
+    else:
+        if args.weights:
+            network = PolicyValueNet.load(args.weights)
+        else:
+            network = PolicyValueNet.initialize(BattleMode(args.mode), args.hidden, args.seed)
+        benchmark(network, args.positions, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
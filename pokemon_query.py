@@ -0,0 +1,237 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import time
+import bisect
+import argparse
+import functools
+from collections import defaultdict
+
+from pokemon_battle import POKEMON_DATA, MOVES_DATA, Move
+
+# Numeric fields that find_species / find_moves accept min_<field> and max_<field> bounds on
+SPECIES_FIELDS = ("hp", "attack", "defense", "special_attack", "special_defense", "speed", "total")
+MOVE_FIELDS = ("power", "accuracy", "pp", "priority")
+
+
+def bitset_members(bits: int) -> List[int]:
+    """Positions of the set bits, in increasing order."""
+    digits = bin(bits)[:1:-1]
+    members = []
+    i = digits.find("1")
+    while i >= 0:
+        members.append(i)
+        i = digits.find("1", i + 1)
+    return members
+
+
+class RangeIndex:
+    """Bitsets of the records whose value is at least each distinct value, from the sorted values.
+
+    A bound is then one binary search and one bitset lookup, whatever the range covers.
+    """
+
+    def __init__(self, values: Sequence[int]):
+        self.thresholds = sorted(set(values))
+        self.all = (1 << len(values)) - 1
+        by_value = defaultdict(int)
+        for i, value in enumerate(values):
+            by_value[value] |= 1 << i
+        self._at_least = [0] * (len(self.thresholds) + 1)
+        for k in range(len(self.thresholds) - 1, -1, -1):
+            self._at_least[k] = self._at_least[k + 1] | by_value[self.thresholds[k]]
+
+    def at_least(self, value: float) -> int:
+        return self._at_least[bisect.bisect_left(self.thresholds, value)]
+
+    def at_most(self, value: float) -> int:
+        return self.all & ~self._at_least[bisect.bisect_right(self.thresholds, value)]
+
+
+def _inverted(records: Iterable[Iterable[str]]) -> Dict[str, int]:
+    """key -> bitset of the records listing that key."""
+    index = defaultdict(int)
+    for i, keys in enumerate(records):
+        for key in keys:
+            index[key] |= 1 << i
+    return dict(index)
+
+
+def _lookup(index: Dict[str, int], key: str, what: str) -> int:
+    if key not in index:
+        raise ValueError(f"Unknown {what} {key!r}")
+    return index[key]
+
+
+def _as_list(value: Union[None, str, Sequence[str]]) -> List[str]:
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+class DexIndex:
+    """Inverted indexes and stat range indexes over pokemon_data.json and moves_data.json.
+
+    Species and moves are numbered in data order and every filter is a bitset over
+    those numbers (Python ints), so a query is a handful of ANDs followed by reading
+    off the set bits, instead of a scan over every record and learnset entry.
+    Move numbers follow the engine: missing power counts as 0, missing accuracy as
+    100, and priority comes from the compiled move effects.
+    """
+
+    def __init__(self, pokemon_data: dict = POKEMON_DATA, moves_data: dict = MOVES_DATA):
+        self.species = list(pokemon_data)
+        self.moves = list(moves_data)
+        self.all_species = (1 << len(self.species)) - 1
+        self.all_moves = (1 << len(self.moves)) - 1
+        records = [pokemon_data[name] for name in self.species]
+
+        self.species_by_type = _inverted(r['types'] for r in records)
+        self.species_by_ability = _inverted(r['abilities'] for r in records)
+        self.species_by_move = _inverted(r['moves'] for r in records)
+        self.playable = sum(1 << i for i, r in enumerate(records) if r['moves'])
+        stats = [{key.replace("-", "_"): value for key, value in r['base_stats'].items()} for r in records]
+        for s in stats:
+            s["total"] = sum(s.values())
+        self.species_ranges = {field: RangeIndex([s[field] for s in stats]) for field in SPECIES_FIELDS}
+
+        move_ids = {name: i for i, name in enumerate(self.moves)}
+        self.moves_by_species = {name: sum(1 << move_ids[m] for m in set(r['moves']) if m in move_ids)
+                                 for name, r in zip(self.species, records)}
+        move_records = [moves_data[name] for name in self.moves]
+        self.moves_by_type = _inverted([r['type']] for r in move_records)
+        self.moves_by_class = _inverted([r['damage_class']] for r in move_records)
+        move_values = {
+            "power": [r['power'] or 0 for r in move_records],
+            "accuracy": [r['accuracy'] or 100 for r in move_records],
+            "pp": [r['pp'] or 20 for r in move_records],
+            "priority": [Move.from_data(name).priority for name in self.moves],
+        }
+        self.move_ranges = {field: RangeIndex(values) for field, values in move_values.items()}
+
+    @staticmethod
+    def _bounds(ranges: Dict[str, RangeIndex], bounds: dict, bits: int) -> int:
+        for key, value in bounds.items():
+            side, _, field = key.partition("_")
+            if side not in ("min", "max") or field not in ranges:
+                raise TypeError(f"Unexpected bound {key!r}; use min_/max_ with one of {', '.join(ranges)}")
+            bits &= ranges[field].at_least(value) if side == "min" else ranges[field].at_most(value)
+        return bits
+
+    def species_bits(self, type: Union[None, str, Sequence[str]] = None, ability: Optional[str] = None,
+                     learns: Union[None, str, Sequence[str]] = None, playable: bool = False, **bounds) -> int:
+        """Bitset form of find_species."""
+        bits = self.playable if playable else self.all_species
+        for t in _as_list(type):
+            bits &= _lookup(self.species_by_type, t, "type")
+        if ability is not None:
+            bits &= _lookup(self.species_by_ability, ability, "ability")
+        for move in _as_list(learns):
+            if move not in MOVES_DATA:
+                raise ValueError(f"Unknown move {move!r}")
+            bits &= self.species_by_move.get(move, 0)
+        return self._bounds(self.species_ranges, bounds, bits)
+
+    def find_species(self, type: Union[None, str, Sequence[str]] = None, ability: Optional[str] = None,
+                     learns: Union[None, str, Sequence[str]] = None, playable: bool = False,
+                     **bounds) -> List[str]:
+        """Species matching every given filter, in data order.
+
+        Args:
+            type: A type, or several that the species must all have
+            ability: An ability the species can have
+            learns: A move, or several that the species must all learn
+            playable: Only species with at least one move
+            bounds: min_<stat> / max_<stat> (inclusive) for hp, attack, defense,
+                special_attack, special_defense, speed or total (base stat total)
+        """
+        return [self.species[i] for i in bitset_members(self.species_bits(type, ability, learns, playable, **bounds))]
+
+    def move_bits(self, type: Optional[str] = None, damage_class: Optional[str] = None,
+                  learned_by: Union[None, str, Sequence[str]] = None, **bounds) -> int:
+        """Bitset form of find_moves."""
+        bits = self.all_moves
+        if type is not None:
+            bits &= _lookup(self.moves_by_type, type, "move type")
+        if damage_class is not None:
+            bits &= _lookup(self.moves_by_class, damage_class, "damage class")
+        for species in _as_list(learned_by):
+            bits &= _lookup(self.moves_by_species, species, "species")
+        return self._bounds(self.move_ranges, bounds, bits)
+
+    def find_moves(self, type: Optional[str] = None, damage_class: Optional[str] = None,
+                   learned_by: Union[None, str, Sequence[str]] = None, **bounds) -> List[str]:
+        """Moves matching every given filter, in data order.
+
+        Args:
+            type: Move type
+            damage_class: "physical", "special" or "status"
+            learned_by: A species, or several that must all learn the move
+            bounds: min_<field> / max_<field> (inclusive) for power, accuracy, pp or priority
+        """
+        return [self.moves[i] for i in bitset_members(self.move_bits(type, damage_class, learned_by, **bounds))]
+
+
+@functools.lru_cache(maxsize=None)
+def dex_index() -> DexIndex:
+    """The index over the bundled data, built on first use."""
+    return DexIndex()
+
+
+def find_species(**filters) -> List[str]:
+    """DexIndex.find_species on the bundled data."""
+    return dex_index().find_species(**filters)
+
+
+def find_moves(**filters) -> List[str]:
+    """DexIndex.find_moves on the bundled data."""
+    return dex_index().find_moves(**filters)
+
+
+def _scan_species(type: str, min_speed: int, learns: Sequence[str]) -> List[str]:
+    """The loop find_species replaces, for comparison."""
+    return [name for name, data in POKEMON_DATA.items()
+            if type in data['types'] and data['base_stats']['speed'] >= min_speed
+            and all(move in data['moves'] for move in learns)]
+
+
+def _scan_moves(type: str, min_power: int, damage_class: str) -> List[str]:
+    return [name for name, data in MOVES_DATA.items()
+            if data['type'] == type and (data['power'] or 0) >= min_power and data['damage_class'] == damage_class]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time indexed species/move queries against linear scans.")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = dex_index()
+    print(f"Indexed {len(index.species)} species and {len(index.moves)} moves in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    queries = [
+        ("find_species(type='dragon', min_speed=100, learns=['earthquake'])",
+         lambda: index.find_species(type="dragon", min_speed=100, learns=["earthquake"]),
+         lambda: _scan_species("dragon", 100, ["earthquake"])),
+        ("find_species(type='water', min_speed=0, learns=['scald', 'ice-beam'])",
+         lambda: index.find_species(type="water", min_speed=0, learns=["scald", "ice-beam"]),
+         lambda: _scan_species("water", 0, ["scald", "ice-beam"])),
+        ("find_moves(type='fire', min_power=90, damage_class='special')",
+         lambda: index.find_moves(type="fire", min_power=90, damage_class="special"),
+         lambda: _scan_moves("fire", 90, "special")),
+    ]
+    for label, indexed, scan in queries:
+        result = indexed()
+        if result != scan():
+            raise AssertionError(f"{label} disagrees with the linear scan")
+        timings = []
+        for fn in (indexed, scan):
+            started = time.perf_counter()
+            for _ in range(args.repeats):
+                fn()
+            timings.append((time.perf_counter() - started) / args.repeats * 1e6)
+        print(f"{label}: {len(result)} results, indexed {timings[0]:.1f} us, scan {timings[1]:.0f} us")
+        print(f"  {', '.join(result[:8])}{', ...' if len(result) > 8 else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from typing import List
+import json
+import argparse
+
+from pokemon_battle import Team, BattleMode, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+from pokemon_selfplay import load_manifest, play_battle, setup_battle
+
+REPLAY_VERSION = 1
+
+# A replay is a JSON document:
+#   {"version": 1, "battle_mode": "single", "level": 50, "outcome": 1,
+#    "player": {"species": [...6 names], "moves": [[move names] x 6]}, "opponent": {...},
+#    "steps": [{"turn": 0, "player": {"active": [0], "hp": [...], "status": [...]},
+#               "opponent": {...}, "log": ["charizard used flamethrower!", ...]}, ...]}
+# Step 0 is the starting position; step k > 0 is the position after turn k (fainted
+# Pokemon already replaced) together with the messages of that turn.
+
+
+def _team_record(team: Team) -> dict:
+    return {"species": [p.name for p in team.pokemon], "moves": [[m.name for m in p.moves] for p in team.pokemon]}
+
+
+def _side_state(team: Team) -> dict:
+    return {"active": list(team.active_pokemon_indices), "hp": [p.current_hp for p in team.pokemon],
+            "status": [p.status for p in team.pokemon]}
+
+
+def record_battle(config: dict, battle_id: int) -> dict:
+    """Play battle `battle_id` of a self-play config (see pokemon_selfplay.generate) and record it as a replay.
+
+    Battles are seeded individually, so this reproduces the battle a dataset generated
+    with the same config contains.
+    """
+    battle, player_ai, opponent_ai = setup_battle(config, battle_id)
+    lines: List[str] = []
+    battle.log_sink = lambda message: lines.append(message.strip())
+    steps = []
+
+    def snapshot():
+        step = {"turn": battle.turn_count, "player": _side_state(battle.player_team),
+                "opponent": _side_state(battle.opponent_team), "log": list(lines)}
+        if steps:
+            for side, team in (("player", battle.player_team), ("opponent", battle.opponent_team)):
+                for old, new in zip(steps[-1][side]["active"], step[side]["active"]):
+                    if old != new and not battle.is_battle_over():
+                        step["log"].append(f"{side.title()} sent out {team.pokemon[new].name}!")
+        steps.append(step)
+        lines.clear()
+
+    outcome = play_battle(battle, player_ai, opponent_ai, config["max_turns"],
+                          on_turn=lambda *_: snapshot())
+    snapshot()
+    steps[-1]["log"].append({1: "Player wins the battle!", -1: "Opponent wins the battle!"}.get(outcome, "Draw!"))
+    return {"version": REPLAY_VERSION, "battle_mode": config["battle_mode"], "level": config["level"],
+            "outcome": outcome, "player": _team_record(battle.player_team),
+            "opponent": _team_record(battle.opponent_team), "steps": steps}
+
+
+def save_replay(path: str, replay: dict):
+    with open(path, 'w') as f:
+        json.dump(replay, f)
+
+
+def load_replay(path: str) -> dict:
+    with open(path, 'r') as f:
+        replay = json.load(f)
+    if replay.get("version") != REPLAY_VERSION:
+        raise ValueError(f"{path} is not a version {REPLAY_VERSION} replay")
+    return replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a self-play battle as a replay file "
+                                                 "(render it with src/gui/pokemon_replay_video.py).")
+    parser.add_argument("output", help="Replay file to write (.json)")
+    parser.add_argument("--battle", type=int, default=0, help="Battle id within the dataset or seed")
+    parser.add_argument("--dataset", help="Self-play dataset directory whose settings to use")
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--player-policy", default="adversary")
+    parser.add_argument("--opponent-policy", default="adversary")
+    parser.add_argument("--random-teams", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.dataset:
+        manifest = load_manifest(args.dataset)
+        if manifest is None:
+            parser.error(f"{args.dataset} holds no self-play dataset")
+        config = manifest["config"]
+    else:
+        config = {"battle_mode": args.mode, "player_policy": args.player_policy,
+                  "opponent_policy": args.opponent_policy, "player_team": DEFAULT_PLAYER_TEAM,
+                  "opponent_team": DEFAULT_OPPONENT_TEAM, "random_teams": args.random_teams, "level": 50,
+                  "max_turns": 200, "seed": args.seed}
+    replay = record_battle(config, args.battle)
+    save_replay(args.output, replay)
+    print(f"{BattleMode(replay['battle_mode']).value.title()} battle {args.battle}: {len(replay['steps']) - 1} turns, "
+          f"outcome {replay['outcome']}, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+from typing import Dict, List, Optional, Sequence
+import re
+import time
+import heapq
+import bisect
+import random
+import difflib
+import argparse
+import functools
+import itertools
+from collections import Counter, defaultdict
+
+from pokemon_battle import POKEMON_DATA
+
+# Typos forgiven in a query of a given length (shorter queries must match exactly)
+FUZZY_MIN_LENGTH = 3
+LONG_QUERY = 6
+
+# Completions remembered per index; a keystroke usually repeats or extends a recent query
+CACHE_SIZE = 4096
+
+
+def normalize(text: str) -> str:
+    """Lowercase, with spaces turned into hyphens as in the data keys ("Mr Mime" -> "mr-mime")."""
+    return re.sub(r"[^a-z0-9-]", "", re.sub(r"\s+", "-", text.strip().lower()))
+
+
+def _trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _prefix_distance(query: str, name: str, bound: int) -> int:
+    """Smallest Levenshtein distance from `query` to `name` or to a prefix of it, capped at bound + 1.
+
+    One dynamic-programming pass over the first len(query) + bound characters of the
+    name covers both, since longer prefixes are always more than `bound` edits away.
+    """
+    name = name[:len(query) + bound]
+    previous = list(range(len(name) + 1))
+    for i, ca in enumerate(query, 1):
+        current = [i]
+        for j, cb in enumerate(name, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return min(min(previous[max(0, len(query) - bound):]), bound + 1)
+
+
+class NameIndex:
+    """Ranked autocomplete with typo tolerance over a fixed set of names.
+
+    Prefixes are looked up by binary search in sorted key arrays, one for whole names
+    and one for the hyphen-separated parts after the first ("mega" finds
+    "charizard-mega-x"). Typos are handled with a trigram inverted index: names that
+    share enough trigrams with the query are checked with a bounded edit distance
+    against the query and against the name's prefix of the same length, so a
+    misspelled partial name still completes. Both avoid scanning every name per
+    keystroke.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = sorted(set(names))
+        self._squashed = [name.replace("-", "") for name in self.names]
+        self._name_keys = self.names
+        parts = sorted((part, i) for i, name in enumerate(self.names) for part in name.split("-")[1:] if part)
+        self._part_keys = [part for part, _ in parts]
+        self._part_ids = [i for _, i in parts]
+        postings = defaultdict(list)
+        for i, squashed in enumerate(self._squashed):
+            for gram in set(_trigrams(squashed)):
+                postings[gram].append(i)
+        self._postings: Dict[str, List[int]] = dict(postings)
+        self._cache: Dict[tuple, List[str]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        i = bisect.bisect_left(self.names, name)
+        return i < len(self.names) and self.names[i] == name
+
+    def _prefix_ids(self, keys: List[str], query: str) -> range:
+        low = bisect.bisect_left(keys, query)
+        return range(low, bisect.bisect_left(keys, query + "\x7f", low))
+
+    def _fuzzy(self, query: str, exclude: set, limit: int) -> List[int]:
+        squashed = query.replace("-", "")
+        grams = _trigrams(squashed)
+        counts = Counter(itertools.chain.from_iterable(self._postings.get(gram, ()) for gram in grams))
+        # A single typo destroys at most three trigrams
+        needed = max(1, len(grams) - 3 * (2 if len(squashed) >= LONG_QUERY else 1))
+        shortlist = heapq.nlargest(2 * limit, (i for i, n in counts.items() if n >= needed and i not in exclude),
+                                   key=counts.__getitem__)
+        bound = 2 if len(squashed) >= LONG_QUERY else 1
+        scored = []
+        for i in shortlist:
+            name = self._squashed[i]
+            distance = _prefix_distance(squashed, name, bound)
+            if distance <= bound:
+                scored.append((distance, -counts[i], len(name), i))
+        scored.sort()
+        return [i for *_, i in scored[:limit]]
+
+    def complete(self, text: str, limit: int = 8) -> List[str]:
+        """Up to `limit` names for a (partial, possibly misspelled) query, best first.
+
+        Ranking: exact match, names starting with the query (shortest first), names with
+        a later part starting with it, then names within one or two typos.
+        """
+        query = normalize(text)
+        if not query:
+            return []
+        cached = self._cache.get((query, limit))
+        if cached is not None:
+            return cached
+
+        ids = sorted(self._prefix_ids(self._name_keys, query), key=lambda i: (len(self.names[i]), i))
+        if len(ids) < limit:
+            found = set(ids)
+            parts = sorted({self._part_ids[k] for k in self._prefix_ids(self._part_keys, query)} - found,
+                           key=lambda i: (len(self.names[i]), i))
+            ids += parts
+            if len(ids) < limit and len(query) >= FUZZY_MIN_LENGTH:
+                ids += self._fuzzy(query, found | set(parts), limit - len(ids))
+        result = [self.names[i] for i in ids[:limit]]
+
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[(query, limit)] = result
+        return result
+
+    def resolve(self, text: str) -> Optional[str]:
+        """The name a query most likely means (exact match first), or None if nothing is close."""
+        query = normalize(text)
+        if query in self:
+            return query
+        matches = self.complete(query, 1)
+        return matches[0] if matches else None
+
+
+@functools.lru_cache(maxsize=None)
+def species_index(playable: bool = False) -> NameIndex:
+    """Index over the species in POKEMON_DATA (only those with moves if `playable`), built on first use."""
+    return NameIndex([name for name, data in POKEMON_DATA.items() if data['moves'] or not playable])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark species-name autocomplete per keystroke.")
+    parser.add_argument("queries", nargs="*", help="Queries to complete (default: a keystroke benchmark)")
+    parser.add_argument("--names", type=int, default=200, help="Names to type, each with one typo")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = species_index()
+    print(f"Indexed {len(index.names)} species in {(time.perf_counter() - started) * 1000:.1f} ms")
+    if args.queries:
+        for query in args.queries:
+            print(f"{query!r}: {', '.join(index.complete(query))}")
+        return
+
+    # Type names keystroke by keystroke, with one character replaced partway through
+    rng = random.Random(args.seed)
+    typed_names = []
+    keystrokes = []
+    for name in rng.sample(index.names, args.names):
+        typo = rng.randrange(len(name))
+        typed = name[:typo] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[typo + 1:]
+        typed_names.append((name, typed))
+        keystrokes.extend(typed[:n] for n in range(1, len(typed) + 1))
+
+    index._cache.clear()
+    timings = []
+    for query in keystrokes:
+        started = time.perf_counter()
+        index.complete(query)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    found = sum(name in index.complete(typed) for name, typed in typed_names)
+    print(f"{len(keystrokes)} keystrokes: mean {sum(timings) / len(timings) * 1e6:.0f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f} us, max {timings[-1] * 1e6:.0f} us")
+    print(f"Misspelled full names completed to the intended species: {found}/{len(typed_names)}")
+
+    started = time.perf_counter()
+    for query in keystrokes[:200]:
+        difflib.get_close_matches(normalize(query), index.names, n=8)
+    print(f"Linear difflib scan: {(time.perf_counter() - started) / 200 * 1e6:.0f} us per keystroke")
+
+
+if __name__ == "__main__":
+    main()
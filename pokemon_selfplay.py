@@ -0,0 +1,384 @@
+from typing import List, Optional, Sequence, Dict, Callable, Tuple
+import os
+import json
+import shutil
+import random
+import argparse
+import multiprocessing as mp
+from collections import deque
+import numpy as np
+from tqdm import tqdm
+
+from pokemon_battle import (Pokemon, Team, Battle, BattleMode, POKEMON_DATA, DEFAULT_PLAYER_TEAM,
+                            DEFAULT_OPPONENT_TEAM)
+from pokemon_adversary import Adversary, RandomAdversary
+from pokemon_encoder import BattleEncoder
+from pokemon_metrics import (SELFPLAY_BATTLES, SELFPLAY_RECORDS, SELFPLAY_CHUNKS_IN_FLIGHT,
+                             add_metrics_arguments, battle_recorder, start_metrics)
+from pokemon_stats import DEFAULT_STAT_PRESET
+from pokemon_env import (action_mask, action_mask_shape, encode_action, sanitize_actions, replace_fainted,
+                         num_actions)
+
+# Policy factories by name, each called as factory(team, battle_mode, rng=rng)
+POLICIES = {
+    "adversary": Adversary,
+    "random": RandomAdversary,
+}
+
+# Species with at least one move, the pool for random teams
+PLAYABLE_SPECIES = sorted(name for name, data in POKEMON_DATA.items() if data['moves'])
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def battle_rng(seed: int, battle_id: int) -> random.Random:
+    """Random source for one battle, so any battle can be replayed from (seed, battle_id)."""
+    return random.Random(seed * 2**32 + battle_id)
+
+
+def random_team_names(rng: random.Random, size: int = 6) -> List[str]:
+    """Sample distinct playable species for a team."""
+    return rng.sample(PLAYABLE_SPECIES, size)
+
+
+def build_team(names: Sequence[str], battle_mode: BattleMode, level: int = 50,
+               rng: Optional[random.Random] = None, stat_preset: str = DEFAULT_STAT_PRESET) -> Team:
+    """Build a battle-ready team from species names."""
+    return Team([Pokemon.from_data(name, level, rng=rng, stat_preset=stat_preset) for name in names], battle_mode)
+
+
+def play_battle(battle: Battle, player_ai, opponent_ai, max_turns: int = 200,
+                on_turn: Optional[Callable] = None) -> int:
+    """Play a battle to the end between two policies.
+
+    Fainted active Pokemon are replaced automatically between turns, and the battle
+    is called a draw after `max_turns`.
+
+    Args:
+        battle: A freshly created battle
+        player_ai: Policy for the player team (anything with choose_action(opponent_team))
+        opponent_ai: Policy for the opponent team
+        max_turns: Turn limit
+        on_turn: Optional callback(battle, player_actions, opponent_actions), called before each turn executes
+
+    Returns:
+        1 if the player won, -1 if the opponent won, 0 for a draw
+    """
+    recorder = battle_recorder(battle, (player_ai, opponent_ai))
+    result = 0
+    while not battle.is_battle_over():
+        if battle.turn_count >= max_turns:
+            break
+        player_actions = sanitize_actions(battle.player_team, player_ai.choose_action(battle.opponent_team))
+        opponent_actions = sanitize_actions(battle.opponent_team, opponent_ai.choose_action(battle.player_team))
+        if on_turn is not None:
+            on_turn(battle, player_actions, opponent_actions)
+        battle.execute_turn(player_actions, opponent_actions)
+        if not battle.is_battle_over():
+            replace_fainted(battle.player_team)
+            replace_fainted(battle.opponent_team)
+    else:
+        result = -1 if battle.player_team.is_defeated() else 1
+    if recorder is not None:
+        recorder.finish(result)
+    return result
+
+
+def setup_battle(config: dict, battle_id: int) -> Tuple[Battle, object, object]:
+    """Battle `battle_id` of a self-play config (see generate), with both policies, ready to play.
+
+    Returns:
+        (battle, player policy, opponent policy)
+    """
+    battle_mode = BattleMode(config["battle_mode"])
+    rng = battle_rng(config["seed"], battle_id)
+    if config["random_teams"]:
+        player_names, opponent_names = random_team_names(rng), random_team_names(rng)
+    else:
+        player_names, opponent_names = config["player_team"], config["opponent_team"]
+    player_team = build_team(player_names, battle_mode, config["level"], rng)
+    opponent_team = build_team(opponent_names, battle_mode, config["level"], rng)
+    battle = Battle(player_team, opponent_team, verbose=False, rng=rng)
+    player_ai = POLICIES[config["player_policy"]](player_team, battle_mode, rng=rng)
+    opponent_ai = POLICIES[config["opponent_policy"]](opponent_team, battle_mode, rng=rng)
+    return battle, player_ai, opponent_ai
+
+
+def column_specs(battle_mode: BattleMode, observation_size: int) -> Dict[str, tuple]:
+    """Per-record (shape, dtype) of every column in a self-play dataset."""
+    num_active = 1 if battle_mode == BattleMode.SINGLE else 2
+    return {
+        "states": ((observation_size,), np.float32),
+        "actions": ((num_active,), np.int16),
+        "masks": ((num_active, num_actions(battle_mode)), np.bool_),
+        "outcomes": ((), np.int8),
+        "battle_ids": ((), np.int64),
+        "turns": ((), np.int16),
+        "sides": ((), np.int8),
+    }
+
+
+class _RecordBuffer:
+    """Growable column buffers for the records of one work chunk."""
+
+    def __init__(self, specs: Dict[str, tuple], capacity: int = 1024):
+        self.specs = specs
+        self.size = 0
+        self.columns = {name: np.zeros((capacity,) + shape, dtype=dtype) for name, (shape, dtype) in specs.items()}
+
+    def next_row(self) -> int:
+        capacity = len(self.columns["outcomes"])
+        if self.size == capacity:
+            for name, column in self.columns.items():
+                grown = np.zeros((capacity * 2,) + column.shape[1:], dtype=column.dtype)
+                grown[:capacity] = column
+                self.columns[name] = grown
+        self.size += 1
+        return self.size - 1
+
+    def trimmed(self) -> Dict[str, np.ndarray]:
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+
+def _play_chunk(task: dict) -> Dict[str, np.ndarray]:
+    """Play battles [start, stop) and return their records, battle by battle and turn by turn.
+
+    Every turn produces one record per side: the state from that side's perspective, the
+    legal action mask, the action it took and the final outcome for that side.
+    """
+    config = task["config"]
+    battle_mode = BattleMode(config["battle_mode"])
+    encoder = BattleEncoder(battle_mode)
+    records = _RecordBuffer(column_specs(battle_mode, encoder.size))
+    columns = records.columns
+
+    for battle_id in range(task["start"], task["stop"]):
+        battle, player_ai, opponent_ai = setup_battle(config, battle_id)
+        first_row = records.size
+
+        def record(battle, player_actions, opponent_actions):
+            sides = ((0, "player", battle.player_team, battle.opponent_team, player_actions),
+                     (1, "opponent", battle.opponent_team, battle.player_team, opponent_actions))
+            for side, perspective, team, other, actions in sides:
+                row = records.next_row()
+                encoder.encode(battle, columns["states"][row], perspective)
+                action_mask(team, other, columns["masks"][row].reshape(action_mask_shape(battle_mode)))
+                encode_action(team, actions, columns["actions"][row])
+                columns["battle_ids"][row] = battle_id
+                columns["turns"][row] = battle.turn_count
+                columns["sides"][row] = side
+
+        outcome = play_battle(battle, player_ai, opponent_ai, config["max_turns"], on_turn=record)
+        rows = slice(first_row, records.size)
+        columns["outcomes"][rows] = np.where(columns["sides"][rows] == 0, outcome, -outcome)
+
+    return records.trimmed()
+
+
+def _write_json_atomic(path: str, data: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_manifest(directory: str) -> Optional[dict]:
+    """Load a dataset manifest, or None if the directory has none yet."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class ShardWriter:
+    """Packs records into fixed-size shards and commits each one atomically.
+
+    A shard is a directory holding one .npy file per column. It is written under a
+    temporary name and renamed into place before the manifest that lists it is
+    replaced, so the manifest only ever references complete shards. The manifest also
+    records where generation stopped (`next_battle`, plus how many of that battle's
+    records are already committed in `skip_records`) so an interrupted run can resume.
+    """
+
+    def __init__(self, directory: str, manifest: dict, specs: Dict[str, tuple]):
+        self.directory = directory
+        self.manifest = manifest
+        self.shard_size = manifest["config"]["shard_size"]
+        self.columns = {name: np.zeros((self.shard_size,) + shape, dtype=dtype)
+                        for name, (shape, dtype) in specs.items()}
+        self.size = 0
+        self._battle = manifest["next_battle"]
+        self._battle_records = manifest["skip_records"]
+
+    def add(self, records: Dict[str, np.ndarray]):
+        """Append records (in battle order), flushing every time a shard fills up."""
+        total = len(records["battle_ids"])
+        start = 0
+        while start < total:
+            count = min(total - start, self.shard_size - self.size)
+            for name, column in self.columns.items():
+                column[self.size:self.size + count] = records[name][start:start + count]
+            self._track_battles(records["battle_ids"][start:start + count])
+            self.size += count
+            start += count
+            if self.size == self.shard_size:
+                self.flush()
+
+    def _track_battles(self, battle_ids: np.ndarray):
+        last = int(battle_ids[-1])
+        if last != self._battle:
+            self._battle = last
+            self._battle_records = 0
+        self._battle_records += int((battle_ids == last).sum())
+
+    def flush(self, next_battle: Optional[int] = None):
+        """Commit the buffered records as a shard (if any) and update the manifest."""
+        if self.size:
+            name = f"shard-{len(self.manifest['shards']):06d}"
+            final_path = os.path.join(self.directory, name)
+            tmp_path = final_path + ".tmp"
+            for path in (tmp_path, final_path):
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+            os.makedirs(tmp_path)
+            for column_name, column in self.columns.items():
+                with open(os.path.join(tmp_path, f"{column_name}.npy"), 'wb') as f:
+                    np.save(f, column[:self.size])
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.rename(tmp_path, final_path)
+            self.manifest["shards"].append({
+                "name": name,
+                "records": self.size,
+                "first_battle": int(self.columns["battle_ids"][0]),
+            })
+            self.manifest["total_records"] += self.size
+            self.size = 0
+
+        if next_battle is not None:
+            self.manifest["next_battle"] = next_battle
+            self.manifest["skip_records"] = 0
+        else:
+            self.manifest["next_battle"] = self._battle
+            self.manifest["skip_records"] = self._battle_records
+        _write_json_atomic(os.path.join(self.directory, MANIFEST_NAME), self.manifest)
+
+
+def generate(directory: str, num_battles: int, battle_mode: BattleMode = BattleMode.SINGLE,
+             player_policy: str = "adversary", opponent_policy: str = "adversary",
+             player_team: Sequence[str] = DEFAULT_PLAYER_TEAM, opponent_team: Sequence[str] = DEFAULT_OPPONENT_TEAM,
+             random_teams: bool = False, level: int = 50, max_turns: int = 200, seed: int = 0,
+             shard_size: int = 4096, workers: int = 1, chunk_battles: int = 8) -> dict:
+    """Generate self-play records for battles [0, num_battles) into sharded columnar files.
+
+    Re-running with the same settings resumes after the last committed shard; battles
+    are seeded individually, so the resumed dataset is identical to an uninterrupted run.
+    Memory stays bounded by one shard buffer plus a few in-flight chunks per worker.
+
+    Returns:
+        The final manifest
+    """
+    if player_policy not in POLICIES or opponent_policy not in POLICIES:
+        raise ValueError(f"Unknown policy, choose from: {', '.join(POLICIES)}")
+    observation_size = BattleEncoder(battle_mode).size
+    config = {
+        "battle_mode": battle_mode.value,
+        "player_policy": player_policy,
+        "opponent_policy": opponent_policy,
+        "player_team": list(player_team),
+        "opponent_team": list(opponent_team),
+        "random_teams": random_teams,
+        "level": level,
+        "max_turns": max_turns,
+        "seed": seed,
+        "shard_size": shard_size,
+        "observation_size": observation_size,
+        "num_actions": num_actions(battle_mode),
+    }
+    specs = column_specs(battle_mode, observation_size)
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    if manifest is None:
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "config": config,
+            "columns": {name: {"shape": list(shape), "dtype": np.dtype(dtype).str}
+                        for name, (shape, dtype) in specs.items()},
+            "shards": [],
+            "total_records": 0,
+            "next_battle": 0,
+            "skip_records": 0,
+        }
+    elif manifest["config"] != config:
+        raise ValueError(f"{directory} holds a dataset generated with different settings")
+
+    writer = ShardWriter(directory, manifest, specs)
+    resume_battle, skip = manifest["next_battle"], manifest["skip_records"]
+    tasks = ({"config": config, "start": start, "stop": min(start + chunk_battles, num_battles)}
+             for start in range(resume_battle, num_battles, chunk_battles))
+
+    def consume(records, task, progress):
+        nonlocal skip
+        if skip:
+            records = {name: column[skip:] for name, column in records.items()}
+            skip = 0
+        if len(records["battle_ids"]):
+            writer.add(records)
+        progress.update(task["stop"] - task["start"])
+        SELFPLAY_BATTLES.inc(task["stop"] - task["start"])
+        SELFPLAY_RECORDS.inc(len(records["battle_ids"]))
+
+    with tqdm(total=max(0, num_battles - resume_battle), unit="battle") as progress:
+        if workers <= 1:
+            for task in tasks:
+                consume(_play_chunk(task), task, progress)
+        else:
+            # Keep a bounded window of chunks in flight and consume them in battle order
+            with mp.Pool(workers) as pool:
+                pending = deque()
+                for task in tasks:
+                    pending.append((task, pool.apply_async(_play_chunk, (task,))))
+                    SELFPLAY_CHUNKS_IN_FLIGHT.set(len(pending))
+                    if len(pending) >= workers * 2:
+                        task, result = pending.popleft()
+                        consume(result.get(), task, progress)
+                while pending:
+                    task, result = pending.popleft()
+                    consume(result.get(), task, progress)
+                    SELFPLAY_CHUNKS_IN_FLIGHT.set(len(pending))
+
+    writer.flush(next_battle=max(num_battles, resume_battle))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate self-play battle records as sharded .npy columns.")
+    parser.add_argument("output", help="Dataset directory (re-run to resume)")
+    parser.add_argument("--battles", type=int, default=100)
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--player-policy", choices=sorted(POLICIES), default="adversary")
+    parser.add_argument("--opponent-policy", choices=sorted(POLICIES), default="adversary")
+    parser.add_argument("--random-teams", action="store_true", help="Sample random teams for every battle")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shard-size", type=int, default=4096)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    # Engine metrics only cover battles played in this process (--workers 1)
+    start_metrics(args)
+    manifest = generate(args.output, args.battles,
+                        battle_mode=BattleMode.DOUBLE if args.mode == "double" else BattleMode.SINGLE,
+                        player_policy=args.player_policy, opponent_policy=args.opponent_policy,
+                        random_teams=args.random_teams, seed=args.seed, shard_size=args.shard_size,
+                        workers=args.workers)
+    print(f"{manifest['total_records']} records in {len(manifest['shards'])} shards at {args.output}")
+
+
+if __name__ == "__main__":
+    main()
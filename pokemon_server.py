@@ -0,0 +1,422 @@
+from typing import List, Optional, Sequence, Dict
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+
+from pokemon_battle import Team, Battle, BattleMode, POKEMON_DATA, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+from pokemon_env import PASS_ACTION, action_mask, decode_action, encode_action, replace_fainted
+from pokemon_selfplay import POLICIES, build_team
+from pokemon_metrics import Gauge, add_metrics_arguments, battle_recorder, start_metrics
+
+# Protocol: one JSON object per line in each direction. Requests carry an "op" and an
+# optional "id" that is echoed back so clients can pipeline requests.
+#   {"op": "create", "mode": "single", "player_team": [...], "opponent_team": [...],
+#    "opponent_policy": "adversary", "seed": 1}             -> {"event": "created", ...}
+#   {"op": "action", "battle_id": 3, "action": 0}          -> {"event": "turn", ...}
+#        (double battles send one action per slot, e.g. [0, 9]; see pokemon_env for the encoding)
+#   {"op": "state", "battle_id": 3}                        -> {"event": "state", ...}
+#   {"op": "close", "battle_id": 3}                        -> {"event": "closed", ...}
+# Failures are answered with {"event": "error", "message": ...}.
+
+
+class _RecordingBattle(Battle):
+    """Battle that collects its log messages for the turn event instead of printing them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages = []
+
+    def log(self, message: str):
+        message = message.strip()
+        if message:
+            self.messages.append(message)
+
+
+def _decide(policy, opponent_team: Team, seed: int) -> List[int]:
+    """Run a policy decision (in an executor) and return it as discrete action indices.
+
+    The policy gets a fresh rng from `seed`, so decisions are reproducible whether the
+    policy runs in a thread or is pickled into a worker process.
+    """
+    policy.rng = random.Random(seed)
+    actions = policy.choose_action(opponent_team)
+    num_active = len(policy.team.active_pokemon_indices)
+    return [int(i) for i in encode_action(policy.team, actions, np.zeros(num_active, dtype=np.int64))]
+
+
+def _to_engine_actions(team: Team, indices: Sequence[int], mask: np.ndarray):
+    if team.battle_mode == BattleMode.SINGLE:
+        return decode_action(team, indices[0], mask)
+    actions = decode_action(team, [max(i, 0) for i in indices], mask)
+    return [PASS_ACTION if i < 0 else action for i, action in zip(indices, actions)]
+
+
+def _valid_index(action, size: int) -> bool:
+    # Exactly int: JSON true/false and 1.5 are not actions, and negative indices would wrap around
+    return type(action) is int and 0 <= action < size
+
+
+class BattleSession:
+    """One hosted battle between a remote player and a server-side policy."""
+
+    def __init__(self, battle_id: int, battle_mode: BattleMode, player_names: Sequence[str],
+                 opponent_names: Sequence[str], opponent_policy: str, seed: Optional[int],
+                 level: int, max_turns: int):
+        self.battle_id = battle_id
+        self.battle_mode = battle_mode
+        self.max_turns = max_turns
+        self.rng = random.Random(seed)
+        player_team = build_team(player_names, battle_mode, level, self.rng)
+        opponent_team = build_team(opponent_names, battle_mode, level, self.rng)
+        self.battle = _RecordingBattle(player_team, opponent_team, verbose=False, rng=self.rng)
+        self.opponent = POLICIES[opponent_policy](opponent_team, battle_mode, rng=self.rng)
+        # Decisions run in the executor, possibly in another process, so they are counted but not timed
+        self.recorder = battle_recorder(self.battle, [self.opponent], timed_policies=())
+        self.lock = asyncio.Lock()
+        self.mask = action_mask(player_team, opponent_team)
+        self.winner = None
+
+    @property
+    def over(self) -> bool:
+        return self.winner is not None
+
+    def legal_actions(self):
+        """Legal discrete actions for the player (per slot in double battles)."""
+        if self.over:
+            return []
+        if self.battle_mode == BattleMode.SINGLE:
+            return np.flatnonzero(self.mask).tolist()
+        return [np.flatnonzero(slot).tolist() for slot in self.mask]
+
+    def is_legal(self, action) -> bool:
+        """Whether `action` is a legal action index (a list of two in double battles).
+
+        Indices must be plain ints in range; a slot with no legal action (fainted) accepts any index.
+        """
+        if self.battle_mode == BattleMode.SINGLE:
+            return _valid_index(action, len(self.mask)) and bool(self.mask[action])
+        if not isinstance(action, (list, tuple)) or len(action) != 2:
+            return False
+        return all(_valid_index(a, len(slot)) and (slot[a] or not slot.any()) for slot, a in zip(self.mask, action))
+
+    def _team_state(self, team: Team) -> List[dict]:
+        return [{
+            "name": pokemon.name,
+            "hp": pokemon.current_hp,
+            "max_hp": pokemon.hp,
+            "active": index in team.active_pokemon_indices,
+            "moves": [move.name for move in pokemon.moves],
+        } for index, pokemon in enumerate(team.pokemon)]
+
+    def state(self) -> dict:
+        return {
+            "battle_id": self.battle_id,
+            "mode": self.battle_mode.value,
+            "turn": self.battle.turn_count,
+            "player": self._team_state(self.battle.player_team),
+            "opponent": self._team_state(self.battle.opponent_team),
+            "legal_actions": self.legal_actions(),
+            "over": self.over,
+            "winner": self.winner,
+        }
+
+    def play_turn(self, action, opponent_indices: List[int]) -> List[str]:
+        """Execute one turn with the player's discrete action(s) and the policy's decision."""
+        battle = self.battle
+        battle.messages = []
+        indices = [action] if self.battle_mode == BattleMode.SINGLE else list(action)
+        player_actions = _to_engine_actions(battle.player_team, [int(i) for i in indices], self.mask)
+        opponent_mask = action_mask(battle.opponent_team, battle.player_team)
+        opponent_actions = _to_engine_actions(battle.opponent_team, opponent_indices, opponent_mask)
+        battle.execute_turn(player_actions, opponent_actions)
+
+        if battle.is_battle_over():
+            self.winner = "opponent" if battle.player_team.is_defeated() else "player"
+        elif battle.turn_count >= self.max_turns:
+            self.winner = "draw"
+        else:
+            replace_fainted(battle.player_team)
+            replace_fainted(battle.opponent_team)
+        if self.over and self.recorder is not None:
+            self.recorder.finish({"player": 1, "opponent": -1, "draw": 0}[self.winner])
+        action_mask(battle.player_team, battle.opponent_team, self.mask)
+        return battle.messages
+
+    def close(self):
+        """Record the metrics of a battle dropped before it ended."""
+        if self.recorder is not None:
+            self.recorder.finish()
+
+
+class BattleServer:
+    """Hosts many concurrent battles behind a line-delimited JSON protocol.
+
+    Battle mechanics run on the event loop (a turn takes well under a millisecond), while
+    policy decisions are handed to `executor` so a slow AI only delays its own battle.
+    Battles belong to the connection that created them and are dropped when it closes.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None, max_sessions: int = 10000,
+                 level: int = 50, max_turns: int = 200):
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        self.max_sessions = max_sessions
+        self.level = level
+        self.max_turns = max_turns
+        self.sessions: Dict[int, BattleSession] = {}
+        self._ids = itertools.count(1)
+        self.turns_played = 0
+        self.decisions_pending = 0
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        owned = set()
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(message: dict):
+            response = await self.dispatch(message, owned)
+            if "id" in message:
+                response["id"] = message["id"]
+            async with write_lock:
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    message = {"op": "invalid", "error": str(e)}
+                # Requests run concurrently; per-battle locks keep each battle's turns in order
+                task = asyncio.create_task(respond(message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            for battle_id in owned:
+                session = self.sessions.pop(battle_id, None)
+                if session is not None:
+                    session.close()
+            writer.close()
+
+    async def dispatch(self, message: dict, owned: set) -> dict:
+        op = message.get("op")
+        try:
+            if op == "create":
+                return self._create(message, owned)
+            if op in ("action", "state", "close"):
+                battle_id = message.get("battle_id")
+                if battle_id not in owned:
+                    return {"event": "error", "message": f"Unknown battle {battle_id}"}
+                session = self.sessions[battle_id]
+                if op == "state":
+                    return {"event": "state", **session.state()}
+                if op == "close":
+                    owned.discard(battle_id)
+                    self.sessions.pop(battle_id, None)
+                    session.close()
+                    return {"event": "closed", "battle_id": battle_id}
+                return await self._action(session, message.get("action"))
+            if op == "invalid":
+                return {"event": "error", "message": f"Malformed request: {message['error']}"}
+            return {"event": "error", "message": f"Unknown op {op!r}"}
+        except (KeyError, ValueError, TypeError) as e:
+            return {"event": "error", "message": str(e)}
+
+    def _create(self, message: dict, owned: set) -> dict:
+        if len(self.sessions) >= self.max_sessions:
+            return {"event": "error", "message": "Server is at its battle limit"}
+        battle_mode = BattleMode(message.get("mode", "single"))
+        player_names = message.get("player_team", DEFAULT_PLAYER_TEAM)
+        opponent_names = message.get("opponent_team", DEFAULT_OPPONENT_TEAM)
+        for name in list(player_names) + list(opponent_names):
+            if name not in POKEMON_DATA or not POKEMON_DATA[name]['moves']:
+                return {"event": "error", "message": f"Unknown or moveless Pokemon {name!r}"}
+        policy = message.get("opponent_policy", "adversary")
+        if policy not in POLICIES:
+            return {"event": "error", "message": f"Unknown policy {policy!r}"}
+
+        battle_id = next(self._ids)
+        session = BattleSession(battle_id, battle_mode, player_names, opponent_names, policy,
+                                message.get("seed"), self.level, self.max_turns)
+        self.sessions[battle_id] = session
+        owned.add(battle_id)
+        return {"event": "created", **session.state()}
+
+    async def _action(self, session: BattleSession, action) -> dict:
+        async with session.lock:
+            if session.over:
+                return {"event": "error", "message": "Battle is over"}
+            if not session.is_legal(action):
+                return {"event": "error", "message": f"Illegal action {action!r}",
+                        "legal_actions": session.legal_actions()}
+            seed = session.rng.getrandbits(64)
+            loop = asyncio.get_running_loop()
+            self.decisions_pending += 1
+            try:
+                opponent_indices = await loop.run_in_executor(
+                    self.executor, _decide, session.opponent, session.battle.player_team, seed)
+            finally:
+                self.decisions_pending -= 1
+            messages = session.play_turn(action, opponent_indices)
+            self.turns_played += 1
+            return {"event": "turn", "log": messages, **session.state()}
+
+    def register_metrics(self):
+        """Expose open battles, turns played and AI decisions waiting for the executor."""
+        Gauge("pokemon_server_sessions", "Open battle sessions.", lambda: len(self.sessions))
+        Gauge("pokemon_server_turns_played", "Turns played since the server started.", lambda: self.turns_played)
+        Gauge("pokemon_server_decisions_pending", "AI decisions queued or running in the executor.",
+              lambda: self.decisions_pending)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None):
+        """Serve forever on a TCP port, or on a Unix socket if `unix_path` is given."""
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+            print(f"Battle server listening on {unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            print(f"Battle server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+class BattleClient:
+    """Minimal client that pipelines requests over one connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None):
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _read_responses(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self._pending.pop(response.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self._pending.values():
+            future.set_exception(ConnectionError("Server closed the connection"))
+
+    async def request(self, message: dict) -> dict:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self.writer.write(json.dumps({**message, "id": request_id}).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self._reader_task.cancel()
+        self.writer.close()
+
+
+async def _play_random_battle(client: BattleClient, mode: str, turns: int, rng: random.Random,
+                              latencies: List[float]):
+    state = await client.request({"op": "create", "mode": mode, "seed": rng.getrandbits(32)})
+    for _ in range(turns):
+        if state.get("over") or state.get("event") == "error":
+            break
+        legal = state["legal_actions"]
+        if mode == "single":
+            action = rng.choice(legal)
+        else:
+            action = [rng.choice(slot) if slot else 0 for slot in legal]
+        started = time.perf_counter()
+        state = await client.request({"op": "action", "battle_id": state["battle_id"], "action": action})
+        latencies.append(time.perf_counter() - started)
+    await client.request({"op": "close", "battle_id": state["battle_id"]})
+
+
+async def load_test(concurrency: int, battles: int, turns: int, mode: str = "single", connections: int = 50,
+                    host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None, seed: int = 0) -> dict:
+    """Play `battles` random-action battles, `concurrency` at a time, and summarize turn latency."""
+    clients = [await BattleClient.connect(host, port, unix_path) for _ in range(min(connections, concurrency))]
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index: int):
+        async with semaphore:
+            await _play_random_battle(clients[index % len(clients)], mode, turns,
+                                      random.Random(rng.getrandbits(32)), latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(battles)))
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        await client.close()
+
+    samples = np.array(latencies) * 1000
+    return {
+        "turns": len(latencies),
+        "turns_per_second": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(samples, 50)) if len(samples) else 0.0,
+        "p99_ms": float(np.percentile(samples, 99)) if len(samples) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host battles over line-delimited JSON, or load-test a server.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "loadtest"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("--host", default="127.0.0.1")
+        sub.add_argument("--port", type=int, default=8765)
+        sub.add_argument("--unix", help="Unix socket path instead of TCP")
+    serve = subparsers.choices["serve"]
+    serve.add_argument("--processes", type=int, default=0, help="Run AI decisions in this many worker processes")
+    serve.add_argument("--max-battles", type=int, default=10000)
+    add_metrics_arguments(serve)
+    loadtest = subparsers.choices["loadtest"]
+    loadtest.add_argument("--concurrency", type=int, default=100)
+    loadtest.add_argument("--battles", type=int, default=500)
+    loadtest.add_argument("--turns", type=int, default=20)
+    loadtest.add_argument("--connections", type=int, default=50)
+    loadtest.add_argument("--mode", choices=["single", "double"], default="single")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        executor = ProcessPoolExecutor(args.processes) if args.processes else None
+        server = BattleServer(executor=executor, max_sessions=args.max_battles)
+        if start_metrics(args):
+            server.register_metrics()
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    else:
+        result = asyncio.run(load_test(args.concurrency, args.battles, args.turns, args.mode, args.connections,
+                                       args.host, args.port, args.unix))
+        print(f"{result['turns']} turns at concurrency {args.concurrency}: "
+              f"{result['turns_per_second']:.0f} turns/s, p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
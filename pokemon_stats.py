@@ -0,0 +1,183 @@
+from typing import Dict, Optional, Sequence, Tuple
+import time
+import argparse
+import functools
+import numpy as np
+
+# Battle stats in table order (the Pokemon field names)
+STAT_NAMES = ("hp", "attack", "defense", "special_attack", "special_defense", "speed")
+MAX_LEVEL = 100
+
+# Stat presets: name -> (IV, EV) given to every stat, with a neutral nature. "base" is the
+# engine's original model: level-scaled HP (2 * base * level / 100 + level + 10, not
+# rounded) and the raw base stats for everything else, whatever the level.
+STAT_PRESETS: Dict[str, Optional[Tuple[int, int]]] = {
+    "base": None,
+    "neutral": (0, 0),
+    "random-battle": (31, 85),
+    "max": (31, 252),
+}
+# The default keeps the engine's original, incorrect stats (raw base stats at every level),
+# so results and trained models from before the presets stay comparable. Pick another preset
+# for the games' stat formula.
+DEFAULT_STAT_PRESET = "base"
+
+# Species whose HP is always 1
+FIXED_HP_SPECIES = ("shedinja",)
+
+
+def base_stat_array(pokemon_data: dict, species: Sequence[str]) -> np.ndarray:
+    """Base stats of `species`, shaped (species, 6) in STAT_NAMES order."""
+    keys = [name.replace("_", "-") for name in STAT_NAMES]
+    return np.array([[pokemon_data[name]['base_stats'][key] for key in keys] for name in species], dtype=np.int64)
+
+
+def scale_stats(base: np.ndarray, levels: np.ndarray,
+                preset: str = DEFAULT_STAT_PRESET) -> Tuple[np.ndarray, np.ndarray]:
+    """In-battle stats for every combination of `base` rows and `levels`.
+
+    Args:
+        base: Base stats, shaped (species, 6)
+        levels: Levels, shaped (levels,)
+        preset: Key of STAT_PRESETS
+
+    Returns:
+        (HP shaped (species, levels) as float64, the other five stats shaped
+        (species, levels, 5) as int16)
+    """
+    if preset not in STAT_PRESETS:
+        raise ValueError(f"Unknown stat preset {preset!r}; choose from {', '.join(STAT_PRESETS)}")
+    base = np.asarray(base, dtype=np.int64)[:, None, :]
+    levels = np.asarray(levels, dtype=np.int64)[None, :, None]
+    if STAT_PRESETS[preset] is None:
+        # Same operations in the same order as the original float formula, so the values are identical
+        hp = base[..., 0] * 2 * levels[..., 0] / 100 + levels[..., 0] + 10
+        others = np.broadcast_to(base[..., 1:], hp.shape + (5,))
+        return hp, others.astype(np.int16)
+    iv, ev = STAT_PRESETS[preset]
+    raw = (2 * base + iv + ev // 4) * levels // 100
+    hp = (raw[..., 0] + levels[..., 0] + 10).astype(np.float64)
+    return hp, (raw[..., 1:] + 5).astype(np.int16)
+
+
+class StatTable:
+    """In-battle stats of every species at every level 1..MAX_LEVEL under one preset.
+
+    HP is kept as float64, like Pokemon.hp, and the other stats as int16, about 2 MB
+    for the bundled species. Index with (species index, level); row 0 of the level
+    axis is unused. lookup() serves single Pokemon (as Python numbers, cached per
+    species and level) and gather() whole batches.
+    """
+
+    def __init__(self, species: Sequence[str], base: np.ndarray, preset: str = DEFAULT_STAT_PRESET,
+                 fixed_hp: Sequence[str] = FIXED_HP_SPECIES):
+        self.preset = preset
+        self.species = list(species)
+        self.index = {name: i for i, name in enumerate(self.species)}
+        self.base = np.asarray(base)
+        self.fixed_hp = np.isin(self.species, list(fixed_hp))
+        self.hp, self.stats = self._scale(np.arange(MAX_LEVEL + 1))
+        self.hp[:, 0] = 0.0
+        self.stats[:, 0] = 0
+        self._rows: Dict[Tuple[str, int], tuple] = {}
+
+    def _scale(self, levels: np.ndarray, rows: slice = slice(None)) -> Tuple[np.ndarray, np.ndarray]:
+        hp, stats = scale_stats(self.base[rows], levels, self.preset)
+        if STAT_PRESETS[self.preset] is not None:
+            hp[self.fixed_hp[rows]] = 1.0
+        return hp, stats
+
+    @property
+    def nbytes(self) -> int:
+        return self.hp.nbytes + self.stats.nbytes
+
+    def lookup(self, species: str, level: int) -> tuple:
+        """(hp, attack, defense, special_attack, special_defense, speed) of a species at a level."""
+        key = (species, level)
+        row = self._rows.get(key)
+        if row is None:
+            i = self.index[species]
+            if 1 <= level <= MAX_LEVEL:
+                hp, stats = self.hp[i, level], self.stats[i, level]
+            else:
+                # Off the table: computed on its own
+                hp, stats = self._scale(np.array([level]), slice(i, i + 1))
+                hp, stats = hp[0, 0], stats[0, 0]
+            row = (hp.item(),) + tuple(stats.tolist())
+            self._rows[key] = row
+        return row
+
+    def gather(self, species_indices: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        """Stats of many Pokemon at once, shaped (..., 6) in STAT_NAMES order (float64)."""
+        out = np.empty(np.shape(species_indices) + (len(STAT_NAMES),))
+        out[..., 0] = self.hp[species_indices, levels]
+        out[..., 1:] = self.stats[species_indices, levels]
+        return out
+
+
+@functools.lru_cache(maxsize=None)
+def stat_table(preset: str = DEFAULT_STAT_PRESET) -> StatTable:
+    """The table of the bundled species for a preset, built on first use."""
+    if preset not in STAT_PRESETS:
+        raise ValueError(f"Unknown stat preset {preset!r}; choose from {', '.join(STAT_PRESETS)}")
+    # Imported here because pokemon_battle builds Pokemon from these tables
+    from pokemon_battle import POKEMON_DATA
+    species = list(POKEMON_DATA)
+    return StatTable(species, base_stat_array(POKEMON_DATA, species), preset)
+
+
+def _formula_stats(data: dict, level: int) -> tuple:
+    """The per-construction computation lookup() replaces, for comparison."""
+    stats = data['base_stats']
+    return ((stats['hp'] * 2 * level/100) + level + 10, stats['attack'], stats['defense'],
+            stats['special-attack'], stats['special-defense'], stats['speed'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the level-scaled stat tables and compare them with "
+                                                 "per-construction stat computation.")
+    parser.add_argument("--preset", choices=list(STAT_PRESETS), default="random-battle",
+                        help="Preset to print sample stats for")
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+
+    from pokemon_battle import POKEMON_DATA
+    for preset in STAT_PRESETS:
+        started = time.perf_counter()
+        table = stat_table(preset)
+        print(f"{preset}: {len(table.species)} species x {MAX_LEVEL} levels in "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms, {table.nbytes / 1e6:.1f} MB")
+
+    base = stat_table("base")
+    rng = np.random.default_rng(0)
+    species = [base.species[i] for i in rng.integers(len(base.species), size=1000)]
+    levels = rng.integers(1, MAX_LEVEL + 1, size=1000).tolist()
+    for name, level in zip(species, levels):
+        if base.lookup(name, level) != _formula_stats(POKEMON_DATA[name], level):
+            raise AssertionError(f"base table disagrees with the formula for {name} at level {level}")
+
+    pairs = list(zip(species, levels)) * (args.lookups // len(species))
+    started = time.perf_counter()
+    for name, level in pairs:
+        _formula_stats(POKEMON_DATA[name], level)
+    formula = (time.perf_counter() - started) / len(pairs) * 1e9
+    started = time.perf_counter()
+    for name, level in pairs:
+        base.lookup(name, level)
+    lookup = (time.perf_counter() - started) / len(pairs) * 1e9
+    indices = np.array([base.index[name] for name in species])
+    started = time.perf_counter()
+    for _ in range(100):
+        base.gather(indices, np.array(levels))
+    gather = (time.perf_counter() - started) / (100 * len(species)) * 1e9
+    print(f"Per Pokemon: formula {formula:.0f} ns, table lookup {lookup:.0f} ns, batched gather {gather:.1f} ns")
+
+    table = stat_table(args.preset)
+    for name in ("pikachu", "snorlax", "shedinja"):
+        if name in table.index:
+            print(f"{name} ({args.preset}): " + ", ".join(
+                f"L{level} {'/'.join(f'{v:g}' for v in table.lookup(name, level))}" for level in (5, 50, 100)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import os
+import math
+import time
+import random
+import argparse
+import functools
+import itertools
+import multiprocessing as mp
+
+from pokemon_battle import Battle, BattleMode, TeamTemplate, DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM
+from pokemon_adversary import Adversary, RandomAdversary
+from pokemon_selfplay import battle_rng, play_battle, random_team_names
+
+# Built-in entrants: name -> (policy class, constructor options). Learned policies are
+# named "neural:<weight file>" (see pokemon_neural), and Adversaries with tuned
+# heuristics "params:<parameter file>" (see pokemon_tuner).
+ENTRANTS = {
+    "adversary": (Adversary, {}),
+    "adversary-endgame": (Adversary, {"endgame": True}),
+    "adversary-per-slot": (Adversary, {"joint": False}),
+    "random": (RandomAdversary, {}),
+}
+# adversary-endgame solves every new 1v1 endgame exactly (about a second each, see
+# pokemon_endgame), which dominates a tournament's run time, so it is opt-in
+DEFAULT_ENTRANTS = ["adversary", "adversary-per-slot", "random"]
+
+# Elo: K factor. Glicko: starting rating and deviation, and the deviation regained per
+# rating period without games.
+ELO_K = 16.0
+INITIAL_RATING = 1500.0
+INITIAL_DEVIATION = 350.0
+DEVIATION_DRIFT = 30.0
+_GLICKO_Q = math.log(10) / 400
+
+
+def entrant_factory(name: str) -> Callable:
+    """Policy factory (called as factory(team, battle_mode, rng=rng)) for an entrant name."""
+    if name.startswith("neural:"):
+        from pokemon_neural import neural_policy
+        return neural_policy(_load_network(name.partition(":")[2]))
+    if name.startswith("params:"):
+        from pokemon_tuner import tuned_policy
+        return tuned_policy(name.partition(":")[2])
+    if name not in ENTRANTS:
+        raise ValueError(f"Unknown entrant {name!r}; choose from {', '.join(ENTRANTS)}, neural:<weight file> "
+                         f"or params:<tuned parameter file>")
+    policy, options = ENTRANTS[name]
+    return functools.partial(policy, **options)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_network(path: str):
+    from pokemon_neural import PolicyValueNet
+    return PolicyValueNet.load(path)
+
+
+def template_pool(size: int, level: int = 50, seed: int = 0) -> List[TeamTemplate]:
+    """`size` random teams with sampled movesets (size 0: the two default teams)."""
+    rng = random.Random(seed)
+    if size == 0:
+        return [TeamTemplate.from_names(names, level, rng) for names in (DEFAULT_PLAYER_TEAM, DEFAULT_OPPONENT_TEAM)]
+    return [TeamTemplate.from_names(random_team_names(rng), level, rng) for _ in range(size)]
+
+
+@dataclass(frozen=True)
+class Game:
+    """One scheduled battle: entrant `first` plays `first_team` on the player side against `second`.
+
+    Games come in pairs that share `seed` and swap which entrant gets which team.
+    """
+    game_id: int
+    first: int
+    second: int
+    first_team: int
+    second_team: int
+    seed: int
+
+
+def schedule(entrants: int, teams: int, games_per_pair: int, seed: int = 0) -> List[Game]:
+    """Round robin: `games_per_pair` games (rounded up to pairs) for every two entrants.
+
+    Rounds are interleaved so that every prefix of the schedule covers all pairings.
+    """
+    pairs = list(itertools.combinations(range(entrants), 2))
+    games = []
+    for round_index in range((games_per_pair + 1) // 2):
+        for pair_index, (a, b) in enumerate(pairs):
+            rng = random.Random(f"{seed}:{pair_index}:{round_index}")
+            team_a, team_b = rng.randrange(teams), rng.randrange(teams)
+            battle_seed = pair_index * games_per_pair + round_index
+            games.append(Game(len(games), a, b, team_a, team_b, battle_seed))
+            games.append(Game(len(games), b, a, team_a, team_b, battle_seed))
+    return games
+
+
+# Per-process tournament settings, set by _init_worker
+_worker = {}
+
+
+def _init_worker(entrant_names: Sequence[str], templates: Sequence[TeamTemplate], battle_mode: BattleMode,
+                 max_turns: int, seed: int):
+    _worker.update(factories=[entrant_factory(name) for name in entrant_names], templates=list(templates),
+                   battle_mode=battle_mode, max_turns=max_turns, seed=seed)
+
+
+def _play_game(game: Game) -> int:
+    """Result of a game for its first entrant: 1 win, -1 loss, 0 draw."""
+    battle_mode = _worker["battle_mode"]
+    rng = battle_rng(_worker["seed"], game.seed)
+    player = _worker["templates"][game.first_team].instantiate(battle_mode)
+    opponent = _worker["templates"][game.second_team].instantiate(battle_mode)
+    battle = Battle(player, opponent, verbose=False, rng=rng)
+    return play_battle(battle, _worker["factories"][game.first](player, battle_mode, rng=rng),
+                       _worker["factories"][game.second](opponent, battle_mode, rng=rng), _worker["max_turns"])
+
+
+def _play_games(games: Sequence[Game]) -> List[Tuple[Game, int]]:
+    return [(game, _play_game(game)) for game in games]
+
+
+class EloRatings:
+    """Elo ratings updated after every game, in the order results arrive."""
+
+    def __init__(self, players: int, k: float = ELO_K):
+        self.k = k
+        self.ratings = [INITIAL_RATING] * players
+
+    def update(self, a: int, b: int, score: float):
+        """Record a game where `a` scored `score` (1, 1/2 or 0) against `b`."""
+        expected = 1 / (1 + 10 ** ((self.ratings[b] - self.ratings[a]) / 400))
+        self.ratings[a] += self.k * (score - expected)
+        self.ratings[b] -= self.k * (score - expected)
+
+
+class GlickoRatings:
+    """Glicko-1 ratings and rating deviations, updated once per rating period of games."""
+
+    def __init__(self, players: int, drift: float = DEVIATION_DRIFT):
+        self.drift = drift
+        self.ratings = [INITIAL_RATING] * players
+        self.deviations = [INITIAL_DEVIATION] * players
+
+    @staticmethod
+    def _g(deviation: float) -> float:
+        return 1 / math.sqrt(1 + 3 * (_GLICKO_Q * deviation) ** 2 / math.pi ** 2)
+
+    def update_period(self, results: Sequence[Tuple[int, int, float]]):
+        """Rate a period of (a, b, score of a) games against the ratings at its start."""
+        games: Dict[int, List[Tuple[int, float]]] = {}
+        for a, b, score in results:
+            games.setdefault(a, []).append((b, score))
+            games.setdefault(b, []).append((a, 1 - score))
+        ratings, deviations = list(self.ratings), list(self.deviations)
+        for player in range(len(ratings)):
+            deviation = min(math.hypot(deviations[player], self.drift), INITIAL_DEVIATION)
+            if player not in games:
+                self.deviations[player] = deviation
+                continue
+            variance_inverse = 0.0
+            improvement = 0.0
+            for opponent, score in games[player]:
+                g = self._g(deviations[opponent])
+                expected = 1 / (1 + 10 ** (-g * (ratings[player] - ratings[opponent]) / 400))
+                variance_inverse += _GLICKO_Q ** 2 * g * g * expected * (1 - expected)
+                improvement += g * (score - expected)
+            precision = 1 / deviation ** 2 + variance_inverse
+            self.ratings[player] = ratings[player] + _GLICKO_Q / precision * improvement
+            self.deviations[player] = math.sqrt(1 / precision)
+
+
+@dataclass
+class Standing:
+    name: str
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.losses + self.draws
+
+    @property
+    def score(self) -> float:
+        return (self.wins + 0.5 * self.draws) / self.games if self.games else 0.0
+
+
+class Tournament:
+    """Round robin between policies over a pool of team templates, played by worker processes.
+
+    Games are handed out in chunks of `chunk_games`, and results come back in schedule
+    order while later chunks are still playing: standings and Elo update per game, Glicko
+    once per chunk (its rating period). Every game is seeded from (seed, pairing, round),
+    so the same settings give the same results and ratings whatever the worker count.
+    """
+
+    def __init__(self, entrants: Sequence[str], templates: Sequence[TeamTemplate],
+                 battle_mode: BattleMode = BattleMode.SINGLE, games_per_pair: int = 100, max_turns: int = 200,
+                 seed: int = 0, workers: int = 1, chunk_games: int = 20):
+        if len(set(entrants)) != len(entrants) or len(entrants) < 2:
+            raise ValueError("A tournament needs at least two distinct entrants")
+        for name in entrants:
+            entrant_factory(name)
+        self.entrants = list(entrants)
+        self.templates = list(templates)
+        self.battle_mode = battle_mode
+        self.max_turns = max_turns
+        self.seed = seed
+        self.workers = workers
+        self.chunk_games = chunk_games
+        self.games = schedule(len(entrants), len(self.templates), games_per_pair, seed)
+        self.standings = [Standing(name) for name in entrants]
+        # head_to_head[a][b]: score of a against b
+        self.head_to_head = [[Standing(name) for name in entrants] for _ in entrants]
+        self.elo = EloRatings(len(entrants))
+        self.glicko = GlickoRatings(len(entrants))
+        self.played = 0
+
+    def _record(self, results: Sequence[Tuple[Game, int]]):
+        period = []
+        for game, result in results:
+            score = (result + 1) / 2
+            for player, opponent, outcome in ((game.first, game.second, result), (game.second, game.first, -result)):
+                for standing in (self.standings[player], self.head_to_head[player][opponent]):
+                    if outcome > 0:
+                        standing.wins += 1
+                    elif outcome < 0:
+                        standing.losses += 1
+                    else:
+                        standing.draws += 1
+            self.elo.update(game.first, game.second, score)
+            period.append((game.first, game.second, score))
+        self.glicko.update_period(period)
+        self.played += len(results)
+
+    def run(self, on_progress: Optional[Callable[["Tournament"], None]] = None, progress_interval: float = 5.0):
+        """Play every scheduled game; `on_progress(self)` is called at most every `progress_interval` seconds."""
+        chunks = [self.games[i:i + self.chunk_games] for i in range(self.played, len(self.games), self.chunk_games)]
+        initargs = (self.entrants, self.templates, self.battle_mode, self.max_turns, self.seed)
+        last_report = time.monotonic()
+
+        def consume(results):
+            nonlocal last_report
+            self._record(results)
+            if on_progress is not None and time.monotonic() - last_report >= progress_interval:
+                on_progress(self)
+                last_report = time.monotonic()
+
+        if self.workers <= 1:
+            _init_worker(*initargs)
+            for chunk in chunks:
+                consume(_play_games(chunk))
+        else:
+            with mp.Pool(self.workers, initializer=_init_worker, initargs=initargs) as pool:
+                for results in pool.imap(_play_games, chunks):
+                    consume(results)
+
+    def ranking(self) -> List[int]:
+        """Entrant indices by Glicko rating, best first."""
+        return sorted(range(len(self.entrants)), key=lambda i: -self.glicko.ratings[i])
+
+    def table(self) -> str:
+        width = max(len(name) for name in self.entrants)
+        lines = [f"{'entrant':<{width}}  games    W    D    L  score     Elo   Glicko (95%)"]
+        for i in self.ranking():
+            s = self.standings[i]
+            lines.append(f"{s.name:<{width}}  {s.games:5d} {s.wins:4d} {s.draws:4d} {s.losses:4d} {s.score:6.1%} "
+                         f"{self.elo.ratings[i]:7.0f}   {self.glicko.ratings[i]:.0f} ± {2 * self.glicko.deviations[i]:.0f}")
+        lines.append("")
+        lines.append(f"{'score vs':<{width}}  " + "  ".join(f"{name[:8]:>8}" for name in self.entrants))
+        for i, name in enumerate(self.entrants):
+            cells = ["" if i == j else f"{self.head_to_head[i][j].score:.1%}" for j in range(len(self.entrants))]
+            lines.append(f"{name:<{width}}  " + "  ".join(f"{cell:>8}" for cell in cells))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank policies with a parallel round-robin tournament.")
+    parser.add_argument("entrants", nargs="*", default=DEFAULT_ENTRANTS,
+                        help=f"Entrants: {', '.join(ENTRANTS)}, neural:<weight file> or params:<parameter file> "
+                             f"(adversary-endgame solves each new 1v1 endgame exactly, about 1 s apiece)")
+    parser.add_argument("--games", type=int, default=200, help="Games per pair of entrants")
+    parser.add_argument("--teams", type=int, default=32, help="Random team templates (0: the default teams)")
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-games", type=int, default=20)
+    parser.add_argument("--max-turns", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        tournament = Tournament(args.entrants, template_pool(args.teams, seed=args.seed), BattleMode(args.mode),
+                                args.games, args.max_turns, args.seed, args.workers, args.chunk_games)
+    except ValueError as e:
+        parser.error(str(e))
+    started = time.perf_counter()
+
+    def progress(t: Tournament):
+        leader = t.ranking()[0]
+        print(f"{t.played}/{len(t.games)} games, {t.played / (time.perf_counter() - started):.0f}/s, "
+              f"leader {t.entrants[leader]} ({t.glicko.ratings[leader]:.0f})")
+
+    tournament.run(progress)
+    elapsed = time.perf_counter() - started
+    print(f"{len(tournament.games)} games in {elapsed:.1f} s ({len(tournament.games) / elapsed:.0f}/s) "
+          f"with {args.workers} workers")
+    print(tournament.table())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+from dataclasses import asdict, fields
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import os
+import json
+import time
+import random
+import argparse
+import functools
+import multiprocessing as mp
+import numpy as np
+
+from pokemon_battle import Battle, BattleMode, TeamTemplate
+from pokemon_adversary import Adversary, AdversaryParams, DEFAULT_PARAMS
+from pokemon_cache import engine_fingerprint
+from pokemon_selfplay import battle_rng, play_battle
+from pokemon_tournament import entrant_factory, template_pool
+
+# Search range of every tuned AdversaryParams field
+PARAMETERS = {
+    "switch_hp_fraction": (0.0, 0.6),
+    "advantage_switch_chance": (0.0, 1.0),
+    "advantage_threshold": (0.5, 2.0),
+    "power_exponent": (0.0, 2.0),
+    "effectiveness_exponent": (0.25, 3.0),
+    "accuracy_exponent": (0.0, 3.0),
+    "stab_bonus": (1.0, 2.0),
+    "ko_bonus": (0.0, 3.0),
+}
+# Fields only joint double-battle scoring reads; tuning them in any other mode searches dead dimensions
+JOINT_ONLY = ("ko_bonus",)
+DEFAULT_OPPONENTS = ["adversary", "random"]
+STATE_VERSION = 1
+# Decimals parameter values are rounded to, so that evaluations can be cached by value
+PRECISION = 4
+
+
+def tuned_parameters(joint: bool = False) -> Dict[str, Tuple[float, float]]:
+    """The PARAMETERS entries an Adversary with or without joint double-battle scoring reads."""
+    return {name: bounds for name, bounds in PARAMETERS.items() if joint or name not in JOINT_ONLY}
+
+
+def to_vector(params: AdversaryParams, parameters: Dict[str, Tuple[float, float]] = PARAMETERS) -> np.ndarray:
+    """Tuned fields of `params`, scaled from their `parameters` range to [0, 1]."""
+    return np.array([(getattr(params, name) - low) / (high - low) for name, (low, high) in parameters.items()])
+
+
+def from_vector(vector: Sequence[float], parameters: Dict[str, Tuple[float, float]] = PARAMETERS) -> AdversaryParams:
+    """AdversaryParams for a vector in [0, 1] (clipped), with values rounded to PRECISION decimals.
+
+    Fields missing from `parameters` keep their defaults.
+    """
+    values = {}
+    for (name, (low, high)), x in zip(parameters.items(), np.clip(vector, 0.0, 1.0)):
+        values[name] = round(low + float(x) * (high - low), PRECISION)
+    return AdversaryParams(**values)
+
+
+def params_key(params: AdversaryParams) -> str:
+    return json.dumps([getattr(params, field.name) for field in fields(AdversaryParams)])
+
+
+def load_params(path: str) -> AdversaryParams:
+    """AdversaryParams from a JSON file written by the tuner (or any {"params": {field: value}} file)."""
+    with open(path) as f:
+        data = json.load(f)
+    return AdversaryParams(**data.get("params", data))
+
+
+def tuned_policy(path: str) -> Callable:
+    """Adversary factory with the parameters of a tuner output file, and joint scoring if they were tuned for it."""
+    with open(path) as f:
+        joint = json.load(f).get("joint", False)
+    return functools.partial(Adversary, params=load_params(path), joint=joint)
+
+
+def evaluation_games(opponents: int, teams: int, games_per_opponent: int, seed: int) -> List[Tuple[int, int, int, int, bool]]:
+    """The games every candidate plays: (opponent, candidate team, opponent team, battle seed, candidate is player).
+
+    Games come in pairs that share teams and seed and swap sides, and every candidate
+    plays the same games (common random numbers), so score differences between
+    candidates come from their parameters rather than from the draw of games.
+    """
+    games = []
+    for opponent in range(opponents):
+        for pair in range((games_per_opponent + 1) // 2):
+            rng = random.Random(f"{seed}:{opponent}:{pair}")
+            team_a, team_b = rng.randrange(teams), rng.randrange(teams)
+            battle_seed = opponent * games_per_opponent + pair
+            games.append((opponent, team_a, team_b, battle_seed, True))
+            games.append((opponent, team_a, team_b, battle_seed, False))
+    return games
+
+
+# Per-process evaluation settings, set by _init_worker
+_worker = {}
+
+
+def _init_worker(opponent_names: Sequence[str], templates: Sequence[TeamTemplate], battle_mode: BattleMode,
+                 max_turns: int, seed: int, joint: bool):
+    _worker.update(opponents=[entrant_factory(name) for name in opponent_names], templates=list(templates),
+                   battle_mode=battle_mode, max_turns=max_turns, seed=seed, joint=joint)
+
+
+def _play_games(task: Tuple[int, AdversaryParams, Sequence[tuple]]) -> Tuple[int, float, int]:
+    """Score (1 win, 1/2 draw) of one candidate over a chunk of its games: (candidate, total score, games)."""
+    candidate, params, games = task
+    battle_mode = _worker["battle_mode"]
+    tuned = functools.partial(Adversary, params=params, joint=_worker["joint"])
+    total = 0.0
+    for opponent, first_team, second_team, battle_seed, candidate_first in games:
+        rng = battle_rng(_worker["seed"], battle_seed)
+        player = _worker["templates"][first_team].instantiate(battle_mode)
+        other = _worker["templates"][second_team].instantiate(battle_mode)
+        battle = Battle(player, other, verbose=False, rng=rng)
+        first, second = (tuned, _worker["opponents"][opponent]) if candidate_first else \
+            (_worker["opponents"][opponent], tuned)
+        result = play_battle(battle, first(player, battle_mode, rng=rng), second(other, battle_mode, rng=rng),
+                             _worker["max_turns"])
+        total += (result if candidate_first else -result) / 2 + 0.5
+    return candidate, total, len(games)
+
+
+class Evaluator:
+    """Scores AdversaryParams by the mean score of their games against benchmark opponents.
+
+    Candidates play with joint double-battle scoring if `joint` is set. They are
+    spread over a pool of worker processes in chunks of `chunk_games`; the pool is
+    created on first use and kept until close().
+    """
+
+    def __init__(self, opponents: Sequence[str], templates: Sequence[TeamTemplate], battle_mode: BattleMode,
+                 games_per_opponent: int, max_turns: int = 200, seed: int = 0, workers: int = 1,
+                 chunk_games: int = 20, joint: bool = False):
+        if joint and battle_mode != BattleMode.DOUBLE:
+            raise ValueError("Joint scoring only applies to double battles")
+        for name in opponents:
+            entrant_factory(name)
+        self.joint = joint
+        self.games = evaluation_games(len(opponents), len(templates), games_per_opponent, seed)
+        self.initargs = (list(opponents), list(templates), battle_mode, max_turns, seed, joint)
+        self.workers = workers
+        self.chunk_games = chunk_games
+        self._pool = None
+
+    def evaluate(self, candidates: Sequence[AdversaryParams],
+                 on_result: Optional[Callable[[int, float], None]] = None) -> List[float]:
+        """Scores of `candidates`; on_result(index, score) is called as each one completes."""
+        chunks = [self.games[i:i + self.chunk_games] for i in range(0, len(self.games), self.chunk_games)]
+        tasks = [(index, params, chunk) for index, params in enumerate(candidates) for chunk in chunks]
+        if self.workers <= 1:
+            _init_worker(*self.initargs)
+            results = map(_play_games, tasks)
+        else:
+            if self._pool is None:
+                self._pool = mp.Pool(self.workers, initializer=_init_worker, initargs=self.initargs)
+            results = self._pool.imap_unordered(_play_games, tasks)
+        totals = [0.0] * len(candidates)
+        played = [0] * len(candidates)
+        for index, total, games in results:
+            totals[index] += total
+            played[index] += games
+            if played[index] == len(self.games) and on_result is not None:
+                on_result(index, totals[index] / played[index])
+        return [total / len(self.games) for total in totals]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class CrossEntropyTuner:
+    """Cross-entropy method over AdversaryParams, with a diagonal Gaussian on the scaled parameters.
+
+    Only the fields the evaluator's Adversaries read are searched (see tuned_parameters).
+
+    Each generation samples `population` candidates (plus the current mean), scores
+    them with the evaluator, and moves the mean and deviation towards the best
+    `elite_fraction` by `smoothing`. Generation g samples from a generator seeded with
+    (seed, g), and every score is cached by parameter value in the state, which is
+    saved to `state_path` after every candidate: an interrupted run resumes with the
+    same samples and skips everything already evaluated.
+    """
+
+    def __init__(self, evaluator: Evaluator, config: dict, state_path: Optional[str] = None,
+                 population: int = 16, elite_fraction: float = 0.25, smoothing: float = 0.7,
+                 initial_std: float = 0.2, min_std: float = 0.02, seed: int = 0):
+        self.evaluator = evaluator
+        self.state_path = state_path
+        self.population = population
+        self.elites = max(1, int(round(population * elite_fraction)))
+        self.smoothing = smoothing
+        self.min_std = min_std
+        self.seed = seed
+        self.parameters = tuned_parameters(evaluator.joint)
+        self.config = dict(config, version=STATE_VERSION, parameters=self.parameters, population=population,
+                           elite_fraction=elite_fraction, smoothing=smoothing, initial_std=initial_std,
+                           min_std=min_std, seed=seed)
+        # JSON round trip, so the config compares equal to one read back from a state file
+        self.config = json.loads(json.dumps(self.config))
+        self.generation = 0
+        self.mean = to_vector(DEFAULT_PARAMS, self.parameters)
+        self.std = np.full(len(self.parameters), initial_std)
+        self.history: List[dict] = []
+        self.evaluations: Dict[str, float] = {}
+        if state_path is not None and os.path.exists(state_path):
+            self._load()
+
+    def _load(self):
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if state["config"] != self.config:
+            changed = sorted(key for key in set(state["config"]) | set(self.config)
+                             if state["config"].get(key) != self.config.get(key))
+            raise ValueError(f"{self.state_path} was written with different settings ({', '.join(changed)}); "
+                             f"use a new state file")
+        self.generation = state["generation"]
+        self.mean = np.array(state["mean"])
+        self.std = np.array(state["std"])
+        self.history = state["history"]
+        self.evaluations = state["evaluations"]
+
+    def save(self):
+        if self.state_path is None:
+            return
+        state = {"config": self.config, "generation": self.generation, "mean": self.mean.tolist(),
+                 "std": self.std.tolist(), "history": self.history, "evaluations": self.evaluations}
+        temporary = self.state_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary, self.state_path)
+
+    def sample(self) -> List[AdversaryParams]:
+        """This generation's candidates: the current mean followed by `population` samples."""
+        rng = np.random.default_rng([self.seed, self.generation])
+        vectors = [self.mean] + list(np.clip(rng.normal(self.mean, self.std, (self.population, len(self.mean))), 0, 1))
+        return [from_vector(vector, self.parameters) for vector in vectors]
+
+    def step(self) -> dict:
+        """Run one generation; returns its history entry."""
+        candidates = self.sample()
+        keys = [params_key(params) for params in candidates]
+        # First candidate with each uncached value
+        pending = list({key: i for i, key in reversed(list(enumerate(keys))) if key not in self.evaluations}.values())
+
+        def record(index: int, score: float):
+            self.evaluations[keys[pending[index]]] = score
+            self.save()
+
+        self.evaluator.evaluate([candidates[i] for i in pending], record)
+        scores = np.array([self.evaluations[key] for key in keys])
+        # The mean is scored for reporting only; the update uses the samples
+        order = np.argsort(-scores[1:], kind="stable")[:self.elites] + 1
+        elite = np.array([to_vector(candidates[i], self.parameters) for i in order])
+        self.mean = self.smoothing * elite.mean(axis=0) + (1 - self.smoothing) * self.mean
+        self.std = np.maximum(self.smoothing * elite.std(axis=0) + (1 - self.smoothing) * self.std, self.min_std)
+        best = int(np.argmax(scores))
+        entry = {"generation": self.generation, "mean_score": float(scores[0]),
+                 "best_score": float(scores[best]), "best": asdict(candidates[best]),
+                 "evaluated": len(pending)}
+        self.history.append(entry)
+        self.generation += 1
+        self.save()
+        return entry
+
+    def best(self) -> Tuple[AdversaryParams, float]:
+        """The best-scoring parameters evaluated so far, and their score."""
+        key = max(self.evaluations, key=self.evaluations.get)
+        values = json.loads(key)
+        return AdversaryParams(*values), self.evaluations[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the rule-based Adversary's heuristic constants with the "
+                                                 "cross-entropy method over parallel simulated battles.")
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--population", type=int, default=16)
+    parser.add_argument("--elite-fraction", type=float, default=0.25)
+    parser.add_argument("--smoothing", type=float, default=0.7)
+    parser.add_argument("--opponents", nargs="+", default=DEFAULT_OPPONENTS,
+                        help="Benchmark entrants (see pokemon_tournament)")
+    parser.add_argument("--games", type=int, default=100, help="Games per candidate against each opponent")
+    parser.add_argument("--holdout-games", type=int, default=400,
+                        help="Games per opponent comparing the result with the defaults on unseen teams")
+    parser.add_argument("--teams", type=int, default=32, help="Random team templates")
+    parser.add_argument("--mode", choices=["single", "double"], default="single")
+    parser.add_argument("--joint", action="store_true",
+                        help="Tune the Adversary with joint double-battle scoring (requires --mode double)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-games", type=int, default=20)
+    parser.add_argument("--max-turns", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--state", default="tuner_state.json", help="State file to save progress to and resume from")
+    parser.add_argument("--output", default="adversary_params.json")
+    args = parser.parse_args()
+
+    battle_mode = BattleMode(args.mode)
+    config = {"engine": engine_fingerprint(), "opponents": args.opponents, "games": args.games, "teams": args.teams,
+              "mode": args.mode, "joint": args.joint, "max_turns": args.max_turns}
+    try:
+        evaluator = Evaluator(args.opponents, template_pool(args.teams, seed=args.seed), battle_mode, args.games,
+                              args.max_turns, args.seed, args.workers, args.chunk_games, args.joint)
+        tuner = CrossEntropyTuner(evaluator, config, args.state, args.population, args.elite_fraction,
+                                  args.smoothing, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    if tuner.generation:
+        print(f"Resuming {args.state} at generation {tuner.generation} "
+              f"({len(tuner.evaluations)} cached evaluations)")
+
+    try:
+        while tuner.generation < args.generations:
+            started = time.perf_counter()
+            entry = tuner.step()
+            print(f"generation {entry['generation']}: mean {entry['mean_score']:.3f}, "
+                  f"best {entry['best_score']:.3f}, {entry['evaluated']} evaluated "
+                  f"in {time.perf_counter() - started:.1f} s")
+        best, score = tuner.best()
+    finally:
+        evaluator.close()
+    print(f"Best: {score:.3f} {asdict(best)}")
+
+    # Fresh teams and seeds, so the comparison is free of the selection on the training games
+    holdout = Evaluator(args.opponents, template_pool(args.teams, seed=args.seed + 1), battle_mode,
+                        args.holdout_games, args.max_turns, args.seed + 1, args.workers, args.chunk_games, args.joint)
+    try:
+        best_score, default_score = holdout.evaluate([best, DEFAULT_PARAMS])
+    finally:
+        holdout.close()
+    print(f"Held out: tuned {best_score:.3f}, defaults {default_score:.3f}")
+    with open(args.output, "w") as f:
+        json.dump({"params": asdict(best), "joint": args.joint, "score": score, "holdout_score": best_score,
+                   "default_holdout_score": default_score, "config": tuner.config}, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+from typing import Optional, List, Tuple
+import hashlib
+import numpy as np
+
+from pokemon_battle import Pokemon, Team, Battle
+
+TEAM_SIZE = 6
+HP_BUCKETS = 16
+STAT_NAMES = ["attack", "defense", "special_attack", "special_defense", "speed", "accuracy", "evasion"]
+STATUS_NAMES = [None, "burn", "freeze", "paralysis", "poison", "bad-poison", "sleep", "confusion"]
+MASK_64 = (1 << 64) - 1
+# Multiplier used to give the two teams different roles in a position key
+_ROLE_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def _random_keys(rng: np.random.Generator, *shape) -> list:
+    return rng.integers(0, 2**64, size=shape, dtype=np.uint64).tolist()
+
+
+# Fixed keys, identical in every process, indexed by team slot first
+_rng = np.random.default_rng(0x5EED_2B0B)
+HP_KEYS = _random_keys(_rng, TEAM_SIZE, HP_BUCKETS + 1)
+STAGE_KEYS = _random_keys(_rng, TEAM_SIZE, len(STAT_NAMES), 13)
+STATUS_KEYS = _random_keys(_rng, TEAM_SIZE, len(STATUS_NAMES))
+ACTIVE_KEYS = _random_keys(_rng, 2, TEAM_SIZE)
+STAT_INDEX = {name: i for i, name in enumerate(STAT_NAMES)}
+STATUS_INDEX = {name: i for i, name in enumerate(STATUS_NAMES)}
+
+
+def stable_hash(text: str) -> int:
+    """64-bit hash of a string that, unlike hash(), is the same in every process."""
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def hp_bucket_for(current_hp: float, max_hp: float) -> int:
+    """0 when fainted, otherwise 1..HP_BUCKETS by remaining HP fraction."""
+    if current_hp <= 0:
+        return 0
+    return min(HP_BUCKETS, int(-(-current_hp * HP_BUCKETS // max_hp)))
+
+
+def hp_bucket(pokemon: Pokemon) -> int:
+    return hp_bucket_for(pokemon.current_hp, pokemon.hp)
+
+
+def _status_key(slot: int, status: Optional[str]) -> int:
+    index = STATUS_INDEX.get(status)
+    if index is None:
+        return stable_hash(f"status:{slot}:{status}")
+    return STATUS_KEYS[slot][index]
+
+
+def identity_key(slot: int, pokemon: Pokemon) -> int:
+    """Key for the parts of a slot that never change in battle: species, level and moveset."""
+    moves = ",".join(move.name for move in pokemon.moves)
+    return stable_hash(f"{slot}:{pokemon.name}:{pokemon.level}:{moves}")
+
+
+class TeamHashTracker:
+    """Zobrist hash of one team, kept current by hooks in Pokemon and Team.
+
+    The hash covers each slot's species/level/moveset, HP bucket, stat stages and status,
+    plus the active indices. Pokemon.take_damage/heal/change_stat_stage/set_status and
+    Team.switch_pokemon call back into the tracker, which updates the hash with a couple
+    of XORs. Code that mutates state directly (assigning current_hp or
+    active_pokemon_indices) must call refresh().
+    """
+
+    def __init__(self, team: Team):
+        self.team = team
+        self.value = 0
+        team.hash_tracker = self
+        for slot, pokemon in enumerate(team.pokemon):
+            pokemon.hash_tracker = (self, slot)
+        self.refresh()
+
+    def refresh(self) -> int:
+        """Recompute the hash from scratch."""
+        self.value = compute_team_hash(self.team)
+        return self.value
+
+    def hp_changed(self, slot: int, pokemon: Pokemon, old_hp: float):
+        old_bucket = hp_bucket_for(old_hp, pokemon.hp)
+        new_bucket = hp_bucket(pokemon)
+        if old_bucket != new_bucket:
+            keys = HP_KEYS[slot]
+            self.value ^= keys[old_bucket] ^ keys[new_bucket]
+
+    def stage_changed(self, slot: int, stat: str, old_stage: int, new_stage: int):
+        keys = STAGE_KEYS[slot][STAT_INDEX[stat]]
+        self.value ^= keys[old_stage + 6] ^ keys[new_stage + 6]
+
+    def status_changed(self, slot: int, old_status: Optional[str], new_status: Optional[str]):
+        self.value ^= _status_key(slot, old_status) ^ _status_key(slot, new_status)
+
+    def active_changed(self, position: int, old_index: int, new_index: int):
+        keys = ACTIVE_KEYS[position]
+        self.value ^= keys[old_index] ^ keys[new_index]
+
+
+def compute_team_hash(team: Team) -> int:
+    """Full (non-incremental) Zobrist hash of a team."""
+    value = 0
+    for slot, pokemon in enumerate(team.pokemon):
+        value ^= identity_key(slot, pokemon)
+        value ^= HP_KEYS[slot][hp_bucket(pokemon)]
+        for stat, stage in pokemon.stat_stages.items():
+            value ^= STAGE_KEYS[slot][STAT_INDEX[stat]][stage + 6]
+        value ^= _status_key(slot, pokemon.status)
+    for position, index in enumerate(team.active_pokemon_indices):
+        value ^= ACTIVE_KEYS[position][index]
+    return value
+
+
+def team_hash(team: Team) -> int:
+    """Current hash of a team, attaching an incremental tracker on first use."""
+    tracker = team.hash_tracker
+    if tracker is None:
+        tracker = TeamHashTracker(team)
+    return tracker.value
+
+
+def position_key(own_team: Team, other_team: Team) -> int:
+    """Hash of a position as seen by `own_team`; swapping the teams gives a different key."""
+    return team_hash(own_team) ^ ((team_hash(other_team) * _ROLE_MULTIPLIER) & MASK_64)
+
+
+def battle_hash(battle: Battle) -> int:
+    """Hash of a battle position from the player's side."""
+    return position_key(battle.player_team, battle.opponent_team)
+
+
+class TranspositionTable:
+    """Fixed-size hash table from position keys to cached decisions or search values.
+
+    Entries live in a power-of-two array indexed by the low bits of the key. A colliding
+    store replaces the existing entry unless that entry holds the same key searched
+    deeper, so memory stays bounded and deeper results are kept.
+    """
+
+    def __init__(self, size_bits: int = 16):
+        self.size = 1 << size_bits
+        self._mask = self.size - 1
+        self._keys: List[Optional[int]] = [None] * self.size
+        self._entries: List[Optional[Tuple[int, object]]] = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def lookup(self, key: int, min_depth: int = 0):
+        """Return the value stored for `key` with at least `min_depth`, or None."""
+        index = key & self._mask
+        if self._keys[index] == key:
+            depth, value = self._entries[index]
+            if depth >= min_depth:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def store(self, key: int, value, depth: int = 0):
+        """Store a value for `key`, computed with search depth `depth`."""
+        index = key & self._mask
+        if self._keys[index] == key and self._entries[index][0] > depth:
+            return
+        self._keys[index] = key
+        self._entries[index] = (depth, value)
+        self.stores += 1
+
+    def clear(self):
+        self._keys = [None] * self.size
+        self._entries = [None] * self.size
+
+    def __len__(self) -> int:
+        return sum(key is not None for key in self._keys)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -15,13 +15,16 @@ project_root = os.path.dirname(src_dir)  # project root
 sys.path.insert(0, project_root)
 
 try:
-    from pokemon_battle import Pokemon, Team, Battle, BattleMode, POKEMON_DATA
+    from pokemon_battle import (TeamTemplate, TeamPool, Battle, BattleMode, POKEMON_DATA, DEFAULT_PLAYER_TEAM,
+                                DEFAULT_OPPONENT_TEAM)
+    from pokemon_search import species_index
 except ImportError as e:
     print(f"Error importing pokemon_battle: {e}")
     sys.exit(1)
 
 class PokemonBattleGUI:
-    def __init__(self):
+    def __init__(self, species=None):
+        """Create the window and load sprites (only for `species`, if given, instead of every Pokémon)."""
         try:
             # Initialize Pygame
             pygame.init()
@@ -38,13 +41,19 @@ class PokemonBattleGUI:
             # Initialize Pokémon data
             self.pokemon_data = POKEMON_DATA
             self.pokemon_list = sorted(self.pokemon_data.keys())
+            self.species_index = species_index(playable=True)
             
             # Initialize battle state
             self.battle = None
             self.player_team = None
             self.opponent_team = None
+            self.team_names = None  # (player, opponent) species of the current team templates
+            self.team_templates = None  # (player, opponent) TeamTemplates, rebuilt when the selection changes
+            self.team_pools = {}  # BattleMode -> (player, opponent) TeamPools for the current templates
+            self.active_pools = None  # pools the current battle's teams came from
             self.battle_mode = "single"
             self.selected_pokemon = [""] * 12  # 6 for player, 6 for opponent
+            self.suggestions = []  # autocomplete for the active input box, best first
             self.current_view = "team_selection"  # or "battle"
             
             # Battle timing
@@ -56,7 +65,7 @@ class PokemonBattleGUI:
             self.small_font = pygame.font.Font(None, 24)
             
             # Load sprites
-            self.load_sprites()
+            self.load_sprites(species)
             
             # Initialize battle log
             self.battle_log = []
@@ -94,8 +103,8 @@ class PokemonBattleGUI:
             rect = pygame.Rect(x, y, box_width, box_height)
             self.input_rects.append(rect)
 
-    def load_sprites(self):
-        """Load all Pokémon sprites."""
+    def load_sprites(self, species=None):
+        """Load the sprites of `species` (all Pokémon by default)."""
         self.sprites = {}
         sprite_dirs = {
             "front": os.path.join(src_dir, "setup", "data-collection", "sprites", "front"),
@@ -134,7 +143,7 @@ class PokemonBattleGUI:
                     print(f"Error loading fallback sprite: {e}")
             
             # Now load all Pokémon sprites
-            for pokemon in self.pokemon_list:
+            for pokemon in (self.pokemon_list if species is None else sorted(set(species))):
                 sprite_path = os.path.join(dir_path, f"{pokemon.lower().replace(' ', '-')}.png")
                 if os.path.exists(sprite_path):
                     try:
@@ -184,9 +193,12 @@ class PokemonBattleGUI:
             
             # Draw availability indicator
             pokemon_name = self.selected_pokemon[i].lower()
-            if pokemon_name in self.pokemon_data:
+            if pokemon_name in self.species_index:
                 # Green circle for available Pokémon
                 pygame.draw.circle(self.screen, (0, 255, 0), (rect.right + 20, rect.centery), 10)
+            elif pokemon_name and self.species_index.resolve(pokemon_name):
+                # Yellow circle for text that will be completed to a Pokémon
+                pygame.draw.circle(self.screen, (255, 200, 0), (rect.right + 20, rect.centery), 10)
             elif pokemon_name:  # Only show red if there's text
                 # Red circle for unavailable Pokémon
                 pygame.draw.circle(self.screen, (255, 0, 0), (rect.right + 20, rect.centery), 10)
@@ -197,7 +209,8 @@ class PokemonBattleGUI:
         self.screen.blit(start_text, (self.width//2 - start_text.get_width()//2, 510))
         
         # Draw instructions
-        instructions = self.small_font.render("Click a box to type, press ENTER when done", True, (100, 100, 100))
+        instructions = self.small_font.render("Click a box to type, TAB or ENTER to take the first suggestion "
+                                              "(empty boxes use the default team)", True, (100, 100, 100))
         self.screen.blit(instructions, (20, 550))
         
         # Draw all text last to ensure visibility
@@ -215,6 +228,13 @@ class PokemonBattleGUI:
                                (cursor_x, cursor_y), 
                                (cursor_x, cursor_y + 20), 2)
         
+        # Draw the suggestions over everything below the active box
+        for rect, name in self.suggestion_rects():
+            pygame.draw.rect(self.screen, (240, 240, 255), rect)
+            pygame.draw.rect(self.screen, (150, 150, 200), rect, 1)
+            text = self.small_font.render(name, True, (0, 0, 0))
+            self.screen.blit(text, text.get_rect(midleft=(rect.x + 10, rect.centery)))
+        
         # Force redraw
         pygame.display.flip()
 
@@ -306,6 +326,14 @@ class PokemonBattleGUI:
         if event.type == pygame.MOUSEBUTTONDOWN:
             x, y = event.pos
             
+            # A click on a suggestion fills the active box with it
+            for rect, name in self.suggestion_rects():
+                if rect.collidepoint(x, y):
+                    self.selected_pokemon[self.active_input] = name
+                    self.active_input = None
+                    self.update_suggestions()
+                    return
+            
             # Check if Start Battle button was clicked
             if 500 <= y <= 550 and self.width//2 - 100 <= x <= self.width//2 + 100:
                 self.start_battle()
@@ -319,6 +347,7 @@ class PokemonBattleGUI:
             else:
                 self.active_input = None
                 self.needs_redraw = True
+            self.update_suggestions()
             
             # Handle battle mode toggle
             if 60 <= y <= 90 and 20 <= x <= 200:
@@ -327,16 +356,60 @@ class PokemonBattleGUI:
         
         elif event.type == pygame.KEYDOWN:
             if self.active_input is not None:
-                if event.key == pygame.K_RETURN:
-                    self.active_input = None
+                if event.key in (pygame.K_RETURN, pygame.K_TAB):
+                    # Take the first suggestion unless the text already names a Pokémon
+                    text = self.selected_pokemon[self.active_input]
+                    if self.suggestions and text.lower() not in self.species_index:
+                        self.selected_pokemon[self.active_input] = self.suggestions[0]
+                    # TAB moves on to the next box
+                    if event.key == pygame.K_TAB and self.active_input + 1 < len(self.input_rects):
+                        self.active_input += 1
+                    else:
+                        self.active_input = None
                 elif event.key == pygame.K_BACKSPACE:
                     self.selected_pokemon[self.active_input] = self.selected_pokemon[self.active_input][:-1]
                 else:
-                    # Only allow letters, numbers, and spaces
-                    if event.unicode.isalnum() or event.unicode.isspace():
+                    # Only allow letters, numbers, spaces and hyphens
+                    if event.unicode.isalnum() or event.unicode.isspace() or event.unicode == "-":
                         self.selected_pokemon[self.active_input] += event.unicode
+                self.update_suggestions()
                 self.needs_redraw = True
 
+    def update_suggestions(self):
+        """Autocomplete the active input box (a few hundred microseconds per keystroke)."""
+        if self.active_input is None:
+            self.suggestions = []
+        else:
+            self.suggestions = self.species_index.complete(self.selected_pokemon[self.active_input], 5)
+
+    def suggestion_rects(self):
+        """(rect, name) of each suggestion, listed below the active input box."""
+        if self.active_input is None:
+            return []
+        box = self.input_rects[self.active_input]
+        return [(pygame.Rect(box.x, box.bottom + k * 26, box.width, 26), name)
+                for k, name in enumerate(self.suggestions)]
+
+    def selected_team_names(self, side):
+        """Species for one side (0 player, 1 opponent) from its input boxes, or None if a name is unknown.
+
+        Text is resolved through the species index, so partial or misspelled names are
+        accepted; empty boxes are filled from the default team.
+        """
+        defaults = DEFAULT_PLAYER_TEAM if side == 0 else DEFAULT_OPPONENT_TEAM
+        names = []
+        for text in self.selected_pokemon[6 * side:6 * side + 6]:
+            if text.strip():
+                name = self.species_index.resolve(text)
+                if name is None:
+                    self.log_message(f"Error: no Pokémon matches '{text}'")
+                    return None
+                names.append(name)
+            else:
+                names.append(None)
+        spare = iter(name for name in defaults if name not in names)
+        return [name if name is not None else next(spare) for name in names]
+
     def start_battle(self):
         """Start a new battle with the selected teams."""
         try:
@@ -347,59 +420,41 @@ class PokemonBattleGUI:
             mode = BattleMode.DOUBLE if self.battle_mode == "double" else BattleMode.SINGLE
             self.log_message(f"Battle mode: {mode.value}")
             
-            # Create teams
-            player_pokemon = []
-            opponent_pokemon = []
-            
-            # Set default Pokémon for player team
-            default_player_pokemon = [
-                "charizard",
-                "blastoise",
-                "venusaur",
-                "pikachu",
-                "snorlax",
-                "gyarados"
-            ]
-            
-            # Set default Pokémon for opponent team
-            default_opponent_pokemon = [
-                "tyranitar",
-                "metagross",
-                "salamence",
-                "garchomp",
-                "dragonite",
-                "hydreigon"
-            ]
-            
-            # Create player team
-            for pokemon_name in default_player_pokemon:
-                try:
-                    pokemon = Pokemon.from_data(pokemon_name)
-                    # Verify Pokémon has moves
-                    if not pokemon.moves:
-                        self.log_message(f"Error: {pokemon_name} has no moves!")
-                        return
-                    player_pokemon.append(pokemon)
-                except Exception as e:
-                    self.log_message(f"Error loading {pokemon_name}: {e}")
-                    return
+            # Teams from the input boxes
+            team_names = tuple(self.selected_team_names(side) for side in (0, 1))
+            if None in team_names:
+                return
             
-            # Create opponent team
-            for pokemon_name in default_opponent_pokemon:
-                try:
-                    pokemon = Pokemon.from_data(pokemon_name)
-                    # Verify Pokémon has moves
-                    if not pokemon.moves:
-                        self.log_message(f"Error: {pokemon_name} has no moves!")
+            # Build the team templates when the selection changes; otherwise later battles reuse the teams in place
+            if self.team_templates is None or team_names != self.team_names:
+                templates = []
+                for names in team_names:
+                    try:
+                        template = TeamTemplate.from_names(names)
+                    except Exception as e:
+                        self.log_message(f"Error loading team: {e}")
                         return
-                    opponent_pokemon.append(pokemon)
-                except Exception as e:
-                    self.log_message(f"Error loading {pokemon_name}: {e}")
-                    return
+                    # Verify every Pokémon has moves
+                    for pokemon_name, moves in zip(template.species, template.moves):
+                        if not moves:
+                            self.log_message(f"Error: {pokemon_name} has no moves!")
+                            return
+                    templates.append(template)
+                self.team_names = team_names
+                self.team_templates = tuple(templates)
+                self.team_pools = {}
+            
+            # Return the previous battle's teams to their pools and take fresh ones
+            if self.active_pools is not None:
+                self.active_pools[0].release(self.player_team)
+                self.active_pools[1].release(self.opponent_team)
+            if mode not in self.team_pools:
+                self.team_pools[mode] = tuple(TeamPool(template, mode) for template in self.team_templates)
+            player_pool, opponent_pool = self.active_pools = self.team_pools[mode]
             
             # Create teams and battle
-            self.player_team = Team(player_pokemon, mode)
-            self.opponent_team = Team(opponent_pokemon, mode)
+            self.player_team = player_pool.acquire()
+            self.opponent_team = opponent_pool.acquire()
             self.battle = Battle(self.player_team, self.opponent_team)
             
             # Switch to battle view
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+
+# Render offscreen: no window and no audio device are needed
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from PIL import Image
+
+# Get the absolute path to the project root directory
+gui_dir = os.path.dirname(os.path.abspath(__file__))  # src/gui
+project_root = os.path.dirname(os.path.dirname(gui_dir))
+sys.path.insert(0, project_root)
+sys.path.insert(0, gui_dir)
+
+from pokemon_battle import Battle, BattleMode, TeamTemplate
+from pokemon_replay import load_replay
+from pokemon_battle_gui import PokemonBattleGUI
+
+
+class ReplayRenderer:
+    """Draws the frames of a replay (see pokemon_replay) with the battle GUI's drawing code.
+
+    Between two recorded steps, HP bars count down over `frames_per_step` frames and
+    the next step's active Pokémon appear on the last of them; the final position is
+    held for `hold_frames` more. Frame i only depends on i, so any range of frames can
+    be drawn independently.
+    """
+
+    def __init__(self, replay: dict, frames_per_step: int = 6, hold_frames: int = 12, scale: float = 1.0):
+        self.replay = replay
+        self.frames_per_step = frames_per_step
+        self.hold_frames = hold_frames
+        self.steps = replay["steps"]
+        self.gui = PokemonBattleGUI(species=replay["player"]["species"] + replay["opponent"]["species"])
+        mode = BattleMode(replay["battle_mode"])
+        teams = [TeamTemplate(tuple(replay[side]["species"]), tuple(tuple(m) for m in replay[side]["moves"]),
+                              replay["level"]).instantiate(mode) for side in ("player", "opponent")]
+        self.gui.player_team, self.gui.opponent_team = teams
+        self.gui.battle = Battle(teams[0], teams[1], verbose=False)
+        self.gui.current_view = "battle"
+        # Battle log lines, and how many of them exist once each step is reached
+        self.lines = []
+        self.line_counts = []
+        for step in self.steps:
+            self.lines.extend(step["log"])
+            self.line_counts.append(len(self.lines))
+        width, height = self.gui.screen.get_size()
+        self.size = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    def __len__(self) -> int:
+        return 1 + (len(self.steps) - 1) * self.frames_per_step + self.hold_frames
+
+    def _locate(self, index: int):
+        """(step, fraction of the way to the next step) shown by frame `index`."""
+        if index == 0:
+            return 0, 0.0
+        transition, offset = divmod(index - 1, self.frames_per_step)
+        if transition >= len(self.steps) - 1:
+            return len(self.steps) - 1, 0.0
+        return transition, (offset + 1) / self.frames_per_step
+
+    def _apply(self, team, state: dict, target: dict, fraction: float):
+        for pokemon, start, end, status in zip(team.pokemon, state["hp"], target["hp"], state["status"]):
+            value = round(start + (end - start) * fraction)
+            pokemon.current_hp = float(value) if isinstance(start, float) or isinstance(end, float) else value
+            pokemon.status = status
+        team.active_pokemon_indices[:] = state["active"]
+
+    def render(self, index: int) -> Image.Image:
+        step, fraction = self._locate(index)
+        if fraction >= 1.0:
+            step, fraction = step + 1, 0.0
+        state = self.steps[step]
+        target = self.steps[step + 1] if fraction > 0 else state
+        self._apply(self.gui.player_team, state["player"], target["player"], fraction)
+        self._apply(self.gui.opponent_team, state["opponent"], target["opponent"], fraction)
+        self.gui.battle_log = self.lines[:self.line_counts[step + 1 if fraction > 0 else step]]
+        self.gui.needs_redraw = True
+        self.gui.draw_battle()
+        frame = Image.frombytes("RGB", self.gui.screen.get_size(), pygame.image.tobytes(self.gui.screen, "RGB"))
+        return frame if frame.size == self.size else frame.resize(self.size, Image.Resampling.BILINEAR)
+
+
+# Per-process renderer and output settings, set by _init_worker
+_worker = {}
+
+
+def _init_worker(replay: dict, settings: dict):
+    _worker["renderer"] = ReplayRenderer(replay, settings["frames_per_step"], settings["hold_frames"],
+                                         settings["scale"])
+    _worker["settings"] = settings
+
+
+def _encode_chunk(bounds):
+    """Render frames [start, stop): PNG files are written directly, GIF frames are returned palettized."""
+    start, stop = bounds
+    renderer, settings = _worker["renderer"], _worker["settings"]
+    palette = settings["palette"]
+    encoded = []
+    for index in range(start, stop):
+        frame = renderer.render(index)
+        if palette is None:
+            frame.save(os.path.join(settings["output"], f"frame_{index:05d}.png"), compress_level=1)
+        else:
+            encoded.append(frame.quantize(palette=palette, dither=Image.Dither.NONE).tobytes())
+    return encoded
+
+
+def _palette_image(renderer: ReplayRenderer) -> Image.Image:
+    """One 256-color palette for every GIF frame, taken from the first and last positions."""
+    first, last = renderer.render(0), renderer.render(len(renderer) - 1)
+    sample = Image.new("RGB", (first.width, first.height * 2))
+    sample.paste(first, (0, 0))
+    sample.paste(last, (0, first.height))
+    return sample.quantize(256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+
+
+def render_replay(replay: dict, output: str, workers: int = 1, fps: int = 12, frames_per_step: int = 6,
+                  hold_frames: int = 12, scale: float = 1.0, chunk_frames: int = 16) -> int:
+    """Render a replay to an animated GIF (output ending in .gif) or a directory of numbered PNG frames.
+
+    Frames are drawn and encoded in chunks of `chunk_frames` by `workers` processes,
+    each with its own offscreen GUI.
+
+    Returns:
+        The number of frames
+    """
+    settings = {"frames_per_step": frames_per_step, "hold_frames": hold_frames, "scale": scale,
+                "output": output, "palette": None}
+    as_gif = output.lower().endswith(".gif")
+    if as_gif:
+        _init_worker(replay, settings)
+        renderer = _worker["renderer"]
+        settings["palette"] = _palette_image(renderer)
+        total, size = len(renderer), renderer.size
+    else:
+        os.makedirs(output, exist_ok=True)
+        total = 1 + (len(replay["steps"]) - 1) * frames_per_step + hold_frames
+    chunks = [(start, min(start + chunk_frames, total)) for start in range(0, total, chunk_frames)]
+
+    if workers > 1:
+        # Fresh interpreters rather than forks, so each worker sets up its own SDL state. SDL
+        # turns SIGTERM into a quit event, so the pool is closed and joined, not terminated.
+        pool = mp.get_context("spawn").Pool(workers, initializer=_init_worker, initargs=(replay, settings))
+        try:
+            results = pool.map(_encode_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(replay, settings)
+        results = [_encode_chunk(chunk) for chunk in chunks]
+
+    if as_gif:
+        palette = settings["palette"].getpalette()
+        frames = []
+        for data in (data for chunk in results for data in chunk):
+            frame = Image.frombytes("P", size, data)
+            frame.putpalette(palette)
+            frames.append(frame)
+        frames[0].save(output, save_all=True, append_images=frames[1:], duration=round(1000 / fps), loop=0,
+                       optimize=False)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a recorded battle (see pokemon_replay.py) to a GIF or PNG frames "
+                                                 "without opening a window.")
+    parser.add_argument("replay", help="Replay file")
+    parser.add_argument("output", help="Output .gif file, or a directory for PNG frames")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--fps", type=int, default=12)
+    parser.add_argument("--frames-per-step", type=int, default=6, help="Frames per battle turn")
+    parser.add_argument("--hold-frames", type=int, default=12, help="Extra frames showing the final position")
+    parser.add_argument("--scale", type=float, default=1.0, help="Resize frames by this factor")
+    parser.add_argument("--chunk-frames", type=int, default=16, help="Frames per worker task")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    frames = render_replay(load_replay(args.replay), args.output, args.workers, args.fps, args.frames_per_step,
+                           args.hold_frames, args.scale, args.chunk_frames)
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {frames} frames to {args.output} in {elapsed:.1f} s ({frames / elapsed:.1f} frames/s, "
+          f"{frames / args.fps:.1f} s of video)")
+
+
+if __name__ == "__main__":
+    main()
@@ -85,6 +85,7 @@ def process_pokemon_data():
                             'accuracy': move_details.get('accuracy'),
                             'pp': move_details.get('pp'),
                             'damage_class': move_details['damage_class']['name'],
+                            'priority': move_details.get('priority'),
                             'effect': effect_info['effect'],
                             'short_effect': effect_info['short_effect']
                         }